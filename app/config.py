@@ -52,10 +52,37 @@ class Settings(BaseSettings):
     onboarding_flow_id: Optional[str] = None
     subjects_classes_flow_id: Optional[str] = None
     flow_token_encryption_key: Optional[SecretStr] = None
+    # Comma separated keys that were rotated out, tokens made with them still work
+    flow_token_previous_keys: Optional[SecretStr] = None
+    flow_token_ttl: Optional[int] = 604800  # In seconds, None to never expire
+    flow_session_cache_ttl: int = 300  # In seconds
+    flow_session_cache_size: int = 1000
+    user_cache_ttl: int = 300  # In seconds
+    user_cache_size: int = 10000
+    catalog_refresh_interval: int = 300  # In seconds
+
+    # Knowledge search: "numpy" keeps an exact in-process copy of the chunk
+    # embeddings instead of querying the HNSW index in Postgres
+    vector_index_backend: Literal["pgvector", "numpy"] = "pgvector"
+    vector_index_snapshot_path: Optional[str] = None  # Directory, for fast startup
+    vector_index_refresh_interval: int = 300  # In seconds
+    # HNSW search settings (iterative scans need pgvector 0.8+)
+    hnsw_ef_search: int = 100  # pgvector's default is 40
+    hnsw_iterative_scan: Literal["off", "relaxed_order", "strict_order"] = "off"
+    hnsw_max_scan_tuples: int = 20000
+    # "halfvec" or "binary" find candidates in a quantized index, then re-rank
+    # the best `vector_rerank_candidates` of them on the full vectors. Each
+    # mode has its own indexes, built by the migrations (see docs/en/MIGRATIONS.md)
+    vector_storage_mode: Literal["full", "halfvec", "binary"] = "full"
+    vector_rerank_candidates: int = 100
 
     whatsapp_business_public_key: Optional[SecretStr] = None
     whatsapp_business_private_key: Optional[SecretStr] = None
     whatsapp_business_private_key_password: Optional[SecretStr] = None
+    # Read the key from a file instead, so it can be rotated without a restart
+    whatsapp_business_private_key_path: Optional[str] = None
+    flow_key_reload_interval: float = 30  # In seconds
+    flow_crypto_max_workers: int = 4
 
     # Redis settings (for rate limiting)
     redis_url: Optional[SecretStr] = None
@@ -63,6 +90,35 @@ class Settings(BaseSettings):
     global_message_limit: Optional[int] = None
     time_to_live: Optional[int] = None  # In seconds (a day is 86400)
 
+    # Inbound queue settings (Redis Streams in production/staging, in-memory locally)
+    inbound_worker_concurrency: int = 10
+    inbound_queue_max_length: int = 10000
+    inbound_queue_reclaim_idle_ms: int = 60000  # Redeliver work left by dead workers
+    inbound_queue_max_deliveries: int = 5  # Then the item goes to the dead letters
+    run_inbound_workers_in_app: bool = True  # Set False when running app/worker.py
+
+    # Duplicate message detection (Meta redelivers webhooks when we are slow)
+    message_dedup_ttl: int = 86400  # In seconds
+    # Claim on a message being handled, refreshed every third of it while the
+    # handler runs. Keep below INBOUND_QUEUE_RECLAIM_IDLE_MS so the claim of a
+    # crashed worker is gone when its item is reclaimed
+    message_dedup_processing_ttl: int = 50  # In seconds
+    message_dedup_max_size: int = 10000  # Entries kept when Redis isn't used
+
+    # Per-user message buffer and lock ("redis" is needed with several workers)
+    user_mailbox_backend: Literal["memory", "redis"] = "memory"
+    user_lock_ttl_ms: int = 30000  # Renewed while the lock holder is working
+    user_mailbox_ttl_ms: int = 600000  # Buffers left behind by dead workers
+
+    # Messages are written in batches, flushed every interval or batch size
+    message_journal_flush_interval_ms: float = 50.0
+    message_journal_max_batch_size: int = 100
+
+    # LLM admission control (per process), extra requests are told to try again
+    llm_max_concurrency: int = 8  # Keep below the database pool size
+    llm_max_queue_depth: int = 50
+    llm_max_queue_wait: float = 20.0  # In seconds
+
     @field_validator("debug", mode="before")
     @classmethod
     def parse_business_env(cls, v):
@@ -109,6 +165,29 @@ class LLMSettings(BaseSettings):
     exercise_generator_model: str = llm_model_options["llama_70b"]
     embedding_model: str = embedder_model_options["bge-large"]
 
+    # Prompt token budgets per model (OpenAI-equivalent tokens, incl. the reply)
+    llm_default_context_budget: int = 8000
+    llm_context_budgets: dict = {
+        llm_model_options["llama_405b"]: 16000,
+        llm_model_options["llama_70b"]: 16000,
+        llm_model_options["llama_3_3_70b"]: 16000,
+        llm_model_options["mixtral"]: 12000,
+        llm_model_options["gpt-4o"]: 16000,
+        llm_model_options["gpt-4o_mini"]: 16000,
+    }
+    llm_response_token_reserve: int = 1024
+    llm_history_max_messages: int = 30  # Fetched, then trimmed to the budget
+
+    # Query embeddings ("stub" gives deterministic fake vectors, for tests)
+    embedding_backend: Literal["api", "stub"] = "api"
+    embedding_stub_dimensions: int = 1024
+    embedding_batch_window_ms: float = 5.0
+    embedding_max_batch_size: int = 64
+    embedding_max_concurrency: int = 4
+    embedding_cache_ttl: int = 604800  # 7 days
+    embedding_cache_max_size: int = 5000  # In-process entries (~4 KB each)
+    embedding_cache_redis_max_entries: int = 100000
+
 
 def initialize_settings():
     settings = Settings()  # type: ignore
@@ -1,8 +1,11 @@
-from typing import Dict, List, Optional
-from sqlalchemy import text
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+from sqlalchemy import cast, func, literal, literal_column, text, union_all
+from pgvector.sqlalchemy import BIT, HALFVEC, VECTOR
 from sqlmodel import and_, select, or_, delete, insert, exists, desc
 import logging
-from sqlalchemy.orm import selectinload
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import joinedload, selectinload
 
 from app.database.models import (
     User,
@@ -10,12 +13,17 @@ from app.database.models import (
     TeacherClass,
     Class,
     Chunk,
+    ChunkHit,
     Subject,
 )
 import app.database.enums as enums
 from app.database.enums import SubjectClassStatus
 from app.database.engine import get_session
-from app.utils import embedder
+from app.config import settings
+from app.services.embedding_service import embedding_client
+import app.services.vector_index_service as vector_index_service
+import app.services.user_cache_service as user_cache_service
+from app.services.message_journal_service import message_journal
 
 logger = logging.getLogger(__name__)
 
@@ -26,46 +34,59 @@ async def get_or_create_user(wa_id: str, name: Optional[str] = None) -> User:
     """
     Get existing user or create new one if they don't exist.
     Handles all database operations and error logging.
-    This uses a lot of eager loading to get the class information from the user.
+
+    The user row is upserted with INSERT ... ON CONFLICT DO UPDATE, then
+    loaded with its classes and their subjects in one joined query. The
+    update only runs to fill in a missing name, so an existing user with a
+    name costs no row write and a name changed during onboarding is kept.
+    Postgres still locks a conflicting row, until this short transaction
+    commits. Filling in the name invalidates the user's cached profile.
     """
-    # TODO: Remove eager loading if too slow
     async with get_session() as session:
         try:
-            # First try to get existing user
-            statement = select(User).where(User.wa_id == wa_id).with_for_update()
-            # First try to get existing user
+            now = datetime.now(timezone.utc)
+            upsert = pg_insert(User).values(
+                name=name,
+                wa_id=wa_id,
+                state=enums.UserState.new,
+                onboarding_state=enums.OnboardingState.new,
+                role=enums.Role.teacher,
+                created_at=now,
+                updated_at=now,
+            )
+            upsert = upsert.on_conflict_do_update(
+                index_elements=[User.wa_id],
+                set_={"name": upsert.excluded.name},
+                where=and_(
+                    User.name.is_(None),  # type: ignore
+                    upsert.excluded.name.is_not(None),
+                ),
+            ).returning(
+                # xmax is 0 for an inserted row and set for an updated one. A
+                # conflict that skipped the update returns no row
+                literal_column("xmax <> 0")
+            )
+            name_updated = bool((await session.execute(upsert)).scalar_one_or_none())
+
             statement = (
                 select(User)
                 .where(User.wa_id == wa_id)
                 .options(
-                    selectinload(User.taught_classes)  # type: ignore
-                    .selectinload(TeacherClass.class_)  # type: ignore
-                    .selectinload(Class.subject_)  # type: ignore
+                    joinedload(User.taught_classes)  # type: ignore
+                    .joinedload(TeacherClass.class_)  # type: ignore
+                    .joinedload(Class.subject_)  # type: ignore
                 )
-                .with_for_update()
             )
             result = await session.execute(statement)
-            user = result.scalar_one_or_none()
-            if user:
-                await session.refresh(user)
-                return user
-            # Create new user if they don't exist
-            new_user = User(
-                name=name,
-                wa_id=wa_id,
-                state=enums.UserState.new,
-                role=enums.Role.teacher,
-            )
-            session.add(new_user)
-            await session.flush()  # Get the ID without committing
-            await session.commit()
-            await session.refresh(new_user)
-            logger.debug(f"Created new user with wa_id: {wa_id}")
-            return new_user
+            user = result.unique().scalar_one()
         except Exception as e:
             logger.error(f"Failed to get or create user for wa_id {wa_id}: {str(e)}")
             raise Exception(f"Failed to get or create user: {str(e)}")
 
+    if name_updated:
+        await user_cache_service.user_cache.invalidate(wa_id)
+    return user
+
 
 async def get_user_by_waid(wa_id: str) -> Optional[User]:
     async with get_session() as session:
@@ -88,6 +109,7 @@ async def update_user(user: User) -> User:
             session.add(user)
             await session.commit()
             await session.refresh(user)
+            await user_cache_service.user_cache.invalidate(user.wa_id)
             logger.debug(f"Updated user {user.wa_id}: {user}")
             return user
         except Exception as e:
@@ -98,6 +120,8 @@ async def update_user(user: User) -> User:
 async def get_user_message_history(
     user_id: int, limit: int = 10
 ) -> Optional[List[Message]]:
+    # The user's latest messages may still be waiting for a batched write
+    await message_journal.flush_user(user_id)
     async with get_session() as session:
         try:
             # TODO: Make the database order this by default to reduce repeated operations
@@ -127,71 +151,222 @@ async def get_user_message_history(
 
 
 async def create_new_messages(messages: List[Message]) -> List[Message]:
-    """Optimized bulk message creation"""
-    async with get_session() as session:
-        try:
-            # Add all messages to the session
-            session.add_all(messages)
-            await session.flush()  # Get IDs without committing
-            return messages
-        except Exception as e:
-            logger.error(
-                f"Unexpected error creating messages for user {messages[0].user_id}: {str(e)}"
-            )
-            raise Exception(f"Failed to create messages: {str(e)}")
+    """
+    Queue messages for the next batched write. They get their IDs when they
+    are written.
+    """
+    for message in messages:
+        message_journal.append(message)
+    return messages
 
 
 async def create_new_message(message: Message) -> Message:
     """
-    Create a single message in the database.
+    Queue a message for the next batched write. It gets its ID when it is
+    written.
     """
-    async with get_session() as session:
-        try:
-            # Add the message to the session
-            session.add(message)
+    message_journal.append(message)
+    return message
 
-            # Commit the transaction
-            await session.commit()
 
-            # Refresh the message to get its ID and other DB-populated fields
-            await session.refresh(message)
+def _build_chunk_filters(where: dict) -> list:
+    """Decode a where dict ({column: value or list of values}) into filters on Chunk."""
+    filters = []
+    for key, value in where.items():
+        column = getattr(Chunk, key)
+        values = value if isinstance(value, list) else [value]
+        if key == "chunk_type":
+            # Rendered inline (not as bind parameters) so the planner can match
+            # the partial HNSW indexes, even with a generic prepared plan
+            values = [
+                literal(v, type_=column.type, literal_execute=True) for v in values
+            ]
+        if len(values) > 1:
+            filters.append(column.in_(values))
+        else:
+            filters.append(column == values[0])
+    return filters
+
+
+# The columns of a ChunkHit, in order (the distance is added per query)
+CHUNK_HIT_COLUMNS = (
+    Chunk.id,
+    Chunk.resource_id,
+    Chunk.chunk_type,
+    Chunk.top_level_section_index,
+    Chunk.top_level_section_title,
+    Chunk.content,
+)
 
-            return message
 
-        except Exception as e:
-            logger.error(f"Error creating message for user {message.user_id}: {str(e)}")
-            raise Exception(f"Failed to create message: {str(e)}")
+async def vector_search(query: str, n_results: int, where: dict) -> List[ChunkHit]:
+    hits = await vector_search_multi(query, [(where, n_results)])
+    return hits[0]
 
 
-async def vector_search(query: str, n_results: int, where: dict) -> List[Chunk]:
+async def vector_search_multi(
+    query: str, facets: List[Tuple[dict, int]]
+) -> List[List[ChunkHit]]:
+    """
+    Search several facets of the knowledge base for the same query, e.g. the
+    top 7 text chunks and the top 3 exercises. The query is embedded once and
+    the search is done by the configured vector index.
+
+    Args:
+        query: The search query
+        facets: (where, n_results) pairs, with where as in vector_search
+
+    Returns:
+        List[List[ChunkHit]]: The hits of each facet, nearest first
+    """
+    if not facets:
+        return []
+
     try:
-        query_vector = embedder.get_embedding(query)
+        query_vector = await embedding_client.get_embedding(query)
     except Exception as e:
         logger.error(f"Failed to get embedding for query {query}: {str(e)}")
         raise Exception(f"Failed to get embedding for query: {str(e)}")
 
-    # Decode the where dict
-    filters = []
-    for key, value in where.items():
-        if isinstance(value, list) and len(value) > 1:
-            filters.append(getattr(Chunk, key).in_(value))
-        elif isinstance(value, list) and len(value) == 1:
-            filters.append(getattr(Chunk, key) == value[0])
-        else:
-            filters.append(getattr(Chunk, key) == value)
+    try:
+        return await vector_index_service.vector_index.search(query_vector, facets)
+    except Exception as e:
+        logger.error(f"Failed to search for knowledge: {str(e)}")
+        raise Exception(f"Failed to search for knowledge: {str(e)}")
+
+
+async def search_chunks(
+    query_vector: List[float], facets: List[Tuple[dict, int]]
+) -> List[List[ChunkHit]]:
+    """
+    Answer all facets with one statement, a UNION ALL of one nearest neighbour
+    search per facet (each can use the HNSW index).
+    """
+    searches = [
+        _chunk_search(query_vector, where, n_results, i)
+        for i, (where, n_results) in enumerate(facets)
+    ]
+    statement = searches[0] if len(searches) == 1 else union_all(*searches)
 
+    async with get_session() as session:
+        await _set_hnsw_options(session)
+        result = await session.execute(statement)
+        hits: List[List[ChunkHit]] = [[] for _ in facets]
+        for *columns, facet in result.all():
+            hits[facet].append(ChunkHit(*columns))
+        for facet_hits in hits:
+            facet_hits.sort(key=lambda hit: hit.distance)
+        return hits
+
+
+def _chunk_search(query_vector: List[float], where: dict, n_results: int, facet: int):
+    """
+    The search of one facet. With a quantized storage mode, candidates come
+    from the halfvec or binary index and are re-ranked on the full vectors.
+    """
+    filters = _build_chunk_filters(where)
+    mode = settings.vector_storage_mode
+    if mode == "full":
+        distance = Chunk.embedding.cosine_distance(query_vector)
+        return (
+            select(
+                *CHUNK_HIT_COLUMNS,
+                distance.label("distance"),
+                literal(facet).label("facet"),
+            )
+            .where(*filters)
+            .order_by(distance)
+            .limit(n_results)
+        )
+
+    dimensions = Chunk.__table__.c.embedding.type.dim  # type: ignore
+    if mode == "halfvec":
+        quantized_distance = cast(Chunk.embedding, HALFVEC(dimensions)).cosine_distance(
+            query_vector
+        )
+    else:
+        quantized_query = func.binary_quantize(cast(query_vector, VECTOR(dimensions)))
+        quantized_distance = cast(
+            func.binary_quantize(Chunk.embedding), BIT(dimensions)
+        ).hamming_distance(cast(quantized_query, BIT(dimensions)))
+
+    candidates = (
+        select(*CHUNK_HIT_COLUMNS, Chunk.embedding)
+        .where(*filters)
+        .order_by(quantized_distance)
+        .limit(max(n_results, settings.vector_rerank_candidates))
+        .subquery()
+    )
+    distance = candidates.c.embedding.cosine_distance(query_vector)
+    return (
+        select(
+            *(candidates.c[column.key] for column in CHUNK_HIT_COLUMNS),
+            distance.label("distance"),
+            literal(facet).label("facet"),
+        )
+        .order_by(distance)
+        .limit(n_results)
+    )
+
+
+async def _set_hnsw_options(session) -> None:
+    """Apply the HNSW search settings to the current transaction only."""
+    ef_search = settings.hnsw_ef_search
+    if settings.vector_storage_mode != "full":
+        # A scan returns at most ef_search rows, all candidates are needed
+        ef_search = max(ef_search, settings.vector_rerank_candidates)
+    options = {"hnsw.ef_search": str(ef_search)}
+    if settings.hnsw_iterative_scan != "off":
+        # Keeps scanning the index until enough rows pass the filters (pgvector 0.8+)
+        options["hnsw.iterative_scan"] = settings.hnsw_iterative_scan
+        options["hnsw.max_scan_tuples"] = str(settings.hnsw_max_scan_tuples)
+    # One round trip for all of them
+    calls = ", ".join(
+        f"set_config(:name{i}, :value{i}, true)" for i in range(len(options))
+    )
+    params = {}
+    for i, (name, value) in enumerate(options.items()):
+        params[f"name{i}"] = name
+        params[f"value{i}"] = value
+    await session.execute(text(f"SELECT {calls}"), params)
+
+
+async def read_chunk_stats() -> Tuple[int, int]:
+    """
+    Get the number of chunks with an embedding and their highest ID, which
+    is what an in-process vector index holds.
+    """
     async with get_session() as session:
         try:
             result = await session.execute(
-                select(Chunk)
-                .where(*filters)
-                .order_by(Chunk.embedding.cosine_distance(query_vector))
-                .limit(n_results)
+                select(
+                    func.count(Chunk.id), func.coalesce(func.max(Chunk.id), 0)  # type: ignore
+                ).where(Chunk.embedding.is_not(None))
             )
-            return list(result.scalars().all())
+            count, max_id = result.one()
+            return count, max_id
         except Exception as e:
-            logger.error(f"Failed to search for knowledge: {str(e)}")
-            raise Exception(f"Failed to search for knowledge: {str(e)}")
+            logger.error(f"Failed to read chunk stats: {str(e)}")
+            raise Exception(f"Failed to read chunk stats: {str(e)}")
+
+
+async def read_chunk_vectors(after_id: int = 0) -> List[Tuple]:
+    """
+    Read the ChunkHit columns and the embedding of every chunk with an ID above
+    `after_id` and an embedding, ordered by ID. Used to build in-process
+    vector indexes.
+    """
+    async with get_session() as session:
+        try:
+            result = await session.execute(
+                select(*CHUNK_HIT_COLUMNS, Chunk.embedding)
+                .where(Chunk.id > after_id, Chunk.embedding.is_not(None))  # type: ignore
+                .order_by(Chunk.id)  # type: ignore
+            )
+            return [tuple(row) for row in result.all()]
+        except Exception as e:
+            logger.error(f"Failed to read chunk vectors: {str(e)}")
+            raise Exception(f"Failed to read chunk vectors: {str(e)}")
 
 
 async def read_subjects() -> Optional[List[Subject]]:
@@ -242,6 +417,60 @@ async def get_class_resources(class_id: int) -> Optional[List[int]]:
             raise Exception(f"Failed to get class resources: {str(e)}")
 
 
+async def read_class_resources() -> Dict[int, List[int]]:
+    """
+    Read the resource IDs of every class, as a class ID -> resource IDs mapping.
+    """
+    async with get_session() as session:
+        try:
+            query = text(
+                """
+                SELECT class_id, resource_id
+                FROM classes_resources
+                ORDER BY class_id, resource_id
+                """
+            )
+            result = await session.execute(query)
+            class_resources: Dict[int, List[int]] = {}
+            for class_id, resource_id in result.fetchall():
+                class_resources.setdefault(class_id, []).append(resource_id)
+            return class_resources
+        except Exception as e:
+            logger.error(f"Failed to read class resources: {str(e)}")
+            raise Exception(f"Failed to read class resources: {str(e)}")
+
+
+async def read_catalog_version() -> str:
+    """
+    Get a stamp that changes whenever the subjects, classes or class resources
+    change. The tables are small, so hashing their rows is cheap.
+    """
+    async with get_session() as session:
+        try:
+            query = text(
+                """
+                SELECT md5(
+                    coalesce((SELECT string_agg(id || ':' || name, ',' ORDER BY id)
+                              FROM subjects), '')
+                    || '|' ||
+                    coalesce((SELECT string_agg(
+                                  id || ':' || subject_id || ':' || grade_level
+                                  || ':' || status, ',' ORDER BY id)
+                              FROM classes), '')
+                    || '|' ||
+                    coalesce((SELECT string_agg(
+                                  class_id || ':' || resource_id, ',' ORDER BY id)
+                              FROM classes_resources), '')
+                )
+                """
+            )
+            result = await session.execute(query)
+            return result.scalar_one()
+        except Exception as e:
+            logger.error(f"Failed to read the catalog version: {str(e)}")
+            raise Exception(f"Failed to read the catalog version: {str(e)}")
+
+
 async def get_user_resources(user: User) -> Optional[List[int]]:
     """
     Get all resource IDs accessible to a user through their class assignments.
@@ -403,3 +632,6 @@ async def assign_teacher_to_classes(
                 f"Failed to assign teacher {user.wa_id} to classes {class_ids}: {str(e)}"
             )
             raise Exception(f"Failed to assign teacher to classes: {str(e)}")
+
+    # After the commit, so other workers can't reload the old classes
+    await user_cache_service.user_cache.invalidate(user.wa_id)
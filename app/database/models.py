@@ -19,6 +19,7 @@ import sqlalchemy as sa
 
 
 import app.database.enums as enums
+from app.config import settings
 
 
 class ClassInfo(BaseModel):
@@ -202,6 +203,8 @@ class Message(SQLModel, table=True):
     tool_calls: Optional[List[dict]] = Field(default=None, sa_column=Column(JSON))
     tool_call_id: Optional[str] = Field(default=None)
     tool_name: Optional[str] = Field(default=None, max_length=50)
+    # OpenAI-equivalent tokens of the message in the API format
+    token_count: Optional[int] = Field(default=None)
     created_at: Optional[datetime] = Field(
         default_factory=lambda: datetime.now(timezone.utc),
         sa_type=DateTime(timezone=True),  # type: ignore
@@ -293,16 +296,65 @@ class ClassResource(SQLModel, table=True):
     resource_: Resource = Relationship(back_populates="resource_classes")
 
 
-class Chunk(SQLModel, table=True):
-    __tablename__ = "chunks"  # type: ignore
-    __table_args__ = (
+def _chunk_embedding_indexes(mode: str) -> List[Index]:
+    """
+    The HNSW indexes that a VECTOR_STORAGE_MODE searches. Only those of the
+    configured mode are declared and built, so a quantized mode doesn't also
+    maintain the full-precision graphs on every insert.
+    """
+    hnsw: Dict[str, Any] = {
+        "postgresql_using": "hnsw",
+        "postgresql_with": {"m": 16, "ef_construction": 64},
+    }
+    # Quantized indexes for candidate generation, the results are re-ranked on
+    # the full vectors
+    if mode == "halfvec":
+        return [
+            Index(
+                "chunk_embedding_halfvec_idx",
+                sa.text("(embedding::halfvec(1024)) halfvec_cosine_ops"),
+                **hnsw,
+            )
+        ]
+    if mode == "binary":
+        return [
+            Index(
+                "chunk_embedding_binary_idx",
+                sa.text("(binary_quantize(embedding)::bit(1024)) bit_hamming_ops"),
+                **hnsw,
+            )
+        ]
+    return [
         Index(
             "chunk_embedding_idx",  # index name
             "embedding",  # column name
-            postgresql_using="hnsw",
-            postgresql_with={"m": 16, "ef_construction": 64},
             postgresql_ops={"embedding": "vector_cosine_ops"},
+            **hnsw,
+        ),
+        # Partial indexes for the chunk types we search by, so a filtered search
+        # doesn't walk a graph mostly made of other types
+        Index(
+            "chunk_embedding_text_idx",
+            "embedding",
+            postgresql_ops={"embedding": "vector_cosine_ops"},
+            postgresql_where=sa.text("chunk_type = 'text'"),
+            **hnsw,
+        ),
+        Index(
+            "chunk_embedding_exercise_idx",
+            "embedding",
+            postgresql_ops={"embedding": "vector_cosine_ops"},
+            postgresql_where=sa.text("chunk_type = 'exercise'"),
+            **hnsw,
         ),
+    ]
+
+
+class Chunk(SQLModel, table=True):
+    __tablename__ = "chunks"  # type: ignore
+    __table_args__ = (
+        *_chunk_embedding_indexes(settings.vector_storage_mode),
+        UniqueConstraint("resource_id", "content_hash", name="unique_chunk_content"),
     )
     model_config = {"arbitrary_types_allowed": True}  # type: ignore
 
@@ -313,6 +365,8 @@ class Chunk(SQLModel, table=True):
     #     foreign_key="sections.id", index=True, ondelete="CASCADE", default=None
     # )
     content: str
+    # SHA-256 of the content (see compute_content_hash), so ingestion can skip chunks it already loaded
+    content_hash: Optional[str] = Field(max_length=64, default=None)
     page_number: Optional[int] = Field(default=None)
     # TODO: Define the different types of chunks in an enum
     chunk_type: Optional[enums.ChunkType] = Field(max_length=30, default=None)
@@ -320,6 +374,7 @@ class Chunk(SQLModel, table=True):
     XXX: FILL IN THE EMBEDDING LENGTH FOR YOUR EMBEDDINGS
     - Default is set to 1024 (for bge-large vectors)
     - Replace with 1536 for text-embedding-3-small if using OpenAI's embedder
+      (also in the quantized indexes above)
     """
     embedding: Any = Field(sa_column=Column(Vector(1024)))
     top_level_section_index: Optional[str] = Field(max_length=10, default=None)
@@ -336,6 +391,47 @@ class Chunk(SQLModel, table=True):
     # section_: Optional["Section"] = Relationship(back_populates="section_chunks")
 
 
+class ChunkHit:
+    """
+    A vector search result: the columns of a chunk needed to build the context,
+    without the embedding, plus its cosine distance to the query.
+    """
+
+    __slots__ = (
+        "id",
+        "resource_id",
+        "chunk_type",
+        "top_level_section_index",
+        "top_level_section_title",
+        "content",
+        "distance",
+    )
+
+    def __init__(
+        self,
+        id: int,
+        resource_id: int,
+        chunk_type: Optional[enums.ChunkType],
+        top_level_section_index: Optional[str],
+        top_level_section_title: Optional[str],
+        content: str,
+        distance: float,
+    ):
+        self.id = id
+        self.resource_id = resource_id
+        self.chunk_type = chunk_type
+        self.top_level_section_index = top_level_section_index
+        self.top_level_section_title = top_level_section_title
+        self.content = content
+        self.distance = distance
+
+    def __repr__(self) -> str:
+        return (
+            f"ChunkHit(id={self.id}, resource_id={self.resource_id}, "
+            f"chunk_type={self.chunk_type}, distance={self.distance:.4f})"
+        )
+
+
 # class Section(SQLModel, table=True):
 #     __tablename__ = "sections"
 
@@ -1,4 +1,5 @@
 from time import time
+import hashlib
 import logging
 from urllib.parse import urlparse
 
@@ -23,3 +24,11 @@ def get_database_url() -> str:
         return f"postgresql+asyncpg://{database_uri.username}:{database_uri.password}@{database_uri.hostname}{database_uri.path}?ssl=require"
 
     return f"postgresql+asyncpg://{database_uri.username}:{database_uri.password}@{database_uri.hostname}:{database_uri.port}{database_uri.path}"
+
+
+def compute_content_hash(content: str) -> str:
+    """
+    SHA-256 of a chunk's content, as hex. Same as this SQL (used to backfill):
+    encode(sha256(convert_to(content, 'UTF8')), 'hex')
+    """
+    return hashlib.sha256(content.encode("utf-8")).hexdigest()
@@ -8,19 +8,34 @@ from fastapi import (
 from fastapi.responses import JSONResponse, PlainTextResponse
 import logging
 from contextlib import asynccontextmanager
+import orjson
 
 from app.security import signature_required
 from app.security import flows_signature_required
 from app.services.whatsapp_service import whatsapp_client
 from app.services.request_service import handle_request
+from app.services.inbound_queue_service import (
+    InboundQueueFullError,
+    InboundWorkerPool,
+    inbound_queue,
+)
 from app.database.engine import db_engine, init_db
 from app.services.flow_service import flow_client
-from app.services.rate_limit_service import rate_limit
+from app.services.flow_crypto_service import flow_crypto
+from app.services.catalog_service import catalog_client
+from app.services.vector_index_service import vector_index
+from app.services.user_cache_service import user_cache
+from app.services.message_journal_service import message_journal
 from app.redis.engine import init_redis, disconnect_redis
+from app.utils.request_utils import get_request_envelope
 from app.config import settings, Environment
 
 logger = logging.getLogger(__name__)
 
+inbound_workers = InboundWorkerPool(
+    inbound_queue, handle_request, settings.inbound_worker_concurrency
+)
+
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
@@ -34,12 +49,39 @@ async def lifespan(app: FastAPI):
             await init_redis()
             logger.info("Redis initialized successfully ✅")
 
+        # Subjects, classes and their resources are served from memory
+        await catalog_client.setup()
+
+        # Loads the chunk embeddings when the NumPy vector index is used
+        await vector_index.setup()
+
+        # Listens for user profile invalidations from the other workers
+        await user_cache.setup()
+
+        # Deserialize the flows private key once instead of on every request
+        await flow_crypto.setup()
+
+        # The in-memory queue can only be consumed from within this process
+        if settings.run_inbound_workers_in_app:
+            await inbound_workers.start()
+        else:
+            await inbound_queue.setup()
+            logger.info("Inbound workers are expected to run in app/worker.py")
+
         logger.info("Application startup completed ✅ 🦒")
         yield
     except Exception as e:
         logger.error(f"Error during startup: {e} ❌")
         raise
     finally:
+        await inbound_workers.stop()
+        flow_crypto.shutdown()
+        await catalog_client.stop()
+        await vector_index.stop()
+        await user_cache.stop()
+        # After the workers stopped, so no more messages are queued
+        await message_journal.stop()
+
         await db_engine.dispose()
         logger.info("Database connections closed 🔒")
 
@@ -63,14 +105,34 @@ async def webhook_get(request: Request) -> Response:
 async def webhook_post(request: Request) -> JSONResponse:
     logger.debug("webhook_post is being called")
 
-    # Check rate limit directly
-    if settings.environment in (Environment.PRODUCTION, Environment.STAGING):
-        rate_limit_response = await rate_limit(request)
-
-        if rate_limit_response:
-            return rate_limit_response
+    envelope = await get_request_envelope(request)
+    try:
+        # Reject malformed bodies before they reach the queue
+        _ = envelope.body
+    except orjson.JSONDecodeError:
+        logger.error("Failed to decode JSON")
+        return JSONResponse(
+            content={"status": "error", "message": "Invalid JSON provided"},
+            status_code=400,
+        )
+
+    # Acknowledge right away, the inbound workers do the actual processing
+    try:
+        await inbound_queue.put(envelope)
+    except InboundQueueFullError:
+        logger.error("Inbound queue is full, asking Meta to retry later")
+        return JSONResponse(
+            content={"status": "error", "message": "Service busy"},
+            status_code=503,
+        )
+    except Exception as e:
+        logger.error(f"Failed to enqueue the webhook request: {e}")
+        return JSONResponse(
+            content={"status": "error", "message": "Internal server error"},
+            status_code=500,
+        )
 
-    return await handle_request(request)
+    return JSONResponse(content={"status": "ok"}, status_code=200)
 
 
 @app.post("/flows", dependencies=[Depends(flows_signature_required)])
@@ -6,3 +6,29 @@ class RedisKeys:
         return f"rate:user:{phone_number}"
 
     GLOBAL_RATE = "rate:global"
+
+    @staticmethod
+    def MESSAGE_SEEN(message_id: str) -> str:
+        return f"dedup:message:{message_id}"
+
+    @staticmethod
+    def USER_LOCK(user_id: int) -> str:
+        return f"mailbox:lock:{user_id}"
+
+    @staticmethod
+    def USER_MAILBOX(user_id: int) -> str:
+        return f"mailbox:messages:{user_id}"
+
+    @staticmethod
+    def EMBEDDING_CACHE(model: str) -> str:
+        return f"embedding:{model}"
+
+    @staticmethod
+    def USER_PROFILE(wa_id: str) -> str:
+        return f"user:profile:{wa_id}"
+
+    USER_INVALIDATION = "user:invalidate"
+
+    INBOUND_STREAM = "queue:inbound"
+    INBOUND_GROUP = "inbound-workers"
+    INBOUND_DEAD_LETTERS = "queue:inbound:dead"
@@ -8,15 +8,16 @@ import hmac
 import logging
 
 from app.config import settings
+from app.utils.request_utils import get_request_envelope
 
 logger = logging.getLogger(__name__)
 
 
-def validate_signature(payload: str, signature: str) -> bool:
-    # Use the meta app secret to hash the payload
+def validate_signature(payload: bytes, signature: str) -> bool:
+    # Use the meta app secret to hash the raw payload bytes
     expected_signature = hmac.new(
         bytes(settings.meta_app_secret.get_secret_value(), "utf-8"),
-        msg=payload.encode("utf-8"),
+        msg=payload,
         digestmod=hashlib.sha256,
     ).hexdigest()
 
@@ -27,9 +28,9 @@ def validate_signature(payload: str, signature: str) -> bool:
 # Dependency to ensure that incoming requests to our webhook are valid and signed with the correct signature.
 async def signature_required(request: Request) -> None:
     signature = request.headers.get("X-Hub-Signature-256", "")[7:]  # Removing 'sha256='
-    payload = await request.body()
+    envelope = await get_request_envelope(request)
 
-    if not validate_signature(payload.decode("utf-8"), signature):
+    if not validate_signature(envelope.raw, signature):
         logger.error("Signature verification failed!")
         raise HTTPException(status_code=403, detail="Invalid signature")
 
@@ -37,9 +38,9 @@ async def signature_required(request: Request) -> None:
 # Dependency to ensure that incoming requests to our flows webhook are signed with the correct signature.
 async def flows_signature_required(request: Request) -> None:
     signature = request.headers.get("X-Hub-Signature-256", "")[7:]  # Removing 'sha256='
-    payload = await request.body()
+    envelope = await get_request_envelope(request)
 
-    if not validate_signature(payload.decode("utf-8"), signature):
+    if not validate_signature(envelope.raw, signature):
         logger.error("Business signature verification failed!")
         # NOTE : We are using a custom status code here, 432. And user will see A generic error on the client.
         raise HTTPException(status_code=432, detail="Invalid business signature")
@@ -0,0 +1,133 @@
+import asyncio
+import heapq
+import itertools
+import logging
+import time
+from collections import OrderedDict
+from typing import Dict, List, Tuple
+
+from app.config import settings
+
+
+class AdmissionRejected(Exception):
+    """Raised when an LLM conversation is shed because the service is busy."""
+
+    pass
+
+
+class Priority:
+    # Lower values are admitted first
+    RETRY = 0  # Users whose previous message was shed
+    NORMAL = 1
+
+
+class AdmissionController:
+    """
+    Bounds how many LLM conversations run at once in this process.
+
+    Conversations over the limit wait in a priority queue. When the queue is
+    full, or a conversation has waited too long, it is rejected so the user can
+    be told to try again instead of everyone getting slow answers together.
+    Users who were rejected get priority on their next message.
+
+    Only the LLM lane goes through here. Commands, settings selections and
+    flows never call the LLM, so they are not affected.
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int,
+        max_queue_depth: int,
+        max_wait: float,
+        max_tracked_users: int = 1000,
+    ):
+        self.logger = logging.getLogger(__name__)
+        self.max_concurrency = max_concurrency
+        self.max_queue_depth = max_queue_depth
+        self.max_wait = max_wait
+        self.max_tracked_users = max_tracked_users
+
+        self._active = 0
+        self._waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self._sequence = itertools.count()
+        self._shed_users: OrderedDict[int, None] = OrderedDict()
+
+        self.admitted = 0
+        self.shed = 0
+        self.total_wait = 0.0
+
+    async def acquire(self, user_id: int) -> None:
+        """Wait for an LLM slot. Raises AdmissionRejected if the user is shed."""
+        priority = Priority.NORMAL
+        if user_id in self._shed_users:
+            del self._shed_users[user_id]
+            priority = Priority.RETRY
+
+        if self._active < self.max_concurrency and not self._pending_waiters():
+            self._active += 1
+            self.admitted += 1
+            return
+
+        if self._pending_waiters() >= self.max_queue_depth:
+            self._reject(user_id, "queue is full")
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self._waiters, (priority, next(self._sequence), future))
+        start = time.perf_counter()
+        try:
+            await asyncio.wait({future}, timeout=self.max_wait)
+        except BaseException:
+            self._abandon(future)
+            raise
+
+        if not future.done():
+            future.cancel()
+            self._reject(user_id, f"waited more than {self.max_wait}s")
+
+        # The slot was handed over by release(), so _active is already counted
+        self.admitted += 1
+        self.total_wait += time.perf_counter() - start
+
+    def release(self) -> None:
+        """Free the slot, handing it to the highest priority waiter if any."""
+        while self._waiters:
+            _, _, future = heapq.heappop(self._waiters)
+            if not future.done():
+                future.set_result(None)
+                return
+        self._active -= 1
+
+    def _abandon(self, future: asyncio.Future) -> None:
+        """Give the slot back if it was granted to a waiter that went away."""
+        if future.done() and not future.cancelled():
+            self.release()
+        else:
+            future.cancel()
+
+    def _reject(self, user_id: int, reason: str) -> None:
+        self.shed += 1
+        self._shed_users[user_id] = None
+        while len(self._shed_users) > self.max_tracked_users:
+            self._shed_users.popitem(last=False)
+        self.logger.warning(f"Shedding LLM request for user {user_id}: {reason}")
+        raise AdmissionRejected(reason)
+
+    def _pending_waiters(self) -> int:
+        return sum(1 for _, _, future in self._waiters if not future.done())
+
+    @property
+    def stats(self) -> Dict[str, float]:
+        return {
+            "active": self._active,
+            "waiting": self._pending_waiters(),
+            "admitted": self.admitted,
+            "shed": self.shed,
+            "avg_wait": self.total_wait / self.admitted if self.admitted else 0.0,
+        }
+
+
+admission_controller = AdmissionController(
+    max_concurrency=settings.llm_max_concurrency,
+    max_queue_depth=settings.llm_max_queue_depth,
+    max_wait=settings.llm_max_queue_wait,
+)
@@ -0,0 +1,169 @@
+import asyncio
+import logging
+from dataclasses import dataclass
+from types import MappingProxyType
+from typing import Any, Dict, List, Mapping, Optional, Tuple
+
+import app.database.db as db
+from app.config import settings
+from app.database.enums import GradeLevel, SubjectClassStatus, SubjectName
+
+
+@dataclass(frozen=True)
+class CatalogClass:
+    id: int
+    subject_id: int
+    grade_level: GradeLevel
+    status: SubjectClassStatus
+    resource_ids: Tuple[int, ...]
+
+    @property
+    def title(self) -> str:
+        return self.grade_level.display_format
+
+
+@dataclass(frozen=True)
+class CatalogSubject:
+    id: int
+    name: SubjectName
+    classes: Tuple[CatalogClass, ...]
+
+
+@dataclass(frozen=True)
+class Catalog:
+    """
+    An immutable snapshot of the subjects, their classes and the resources of
+    each class. A refresh builds a new snapshot instead of changing this one, so
+    a request can keep using the snapshot it started with.
+    """
+
+    version: str
+    subjects: Tuple[CatalogSubject, ...]
+    subjects_by_id: Mapping[int, CatalogSubject]
+    classes_by_id: Mapping[int, CatalogClass]
+    # Keys used by the subjects and classes flow ("subject1" -> subject ID)
+    subject_keys: Mapping[str, int]
+    # Precomputed data for the subjects and classes flow, do not modify
+    subjects_classes_flow_data: Mapping[str, Any]
+
+    def get_class_resources(self, class_id: int) -> Optional[List[int]]:
+        class_ = self.classes_by_id.get(class_id)
+        if not class_ or not class_.resource_ids:
+            return None
+        return list(class_.resource_ids)
+
+    @classmethod
+    def build(
+        cls,
+        version: str,
+        subjects: List[CatalogSubject],
+    ) -> "Catalog":
+        subjects = sorted(subjects, key=lambda subject: subject.id)
+        flow_data: Dict[str, Any] = {}
+        subject_keys: Dict[str, int] = {}
+        for i, subject in enumerate(subjects, start=1):
+            subject_title = subject.name.value
+            subject_keys[f"subject{i}"] = subject.id
+            flow_data[f"subject{i}"] = {
+                "subject_id": str(subject.id),
+                "subject_title": subject_title,
+                "classes": [
+                    {"id": str(class_.id), "title": class_.title}
+                    for class_ in subject.classes
+                ],
+                "available": len(subject.classes) > 0,
+                "label": f"Classes for {subject_title}",
+            }
+            flow_data[f"subject{i}_available"] = len(subject.classes) > 0
+            flow_data[f"subject{i}_label"] = f"Classes for {subject_title}"
+
+        return cls(
+            version=version,
+            subjects=tuple(subjects),
+            subjects_by_id=MappingProxyType({s.id: s for s in subjects}),
+            classes_by_id=MappingProxyType(
+                {c.id: c for s in subjects for c in s.classes}
+            ),
+            subject_keys=MappingProxyType(subject_keys),
+            subjects_classes_flow_data=MappingProxyType(flow_data),
+        )
+
+
+class CatalogService:
+    """
+    Keeps the process-wide catalog. It is loaded at startup and reloaded when
+    the catalog version stamp in the database changes (checked every
+    `refresh_interval` seconds). The catalog changes about once a term.
+    """
+
+    def __init__(self, refresh_interval: float):
+        self.logger = logging.getLogger(__name__)
+        self.refresh_interval = refresh_interval
+        self._catalog: Optional[Catalog] = None
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    async def setup(self) -> None:
+        await self.refresh()
+        self._task = asyncio.create_task(self._refresh_loop())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def get(self) -> Catalog:
+        if self._catalog is None:
+            await self.refresh()
+        assert self._catalog is not None
+        return self._catalog
+
+    async def refresh(self) -> None:
+        """Reload the catalog if its version changed."""
+        async with self._lock:
+            version = await db.read_catalog_version()
+            if self._catalog and self._catalog.version == version:
+                return
+            self._catalog = await self._load(version)
+            self.logger.info(
+                f"Catalog loaded: {len(self._catalog.subjects)} subjects, "
+                f"{len(self._catalog.classes_by_id)} classes"
+            )
+
+    async def _load(self, version: str) -> Catalog:
+        subjects = await db.read_subjects()
+        class_resources = await db.read_class_resources()
+        return Catalog.build(
+            version,
+            [
+                CatalogSubject(
+                    id=subject.id,  # type: ignore
+                    name=subject.name,
+                    classes=tuple(
+                        CatalogClass(
+                            id=class_.id,  # type: ignore
+                            subject_id=class_.subject_id,
+                            grade_level=GradeLevel(class_.grade_level),
+                            status=SubjectClassStatus(class_.status),
+                            resource_ids=tuple(class_resources.get(class_.id, [])),  # type: ignore
+                        )
+                        for class_ in sorted(
+                            subject.subject_classes or [], key=lambda c: c.id  # type: ignore
+                        )
+                    ),
+                )
+                for subject in subjects or []
+            ],
+        )
+
+    async def _refresh_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            try:
+                await self.refresh()
+            except Exception as e:
+                self.logger.error(f"Failed to refresh the catalog: {str(e)}")
+
+
+catalog_client = CatalogService(refresh_interval=settings.catalog_refresh_interval)
@@ -0,0 +1,137 @@
+import asyncio
+import logging
+import time
+from collections import OrderedDict
+from contextlib import asynccontextmanager
+from typing import AsyncIterator, Dict
+
+from app.config import Environment, settings
+from app.redis.engine import get_redis_client
+from app.redis.redis_keys import RedisKeys
+
+
+class MessageDeduplicator:
+    """
+    Remembers the WhatsApp message IDs we have already accepted, so redeliveries
+    from Meta are dropped before any database or LLM work is done.
+
+    A message ID is first claimed as "processing" for `processing_ttl`
+    seconds, refreshed by `keep_claimed` for as long as the message is being
+    handled, however long the LLM takes. Once the message is handled,
+    `complete` keeps it for `ttl` seconds. If handling fails, `release` drops
+    the claim so a retry (from Meta or from the inbound queue) is processed
+    again, and a claim left by a crashed worker runs out on its own.
+
+    Uses Redis SET NX with a TTL in production and staging, so all workers share
+    the same view. Locally (or if Redis fails) a bounded in-memory LRU is used.
+    """
+
+    def __init__(self, ttl: int, processing_ttl: int, max_size: int):
+        self.logger = logging.getLogger(__name__)
+        self.ttl = ttl
+        self.processing_ttl = processing_ttl
+        self.max_size = max_size
+        self._seen: OrderedDict[str, float] = OrderedDict()  # message ID -> expiry
+        self.hits = 0
+        self.misses = 0
+
+    async def is_duplicate(self, message_id: str) -> bool:
+        """Claim a message ID. Returns True if it is already claimed."""
+        if self._use_redis():
+            try:
+                redis = get_redis_client()
+                claimed = await redis.set(
+                    RedisKeys.MESSAGE_SEEN(message_id),
+                    "processing",
+                    nx=True,
+                    ex=self.processing_ttl,
+                )
+                return self._record(not claimed)
+            except Exception as e:
+                self.logger.error(f"Redis error in deduplicator: {str(e)}")
+
+        return self._record(self._claim_locally(message_id))
+
+    @asynccontextmanager
+    async def keep_claimed(self, message_id: str) -> AsyncIterator[None]:
+        """Refresh the claim on a message while the block handles it."""
+        task = asyncio.create_task(self._renew(message_id))
+        try:
+            yield
+        finally:
+            task.cancel()
+            await asyncio.gather(task, return_exceptions=True)
+
+    async def complete(self, message_id: str) -> None:
+        """The message was handled, keep dropping its redeliveries for `ttl`."""
+        self._set_local(message_id, self.ttl)
+        if self._use_redis():
+            try:
+                redis = get_redis_client()
+                await redis.set(RedisKeys.MESSAGE_SEEN(message_id), "done", ex=self.ttl)
+            except Exception as e:
+                self.logger.error(f"Redis error in deduplicator: {str(e)}")
+
+    async def release(self, message_id: str) -> None:
+        """Handling the message failed, let the next delivery process it."""
+        self._seen.pop(message_id, None)
+        if self._use_redis():
+            try:
+                redis = get_redis_client()
+                await redis.delete(RedisKeys.MESSAGE_SEEN(message_id))
+            except Exception as e:
+                self.logger.error(f"Redis error in deduplicator: {str(e)}")
+
+    async def _renew(self, message_id: str) -> None:
+        while True:
+            await asyncio.sleep(self.processing_ttl / 3)
+            self._set_local(message_id, self.processing_ttl)
+            if self._use_redis():
+                try:
+                    redis = get_redis_client()
+                    await redis.expire(
+                        RedisKeys.MESSAGE_SEEN(message_id), self.processing_ttl
+                    )
+                except Exception as e:
+                    self.logger.error(f"Redis error in deduplicator: {str(e)}")
+
+    def _claim_locally(self, message_id: str) -> bool:
+        expiry = self._seen.get(message_id)
+        if expiry is not None and expiry > time.monotonic():
+            self._seen.move_to_end(message_id)
+            return True
+        self._set_local(message_id, self.processing_ttl)
+        return False
+
+    def _set_local(self, message_id: str, ttl: int) -> None:
+        self._seen[message_id] = time.monotonic() + ttl
+        self._seen.move_to_end(message_id)
+        while len(self._seen) > self.max_size:
+            self._seen.popitem(last=False)
+
+    def _record(self, duplicate: bool) -> bool:
+        if duplicate:
+            self.hits += 1
+        else:
+            self.misses += 1
+        return duplicate
+
+    @property
+    def stats(self) -> Dict[str, float]:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / total if total else 0.0,
+        }
+
+    @staticmethod
+    def _use_redis() -> bool:
+        return settings.environment in (Environment.PRODUCTION, Environment.STAGING)
+
+
+dedup_client = MessageDeduplicator(
+    ttl=settings.message_dedup_ttl,
+    processing_ttl=settings.message_dedup_processing_ttl,
+    max_size=settings.message_dedup_max_size,
+)
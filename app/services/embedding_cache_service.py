@@ -0,0 +1,125 @@
+import hashlib
+import logging
+import time
+import unicodedata
+from array import array
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+
+from app.config import Environment, llm_settings, settings
+from app.redis.engine import get_redis_client
+from app.redis.redis_keys import RedisKeys
+
+
+def normalize_query(text: str) -> str:
+    """NFKC, case folded and with collapsed whitespace, so trivial variants of a question share an entry."""
+    return " ".join(unicodedata.normalize("NFKC", text).casefold().split())
+
+
+def pack_embedding(embedding: List[float]) -> bytes:
+    return array("f", embedding).tobytes()
+
+
+def unpack_embedding(data: bytes) -> List[float]:
+    embedding = array("f")
+    embedding.frombytes(data)
+    return embedding.tolist()
+
+
+class EmbeddingCache:
+    """
+    Two-tier cache of query embeddings, keyed by the embedding model and the
+    normalized query. Vectors are stored as packed float32 bytes.
+
+    The first tier is a bounded in-process LRU. In production and staging the
+    second tier is a Redis hash per model, shared by all workers. Redis can't
+    expire single hash fields, so the whole hash expires `ttl` seconds after
+    its first entry was written, and no entries are added once it holds
+    `redis_max_entries`.
+    """
+
+    def __init__(self, ttl: int, max_size: int, redis_max_entries: int):
+        self.logger = logging.getLogger(__name__)
+        self.ttl = ttl
+        self.max_size = max_size
+        self.redis_max_entries = redis_max_entries
+        # (model, normalized query) -> (expiry, packed embedding)
+        self._local: OrderedDict[Tuple[str, str], Tuple[float, bytes]] = OrderedDict()
+        self.local_hits = 0
+        self.redis_hits = 0
+        self.misses = 0
+
+    async def get(self, model: str, query: str) -> Optional[List[float]]:
+        """Get the embedding of a normalized query, if it is cached."""
+        key = (model, query)
+        cached = self._local.get(key)
+        if cached and cached[0] > time.monotonic():
+            self._local.move_to_end(key)
+            self.local_hits += 1
+            return unpack_embedding(cached[1])
+
+        if self._use_redis():
+            try:
+                redis = get_redis_client()
+                data = await redis.hget(
+                    RedisKeys.EMBEDDING_CACHE(model), self._field(query)
+                )
+                if data is not None:
+                    self._set_local(key, data)
+                    self.redis_hits += 1
+                    return unpack_embedding(data)
+            except Exception as e:
+                self.logger.error(f"Redis error in embedding cache: {str(e)}")
+
+        self.misses += 1
+        return None
+
+    async def set(self, model: str, query: str, embedding: List[float]) -> None:
+        data = pack_embedding(embedding)
+        self._set_local((model, query), data)
+
+        if self._use_redis():
+            try:
+                redis = get_redis_client()
+                key = RedisKeys.EMBEDDING_CACHE(model)
+                if await redis.hlen(key) >= self.redis_max_entries:
+                    return
+                async with redis.pipeline(transaction=False) as pipe:
+                    pipe.hset(key, self._field(query), data)
+                    pipe.expire(key, self.ttl, nx=True)
+                    await pipe.execute()
+            except Exception as e:
+                self.logger.error(f"Redis error in embedding cache: {str(e)}")
+
+    @property
+    def stats(self) -> Dict[str, float]:
+        lookups = self.local_hits + self.redis_hits + self.misses
+        return {
+            "local_hits": self.local_hits,
+            "redis_hits": self.redis_hits,
+            "misses": self.misses,
+            "hit_rate": (lookups - self.misses) / lookups if lookups else 0,
+            "local_size": len(self._local),
+        }
+
+    def _set_local(self, key: Tuple[str, str], data: bytes) -> None:
+        self._local[key] = (time.monotonic() + self.ttl, data)
+        self._local.move_to_end(key)
+        while len(self._local) > self.max_size:
+            self._local.popitem(last=False)
+
+    @staticmethod
+    def _field(query: str) -> str:
+        # Bounded field size, however long the question is
+        return hashlib.sha256(query.encode()).hexdigest()
+
+    @staticmethod
+    def _use_redis() -> bool:
+        return settings.environment in (Environment.PRODUCTION, Environment.STAGING)
+
+
+embedding_cache = EmbeddingCache(
+    ttl=llm_settings.embedding_cache_ttl,
+    max_size=llm_settings.embedding_cache_max_size,
+    redis_max_entries=llm_settings.embedding_cache_redis_max_entries,
+)
@@ -0,0 +1,205 @@
+import asyncio
+import hashlib
+import logging
+import math
+import random
+from abc import ABC, abstractmethod
+from typing import Dict, List, Optional, Tuple
+
+import backoff
+import openai
+
+from app.config import llm_settings
+from app.services.embedding_cache_service import (
+    EmbeddingCache,
+    embedding_cache,
+    normalize_query,
+)
+
+
+class EmbeddingBackend(ABC):
+    """Turns a batch of texts into embeddings, in the same order."""
+
+    @abstractmethod
+    async def embed(self, texts: List[str]) -> List[List[float]]: ...
+
+
+class APIEmbeddingBackend(EmbeddingBackend):
+    """Embeddings from the OpenAI or Together API (OpenAI compatible)."""
+
+    def __init__(self, client: openai.AsyncOpenAI, model: str):
+        self.client = client
+        self.model = model
+
+    @backoff.on_exception(backoff.expo, openai.RateLimitError, max_tries=5, max_time=30)
+    async def embed(self, texts: List[str]) -> List[List[float]]:
+        response = await self.client.embeddings.create(model=self.model, input=texts)
+        assert response.data
+        # The API may return the embeddings out of order
+        data = sorted(response.data, key=lambda d: d.index)
+        embeddings = []
+        for i, embedding_data in enumerate(data):
+            if embedding_data.embedding is None:
+                raise ValueError(f"Failed to generate embedding for text at index {i}")
+            embeddings.append(embedding_data.embedding)
+        return embeddings
+
+
+class StubEmbeddingBackend(EmbeddingBackend):
+    """
+    Deterministic unit vectors derived from a hash of the text, for tests and
+    load tests. The same text always gets the same vector, different texts get
+    unrelated ones.
+    """
+
+    def __init__(self, dimensions: int, latency: float = 0.0):
+        self.dimensions = dimensions
+        self.latency = latency
+        self.calls = 0
+
+    async def embed(self, texts: List[str]) -> List[List[float]]:
+        self.calls += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        return [self._vector(text) for text in texts]
+
+    def _vector(self, text: str) -> List[float]:
+        seed = int.from_bytes(hashlib.sha256(text.encode()).digest()[:8], "big")
+        rng = random.Random(seed)
+        vector = [rng.gauss(0.0, 1.0) for _ in range(self.dimensions)]
+        norm = math.sqrt(sum(x * x for x in vector))
+        return [x / norm for x in vector]
+
+
+class AsyncEmbedder:
+    """
+    Embeds texts without blocking the event loop. Calls that arrive within
+    `batch_window` seconds of each other (e.g. knowledge searches from
+    different users) are sent to the backend as one batched request, and at
+    most `max_concurrency` requests are in flight at a time.
+
+    With a cache, embeddings are looked up in and stored to the cache under
+    the normalized text. The text itself is embedded as given, so the cache
+    doesn't change the vectors the model returns.
+    """
+
+    def __init__(
+        self,
+        backend: EmbeddingBackend,
+        batch_window: float,
+        max_batch_size: int,
+        max_concurrency: int,
+        model: str,
+        cache: Optional[EmbeddingCache] = None,
+    ):
+        self.logger = logging.getLogger(__name__)
+        self.backend = backend
+        self.batch_window = batch_window
+        self.max_batch_size = max_batch_size
+        self.model = model
+        self.cache = cache
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._pending: List[Tuple[str, asyncio.Future]] = []
+        self._flush_handle: Optional[asyncio.TimerHandle] = None
+        self._tasks: set[asyncio.Task] = set()
+        self.requests = 0
+        self.batches = 0
+
+    async def get_embedding(self, text: str) -> List[float]:
+        if self.cache is None:
+            return await self._embed(text)
+
+        query = normalize_query(text)
+        embedding = await self.cache.get(self.model, query)
+        if embedding is None:
+            embedding = await self._embed(text)
+            await self.cache.set(self.model, query, embedding)
+        return embedding
+
+    async def get_embeddings(self, texts: List[str]) -> List[List[float]]:
+        return list(await asyncio.gather(*(self.get_embedding(t) for t in texts)))
+
+    async def _embed(self, text: str) -> List[float]:
+        future = asyncio.get_running_loop().create_future()
+        self._pending.append((text, future))
+        self.requests += 1
+
+        if len(self._pending) >= self.max_batch_size:
+            self._flush()
+        elif self._flush_handle is None:
+            self._flush_handle = asyncio.get_running_loop().call_later(
+                self.batch_window, self._flush
+            )
+        return await future
+
+    @property
+    def stats(self) -> Dict[str, float]:
+        return {
+            "requests": self.requests,
+            "batches": self.batches,
+            "pending": len(self._pending),
+            "average_batch_size": self.requests / self.batches if self.batches else 0,
+        }
+
+    def _flush(self) -> None:
+        if self._flush_handle is not None:
+            self._flush_handle.cancel()
+            self._flush_handle = None
+
+        batch, self._pending = self._pending, []
+        if not batch:
+            return
+        task = asyncio.create_task(self._embed_batch(batch))
+        self._tasks.add(task)  # Keep a reference until the task is done
+        task.add_done_callback(self._tasks.discard)
+
+    async def _embed_batch(self, batch: List[Tuple[str, asyncio.Future]]) -> None:
+        # The same text is only embedded once per batch
+        texts = list(dict.fromkeys(text for text, _ in batch))
+        try:
+            async with self._semaphore:
+                self.batches += 1
+                embeddings = await self.backend.embed(texts)
+            if len(embeddings) != len(texts):
+                raise ValueError(
+                    f"Expected {len(texts)} embeddings, got {len(embeddings)}"
+                )
+        except Exception as e:
+            self.logger.error(
+                f"Failed to embed a batch of {len(texts)} texts: {str(e)}"
+            )
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+
+        by_text = dict(zip(texts, embeddings))
+        for text, future in batch:
+            if not future.done():  # The caller may have been cancelled
+                future.set_result(by_text[text])
+
+
+def create_embedding_backend() -> EmbeddingBackend:
+    if llm_settings.embedding_backend == "stub":
+        return StubEmbeddingBackend(dimensions=llm_settings.embedding_stub_dimensions)
+
+    api_key = (
+        llm_settings.llm_api_key.get_secret_value() if llm_settings.llm_api_key else ""
+    )
+    if llm_settings.ai_provider == "together":
+        client = openai.AsyncOpenAI(
+            base_url="https://api.together.xyz/v1", api_key=api_key
+        )
+    else:
+        client = openai.AsyncOpenAI(api_key=api_key)
+    return APIEmbeddingBackend(client, llm_settings.embedding_model)
+
+
+embedding_client = AsyncEmbedder(
+    backend=create_embedding_backend(),
+    batch_window=llm_settings.embedding_batch_window_ms / 1000,
+    max_batch_size=llm_settings.embedding_max_batch_size,
+    max_concurrency=llm_settings.embedding_max_concurrency,
+    model=llm_settings.embedding_model,
+    cache=embedding_cache,
+)
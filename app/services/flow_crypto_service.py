@@ -0,0 +1,119 @@
+import asyncio
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Optional, Tuple
+
+from cryptography.hazmat.primitives.asymmetric import rsa
+
+from app.config import settings
+import app.utils.flow_utils as futil
+
+
+class FlowCrypto:
+    """
+    Decrypts flow requests and encrypts flow responses.
+
+    The business private key is deserialized once and cached. RSA and AES-GCM
+    work runs in a small thread pool so it never blocks the event loop. When the
+    key is read from a file, the file is checked for changes every
+    `reload_interval` seconds and a rotated key is picked up without a restart.
+    The previous key is kept as a fallback while clients still use the old one.
+    """
+
+    def __init__(self, max_workers: int, reload_interval: float):
+        self.logger = logging.getLogger(__name__)
+        self.reload_interval = reload_interval
+        self._executor = ThreadPoolExecutor(
+            max_workers=max_workers, thread_name_prefix="flow-crypto"
+        )
+        self._private_key: Optional[rsa.RSAPrivateKey] = None
+        self._previous_key: Optional[rsa.RSAPrivateKey] = None
+        self._key_mtime: Optional[float] = None
+        self._last_check = 0.0
+        self._lock = asyncio.Lock()
+
+    @staticmethod
+    def is_configured() -> bool:
+        return bool(
+            settings.whatsapp_business_private_key_password
+            and (
+                settings.whatsapp_business_private_key
+                or settings.whatsapp_business_private_key_path
+            )
+        )
+
+    async def setup(self) -> None:
+        """Load the private key at startup, if flows are configured."""
+        if not self.is_configured():
+            self.logger.debug("No business private key configured, skipping")
+            return
+        await self._load_key()
+
+    async def decrypt_request(self, body: dict) -> Tuple[dict, bytes, str]:
+        """Returns the decrypted payload, the AES key and the initial vector."""
+        private_keys = await self._get_keys()
+        return await self._run(futil.decrypt_flow_request, body, private_keys)
+
+    async def encrypt_response(self, response: dict, aes_key: bytes, iv: str) -> str:
+        return await self._run(futil.encrypt_response, response, aes_key, iv)
+
+    def shutdown(self) -> None:
+        self._executor.shutdown(wait=False, cancel_futures=True)
+
+    async def _run(self, fn, *args):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, fn, *args)
+
+    async def _get_keys(self) -> List[rsa.RSAPrivateKey]:
+        if self._private_key is None:
+            await self._load_key()
+        elif self._key_changed():
+            self.logger.info("Business private key changed, reloading")
+            await self._load_key()
+
+        assert self._private_key is not None
+        if self._previous_key is not None:
+            return [self._private_key, self._previous_key]
+        return [self._private_key]
+
+    def _key_changed(self) -> bool:
+        path = settings.whatsapp_business_private_key_path
+        now = time.monotonic()
+        if not path or now - self._last_check < self.reload_interval:
+            return False
+        self._last_check = now
+        try:
+            return os.stat(path).st_mtime != self._key_mtime
+        except OSError as e:
+            self.logger.error(f"Failed to check the business private key: {e}")
+            return False
+
+    async def _load_key(self) -> None:
+        async with self._lock:
+            path = settings.whatsapp_business_private_key_path
+            mtime = os.stat(path).st_mtime if path else None
+            if self._private_key is not None and mtime == self._key_mtime:
+                return  # Another request reloaded it while we waited
+
+            try:
+                private_key = await self._run(futil.load_business_private_key)
+            except Exception as e:
+                if self._private_key is None:
+                    raise
+                # Keep serving with the current key if the new one is unreadable
+                self.logger.error(f"Failed to reload the business private key: {e}")
+                return
+
+            self._previous_key = self._private_key
+            self._private_key = private_key
+            self._key_mtime = mtime
+            self._last_check = time.monotonic()
+            self.logger.debug("Business private key loaded")
+
+
+flow_crypto = FlowCrypto(
+    max_workers=settings.flow_crypto_max_workers,
+    reload_interval=settings.flow_key_reload_interval,
+)
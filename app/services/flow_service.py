@@ -1,19 +1,22 @@
 from datetime import datetime
-from typing import Dict, List, Optional, Callable
+from typing import Dict, List, Callable
 from dateutil.relativedelta import relativedelta
 import logging
 from fastapi import BackgroundTasks, Request
 from fastapi.responses import PlainTextResponse, JSONResponse
 
 import app.utils.flow_utils as futil
+from app.services.flow_crypto_service import flow_crypto
+from app.services.flow_session_service import flow_sessions
+from app.services.catalog_service import catalog_client
 import app.database.db as db
 from app.database.models import ClassInfo, User
 from app.services.whatsapp_service import whatsapp_client
 from app.config import settings, Environment
 from app.utils.string_manager import StringCategory, strings
+from app.utils.request_utils import get_request_envelope
 import app.database.enums as enums
 import scripts.flows.designing_flows as flows_wip
-import app.database.models as models
 
 
 class FlowService:
@@ -49,8 +52,9 @@ class FlowService:
         self, request: Request, bg_tasks: BackgroundTasks
     ) -> PlainTextResponse:
         try:
-            body = await request.json()
-            payload, aes_key, initial_vector = await futil.decrypt_flow_request(body)
+            envelope = await get_request_envelope(request)
+            body = envelope.body
+            payload, aes_key, initial_vector = await flow_crypto.decrypt_request(body)
             action = payload.get("action")
             flow_token = payload.get("flow_token")
 
@@ -66,13 +70,9 @@ class FlowService:
                     status_code=422,
                 )
 
-            # Get the user and flow ID
-            wa_id, flow_id = futil.decrypt_flow_token(flow_token)
-            user = await db.get_user_by_waid(wa_id)
-
-            if not user:
-                self.logger.error(f"User not found for WA ID: {wa_id}")
-                raise ValueError("User not found")
+            # Get the user and flow ID (cached across the screens of a flow)
+            session = await flow_sessions.get(flow_token)
+            user, flow_id = session.user, session.flow_id
 
             if action == "data_exchange":
                 handler = flow_client.data_exchange_action_handlers.get(
@@ -119,7 +119,7 @@ class FlowService:
             f"Processing response: {response_payload} , AES Key: {aes_key} , IV: {initial_vector}"
         )
         try:
-            encrypted_response = futil.encrypt_response(
+            encrypted_response = await flow_crypto.encrypt_response(
                 response_payload, aes_key, initial_vector
             )
             return PlainTextResponse(content=encrypted_response, status_code=200)
@@ -192,16 +192,9 @@ class FlowService:
 
             self.logger.info(f"Handling subjects and classes data exchange: {data}")
 
-            # Get subjects with their classes
-            subjects_with_classes = await db.read_subjects()
-
-            self.logger.info(f"Subjects with classes: {subjects_with_classes}")
-
-            # Create a mapping of subject keys to subject IDs
-            subject_key_to_id = {
-                f"subject{i+1}": subject.id
-                for i, subject in enumerate(subjects_with_classes or [])
-            }
+            # Map the subject keys used in the flow to subject IDs
+            catalog = await catalog_client.get()
+            subject_key_to_id = catalog.subject_keys
 
             # Extract selected classes for each subject
             selected_classes_by_subject = {
@@ -279,13 +272,18 @@ class FlowService:
 
             await db.assign_teacher_to_classes(user, all_class_ids)
 
+            catalog = await catalog_client.get()
             updated_subjects = {}
             for subject_key, class_ids in selected_classes_by_subject.items():
                 subject_id = int(subject_key.replace("subject", ""))
-                subject: Optional[models.Subject] = await db.read_subject(subject_id)
-                classes = await db.read_classes(class_ids)
+                subject = catalog.subjects_by_id.get(subject_id)
+                classes = [
+                    catalog.classes_by_id[class_id]
+                    for class_id in class_ids
+                    if class_id in catalog.classes_by_id
+                ]
 
-                if not subject or not classes or len(classes) == 0:
+                if not subject or len(classes) == 0:
                     raise ValueError("Subject or classes not found")
 
                 updated_subjects[subject.name] = [cls.grade_level for cls in classes]
@@ -390,27 +388,9 @@ class FlowService:
 
     async def send_subjects_classes_flow(self, user: User) -> None:
         try:
-            # Fetch available subjects with their classes from the database
-            subjects = await db.read_subjects()
-            self.logger.debug(f"Available subjects with classes: {subjects}")
-
-            subjects_data = {}
-            for i, subject in enumerate(subjects or [], start=1):
-                subject_id = subject.id
-                subject_title = subject.name.value
-                classes = subject.subject_classes
-                subjects_data[f"subject{i}"] = {
-                    "subject_id": str(subject_id),
-                    "subject_title": subject_title,
-                    "classes": [
-                        {"id": str(cls.id), "title": cls.grade_level.display_format}
-                        for cls in classes or []
-                    ],
-                    "available": len(classes or []) > 0,
-                    "label": f"Classes for {subject_title}",
-                }
-                subjects_data[f"subject{i}_available"] = len(classes or []) > 0
-                subjects_data[f"subject{i}_label"] = f"Classes for {subject_title}"
+            # The subjects and classes payload is precomputed in the catalog
+            catalog = await catalog_client.get()
+            subjects_data = catalog.subjects_classes_flow_data
 
             # Prepare the response payload
             response_payload = futil.create_flow_response_payload(
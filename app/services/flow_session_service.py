@@ -0,0 +1,107 @@
+import copy
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Dict, Optional
+
+from sqlalchemy.orm import make_transient_to_detached
+
+import app.database.db as db
+from app.config import settings
+from app.database.models import User
+import app.utils.flow_utils as futil
+
+
+@dataclass(frozen=True)
+class FlowSession:
+    wa_id: str
+    flow_id: str
+    user: User
+
+
+@dataclass(frozen=True)
+class _CachedSession:
+    wa_id: str
+    flow_id: str
+    # Column values of the user, never handed out directly
+    user_fields: Dict[str, Any]
+    # time.monotonic() deadline of the entry
+    cached_until: float
+    # Unix time at which the flow token expires, None if it never does
+    token_expires_at: Optional[float]
+
+
+class FlowSessionCache:
+    """
+    Short-lived cache from a flow token to the decrypted token details and the
+    user, so the screens of a multi-screen flow don't each pay for a token
+    decryption and a user lookup.
+
+    The flow handlers modify and save the user they get, so each `get` returns
+    its own detached User built from the cached column values, like one freshly
+    loaded from the database. Entries for a user must be dropped with
+    `invalidate_user` whenever that user is updated, which the user cache does
+    when it is invalidated.
+    """
+
+    def __init__(self, ttl: float, max_size: int):
+        self.logger = logging.getLogger(__name__)
+        self.ttl = ttl
+        self.max_size = max_size
+        self._sessions: OrderedDict[str, _CachedSession] = OrderedDict()
+
+    async def get(self, flow_token: str) -> FlowSession:
+        """
+        Raises FlowTokenError for invalid or expired tokens and ValueError if
+        the user doesn't exist.
+        """
+        cached = self._sessions.get(flow_token)
+        if cached and cached.cached_until > time.monotonic():
+            if (
+                cached.token_expires_at is not None
+                and cached.token_expires_at <= time.time()
+            ):
+                del self._sessions[flow_token]
+                raise futil.FlowTokenError("Token expired")
+            self._sessions.move_to_end(flow_token)
+            return FlowSession(
+                wa_id=cached.wa_id,
+                flow_id=cached.flow_id,
+                user=_build_user(cached.user_fields),
+            )
+
+        wa_id, flow_id = futil.decrypt_flow_token(flow_token)
+        user = await db.get_user_by_waid(wa_id)
+        if not user:
+            self.logger.error(f"User not found for WA ID: {wa_id}")
+            raise ValueError("User not found")
+
+        self._sessions[flow_token] = _CachedSession(
+            wa_id=wa_id,
+            flow_id=flow_id,
+            user_fields=copy.deepcopy(user.model_dump()),
+            cached_until=time.monotonic() + self.ttl,
+            token_expires_at=futil.get_flow_token_expiry(flow_token),
+        )
+        self._sessions.move_to_end(flow_token)
+        while len(self._sessions) > self.max_size:
+            self._sessions.popitem(last=False)
+        return FlowSession(wa_id=wa_id, flow_id=flow_id, user=user)
+
+    def invalidate_user(self, wa_id: str) -> None:
+        stale = [t for t, s in self._sessions.items() if s.wa_id == wa_id]
+        for flow_token in stale:
+            del self._sessions[flow_token]
+
+
+def _build_user(fields: Dict[str, Any]) -> User:
+    """A detached copy of a persisted user, which db.update_user can save."""
+    user = User(**copy.deepcopy(fields))
+    make_transient_to_detached(user)
+    return user
+
+
+flow_sessions = FlowSessionCache(
+    ttl=settings.flow_session_cache_ttl, max_size=settings.flow_session_cache_size
+)
@@ -0,0 +1,362 @@
+"""
+Inbound work queue for the webhooks endpoint.
+
+The webhook only verifies and enqueues the request body, and a pool of workers
+runs the request handling (user lookup, state handling, LLM calls) afterwards.
+Redis Streams are used in production/staging so queued work survives restarts
+and can be shared by several worker processes. Locally an in-process asyncio
+queue is used instead.
+"""
+
+import asyncio
+import logging
+import os
+import socket
+import time
+from abc import ABC, abstractmethod
+from typing import Awaitable, Callable, List, Optional
+
+from redis.exceptions import ResponseError
+
+from app.config import Environment, settings
+from app.redis.engine import get_redis_client
+from app.redis.redis_keys import RedisKeys
+from app.utils.request_utils import RequestEnvelope
+
+logger = logging.getLogger(__name__)
+
+
+class InboundQueueFullError(Exception):
+    """Raised when the inbound queue cannot accept more work."""
+
+    pass
+
+
+class InboundItem:
+    """
+    A unit of queued work: the queue specific id, the webhook request and how
+    many times it was handed to a worker.
+    """
+
+    __slots__ = ("id", "envelope", "deliveries")
+
+    def __init__(self, id: str, envelope: RequestEnvelope, deliveries: int = 1):
+        self.id = id
+        self.envelope = envelope
+        self.deliveries = deliveries
+
+
+class InboundQueue(ABC):
+    @abstractmethod
+    async def setup(self) -> None:
+        """Prepare the queue before workers start consuming from it."""
+
+    @abstractmethod
+    async def put(self, envelope: RequestEnvelope) -> None:
+        """Enqueue a webhook request. Raises InboundQueueFullError when full."""
+
+    @abstractmethod
+    async def get(self, consumer: str) -> Optional[InboundItem]:
+        """Wait (for a short while) for the next item. Returns None on timeout."""
+
+    @abstractmethod
+    async def ack(self, item: InboundItem) -> None:
+        """Mark an item as processed."""
+
+    @abstractmethod
+    async def nack(self, item: InboundItem) -> None:
+        """
+        Report that processing an item failed. It is delivered again, up to
+        `max_deliveries` times, then dead-lettered.
+        """
+
+    async def reclaim(self, consumer: str) -> List[InboundItem]:
+        """Take over items that were left unprocessed by a crashed consumer."""
+        return []
+
+
+class InMemoryInboundQueue(InboundQueue):
+    """Local stand-in for the Redis stream. Work is lost if the process dies."""
+
+    def __init__(self, max_length: int, max_deliveries: int):
+        self._queue: asyncio.Queue[InboundItem] = asyncio.Queue(maxsize=max_length)
+        self.max_deliveries = max_deliveries
+        self._counter = 0
+
+    async def setup(self) -> None:
+        pass
+
+    async def put(self, envelope: RequestEnvelope) -> None:
+        self._counter += 1
+        try:
+            # The workers reuse the body and request type parsed by the webhook
+            self._queue.put_nowait(InboundItem(str(self._counter), envelope))
+        except asyncio.QueueFull:
+            raise InboundQueueFullError("Inbound queue is full")
+
+    async def get(self, consumer: str) -> Optional[InboundItem]:
+        try:
+            return await asyncio.wait_for(self._queue.get(), timeout=1)
+        except asyncio.TimeoutError:
+            return None
+
+    async def ack(self, item: InboundItem) -> None:
+        self._queue.task_done()
+
+    async def nack(self, item: InboundItem) -> None:
+        self._queue.task_done()
+        if item.deliveries >= self.max_deliveries:
+            logger.error(
+                f"Dropping inbound item {item.id} after {item.deliveries} failed deliveries"
+            )
+            return
+        try:
+            self._queue.put_nowait(
+                InboundItem(item.id, item.envelope, item.deliveries + 1)
+            )
+        except asyncio.QueueFull:
+            logger.error(f"Dropping inbound item {item.id}, the queue is full")
+
+
+# KEYS[1] = stream, ARGV[1] = max length, ARGV[2...] = entry fields and values
+_PUT_SCRIPT = """
+if redis.call('XLEN', KEYS[1]) >= tonumber(ARGV[1]) then
+    return false
+end
+return redis.call('XADD', KEYS[1], '*', unpack(ARGV, 2))
+"""
+
+
+class RedisStreamInboundQueue(InboundQueue):
+    """
+    Durable queue backed by a Redis stream and a consumer group.
+
+    Entries are deleted from the stream once they are acked, so the stream
+    only holds unread and pending work and its length is the backlog. Failed
+    entries stay pending and are redelivered by `reclaim` once idle for
+    `reclaim_idle_ms`. After `max_deliveries` they are moved to a dead letter
+    stream.
+    """
+
+    def __init__(self, max_length: int, reclaim_idle_ms: int, max_deliveries: int):
+        self.stream = RedisKeys.INBOUND_STREAM
+        self.group = RedisKeys.INBOUND_GROUP
+        self.dead_letters = RedisKeys.INBOUND_DEAD_LETTERS
+        self.max_length = max_length
+        self.reclaim_idle_ms = reclaim_idle_ms
+        self.max_deliveries = max_deliveries
+
+    async def setup(self) -> None:
+        redis = get_redis_client()
+        try:
+            await redis.xgroup_create(self.stream, self.group, id="0", mkstream=True)
+            logger.debug(f"Created consumer group {self.group} on {self.stream}")
+        except ResponseError as e:
+            # The group survives restarts, which is the whole point
+            if "BUSYGROUP" not in str(e):
+                raise
+
+    async def put(self, envelope: RequestEnvelope) -> None:
+        # Never trim the stream, that would silently drop unprocessed work. The
+        # length check and the XADD run in one script, so concurrent webhooks
+        # can't push the stream past max_length.
+        # Store the raw bytes as received, there is no need to serialize again
+        entry_id = await get_redis_client().eval(
+            _PUT_SCRIPT,
+            1,
+            self.stream,
+            self.max_length,
+            "body",
+            envelope.raw,
+            "received_at",
+            repr(envelope.received_at),
+        )
+        if entry_id is None:
+            raise InboundQueueFullError("Inbound queue is full")
+
+    async def get(self, consumer: str) -> Optional[InboundItem]:
+        redis = get_redis_client()
+        response = await redis.xreadgroup(
+            self.group, consumer, {self.stream: ">"}, count=1, block=1000
+        )
+        if not response:
+            return None
+        _, entries = response[0]
+        return self._to_items(entries)[0] if entries else None
+
+    async def ack(self, item: InboundItem) -> None:
+        redis = get_redis_client()
+        async with redis.pipeline(transaction=True) as pipe:
+            pipe.xack(self.stream, self.group, item.id)
+            pipe.xdel(self.stream, item.id)
+            await pipe.execute()
+
+    async def nack(self, item: InboundItem) -> None:
+        # The entry stays pending until `reclaim` delivers it again
+        pass
+
+    async def reclaim(self, consumer: str) -> List[InboundItem]:
+        redis = get_redis_client()
+        response = await redis.xautoclaim(
+            self.stream,
+            self.group,
+            consumer,
+            min_idle_time=self.reclaim_idle_ms,
+            start_id="0-0",
+            count=10,
+        )
+        items = []
+        for item in self._to_items(response[1]):
+            pending = await redis.xpending_range(
+                self.stream, self.group, min=item.id, max=item.id, count=1
+            )
+            if pending:
+                item.deliveries = pending[0]["times_delivered"]
+            if item.deliveries > self.max_deliveries:
+                await self._dead_letter(item)
+            else:
+                items.append(item)
+        return items
+
+    async def _dead_letter(self, item: InboundItem) -> None:
+        logger.error(
+            f"Moving inbound item {item.id} to {self.dead_letters} after "
+            f"{item.deliveries - 1} failed deliveries"
+        )
+        redis = get_redis_client()
+        async with redis.pipeline(transaction=True) as pipe:
+            pipe.xadd(
+                self.dead_letters,
+                {
+                    "id": item.id,
+                    "body": item.envelope.raw,
+                    "received_at": repr(item.envelope.received_at),
+                },
+            )
+            pipe.xack(self.stream, self.group, item.id)
+            pipe.xdel(self.stream, item.id)
+            await pipe.execute()
+
+    @staticmethod
+    def _to_items(entries: list) -> List[InboundItem]:
+        items = []
+        for entry_id, fields in entries:
+            if not fields:  # The entry was trimmed from the stream
+                continue
+            entry_id = entry_id.decode() if isinstance(entry_id, bytes) else entry_id
+            envelope = RequestEnvelope(fields[b"body"], float(fields[b"received_at"]))
+            items.append(InboundItem(entry_id, envelope))
+        return items
+
+
+class InboundWorkerPool:
+    """
+    Runs a fixed number of workers that feed queued requests to a handler. An
+    item is acked when the handler succeeds, and nacked when it raises or
+    returns a response with a 5xx status. handle_request queues the failed
+    items of a batched delivery again on their own and reports success, so
+    the items that succeeded aren't redelivered.
+    """
+
+    def __init__(
+        self,
+        queue: InboundQueue,
+        handler: Callable[[RequestEnvelope], Awaitable],
+        concurrency: int,
+        name: Optional[str] = None,
+        reclaim_interval: float = 30,
+    ):
+        self.logger = logging.getLogger(__name__)
+        self.queue = queue
+        self.handler = handler
+        self.concurrency = concurrency
+        # Consumer names must be unique across processes sharing the stream
+        self.name = name or f"{socket.gethostname()}-{os.getpid()}"
+        self.reclaim_interval = reclaim_interval
+        self._tasks: List[asyncio.Task] = []
+        self._stopping = False
+
+    async def start(self) -> None:
+        await self.queue.setup()
+        self._stopping = False
+        self._tasks = [
+            asyncio.create_task(self._run(f"{self.name}-{i}"))
+            for i in range(self.concurrency)
+        ]
+        self.logger.info(f"Started {self.concurrency} inbound workers")
+
+    async def stop(self, timeout: float = 10) -> None:
+        """Let the workers finish their current item, then cancel them."""
+        self._stopping = True
+        if not self._tasks:
+            return
+        _, pending = await asyncio.wait(self._tasks, timeout=timeout)
+        for task in pending:
+            task.cancel()
+        await asyncio.gather(*pending, return_exceptions=True)
+        self._tasks = []
+        self.logger.info("Inbound workers stopped")
+
+    async def _run(self, consumer: str) -> None:
+        last_reclaim = 0.0
+        while not self._stopping:
+            # Whenever idle, pick up anything a crashed worker left behind
+            if time.monotonic() - last_reclaim > self.reclaim_interval:
+                last_reclaim = time.monotonic()
+                for item in await self._safe_reclaim(consumer):
+                    await self._process(item)
+
+            try:
+                item = await self.queue.get(consumer)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.logger.error(f"Failed to read from the inbound queue: {e}")
+                await asyncio.sleep(1)
+                continue
+
+            if item is not None:
+                await self._process(item)
+
+    async def _process(self, item: InboundItem) -> None:
+        try:
+            response = await self.handler(item.envelope)
+            # handle_request reports failures as 5xx responses instead of raising
+            if getattr(response, "status_code", 200) >= 500:
+                raise Exception(f"handler returned status {response.status_code}")
+        except Exception as e:
+            self.logger.error(f"Unhandled error processing inbound item {item.id}: {e}")
+            try:
+                await self.queue.nack(item)
+            except Exception as e:
+                self.logger.error(f"Failed to nack inbound item {item.id}: {e}")
+            return
+
+        try:
+            await self.queue.ack(item)
+        except Exception as e:
+            self.logger.error(f"Failed to ack inbound item {item.id}: {e}")
+
+    async def _safe_reclaim(self, consumer: str) -> List[InboundItem]:
+        try:
+            return await self.queue.reclaim(consumer)
+        except Exception as e:
+            self.logger.error(f"Failed to reclaim inbound items: {e}")
+            return []
+
+
+def create_inbound_queue() -> InboundQueue:
+    # Redis is only initialized in production and staging (see app/main.py)
+    if settings.environment in (Environment.PRODUCTION, Environment.STAGING):
+        return RedisStreamInboundQueue(
+            max_length=settings.inbound_queue_max_length,
+            reclaim_idle_ms=settings.inbound_queue_reclaim_idle_ms,
+            max_deliveries=settings.inbound_queue_max_deliveries,
+        )
+    return InMemoryInboundQueue(
+        max_length=settings.inbound_queue_max_length,
+        max_deliveries=settings.inbound_queue_max_deliveries,
+    )
+
+
+inbound_queue = create_inbound_queue()
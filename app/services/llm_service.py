@@ -1,7 +1,6 @@
 import re
 import json
 import logging
-import asyncio
 from typing import List, Optional
 import uuid
 from openai.types.chat import ChatCompletionMessageToolCall
@@ -9,13 +8,22 @@ from openai.types.chat.chat_completion_message_tool_call import Function
 import pprint
 
 
-from app.database.models import Message, User
+from app.database.models import Message
 from app.database.enums import MessageRole
-from app.config import llm_settings
+from app.config import llm_settings, settings
 from app.database.db import get_user_message_history
+from app.utils.context_utils import get_context_budget, pack_context
 from app.utils.llm_utils import async_llm_request
 from app.utils.prompt_manager import prompt_manager
 from app.services.whatsapp_service import whatsapp_client
+from app.services.mailbox_service import (
+    MailboxBackend,
+    MailboxLockLost,
+    create_mailbox_backend,
+)
+from app.services.admission_service import AdmissionRejected, admission_controller
+from app.services.user_cache_service import CachedUser
+from app.services.message_journal_service import message_journal
 from app.tools.registry import get_tools_metadata, ToolName
 from app.tools.tool_code.generate_exercise.main import generate_exercise
 from app.tools.tool_code.search_knowledge.main import search_knowledge
@@ -25,51 +33,57 @@ from app.utils.string_manager import strings, StringCategory
 class MessageProcessor:
     """Handles processing and batching of messages for a single user."""
 
-    def __init__(self, user_id: int):
+    def __init__(self, user_id: int, mailbox: MailboxBackend):
         self.user_id = user_id
-        self.lock = asyncio.Lock()
-        self.messages: List[Message] = []
+        self.mailbox = mailbox
+        self.token: Optional[str] = None
 
-    def add_message(self, message: Message) -> None:
-        self.messages.append(message)
+    async def add_message(self, message: Message) -> None:
+        await self.mailbox.push(self.user_id, message)
 
-    def get_pending_messages(self) -> List[Message]:
-        return self.messages.copy()
+    async def acquire(self) -> bool:
+        """Try to become the one processing this user's messages."""
+        self.token = await self.mailbox.acquire(self.user_id)
+        return self.token is not None
 
-    def clear_messages(self) -> None:
-        self.messages.clear()
+    async def get_pending_messages(self) -> List[Message]:
+        return await self.mailbox.pending(self.user_id)
 
-    @property
-    def has_messages(self) -> bool:
-        return bool(self.messages)
+    async def pending_count(self) -> int:
+        return await self.mailbox.pending_count(self.user_id)
 
-    @property
-    def is_locked(self) -> bool:
-        return self.lock.locked()
+    async def finish(self, processed: int) -> bool:
+        """
+        Clear the buffer and unlock, unless new messages arrived. Raises
+        MailboxLockLost if this processor no longer holds the lock.
+        """
+        assert self.token is not None
+        if not await self.mailbox.complete(self.user_id, self.token, processed):
+            return False
+        self.token = None
+        return True
+
+    async def release(self) -> None:
+        """Clear the buffer and unlock, if this processor still holds the lock."""
+        if self.token is not None:
+            await self.mailbox.release(self.user_id, self.token)
+            self.token = None
 
 
 class LLMClient:
     def __init__(self):
         self.logger = logging.getLogger(__name__)
-        self._processors: dict[int, MessageProcessor] = {}
+        self._mailbox = create_mailbox_backend()
 
     def _get_processor(self, user_id: int) -> MessageProcessor:
-        """Get or create a message processor for a user."""
-        if user_id not in self._processors:
-            self._processors[user_id] = MessageProcessor(user_id)
-        return self._processors[user_id]
-
-    def _cleanup_processor(self, user_id: int) -> None:
-        """Remove processor if it's empty and unlocked."""
-        processor = self._processors.get(user_id)
-        if processor and not processor.has_messages and not processor.is_locked:
-            del self._processors[user_id]
-
-    def _check_new_messages(
+        """Get a message processor for a user."""
+        return MessageProcessor(user_id, self._mailbox)
+
+    async def _check_new_messages(
         self, processor: MessageProcessor, original_count: int
     ) -> bool:
         """Check if new messages arrived during processing."""
-        return len(processor.messages) > original_count
+        return await processor.pending_count() > original_count
 
     def _catch_malformed_tool(
         self, msg: Message
@@ -131,7 +145,7 @@ class LLMClient:
 
         return None
 
-    async def _tool_call_notification(self, user: User, tool_name: str) -> None:
+    async def _tool_call_notification(self, user: CachedUser, tool_name: str) -> None:
         """Send a notification to the user when a tool call is made."""
         await whatsapp_client.send_message(
             user.wa_id, strings.get_string(StringCategory.TOOLS, tool_name)
@@ -140,11 +154,10 @@ class LLMClient:
     async def _process_tool_calls(
         self,
         tool_calls: List[ChatCompletionMessageToolCall],
-        user: User,
+        user: CachedUser,
     ) -> Optional[List[Message]]:
         """Process tool calls and return just the new tool response messages."""
 
-        assert user.id is not None
         # if not resources:
         #     self.logger.error("No resources available for tool calls")
         #     return [
@@ -200,37 +213,52 @@ class LLMClient:
 
     async def generate_response(
         self,
-        user: User,
+        user: CachedUser,
         message: Message,
     ) -> Optional[List[Message]]:
-        """Generate a response, handling message batching and tool calls."""
-        assert user.id is not None
+        """
+        Generate a response, handling message batching and tool calls.
+        Raises AdmissionRejected when too many conversations are in flight, and
+        MailboxLockLost when the user's lock was lost before the response was
+        done, since another holder then answers the same messages.
+        """
         processor = self._get_processor(user.id)
-        processor.add_message(message)
+        if settings.user_mailbox_backend == "redis":
+            # The lock holder may be another process, reading the history
+            # from the database
+            await message_journal.flush_user(user.id)
+        await processor.add_message(message)
 
-        self.logger.debug(
-            f"Message buffer for user: {user.wa_id}, buffer: {processor.get_pending_messages()}"
-        )
+        self.logger.debug(f"Message buffered for user: {user.wa_id}")
 
-        if processor.is_locked:
+        if not await processor.acquire():
             self.logger.info(f"Lock held for user {user.wa_id}, message buffered")
             return None
 
-        async with processor.lock:
+        try:
+            await admission_controller.acquire(user.id)
+        except AdmissionRejected:
+            await processor.release()
+            raise
+
+        try:
             while True:
                 try:
-                    messages_to_process = processor.get_pending_messages()
+                    messages_to_process = await processor.get_pending_messages()
                     original_count = len(messages_to_process)
                     if not messages_to_process:
                         self.logger.warning(f"No messages to process for {user.wa_id}.")
-                        processor.clear_messages()
-                        self._cleanup_processor(user.id)
                         return None
 
                     # 1. Build the API messages from DB history + new messages
-                    history = await get_user_message_history(user.id)
+                    history = await get_user_message_history(
+                        user.id,
+                        limit=max(
+                            llm_settings.llm_history_max_messages,
+                            len(messages_to_process),
+                        ),
+                    )
 
-                    # TODO: Check for token count and cutoff if necessary
                     api_messages = self._format_messages(
                         messages_to_process, history, user
                     )
@@ -268,7 +296,7 @@ class LLMClient:
                             initial_message.content = None
 
                     # 4. Check for new incoming messages during processing
-                    if self._check_new_messages(processor, original_count):
+                    if await self._check_new_messages(processor, original_count):
                         self.logger.warning("New messages buffered during processing")
                         continue
 
@@ -288,9 +316,9 @@ class LLMClient:
 
                         if tool_responses:
                             new_messages.extend(tool_responses)
-                            # Extend api_messages with new tool responses
-                            api_messages.extend(
-                                msg.to_api_format() for msg in tool_responses
+                            # Repack api_messages with the new tool responses
+                            api_messages = self._format_messages(
+                                messages_to_process, history, user, tool_responses
                             )
 
                             # 6. Final call to LLM with the new tool outputs appended
@@ -306,44 +334,47 @@ class LLMClient:
                             new_messages.append(final_message)
 
                         # Check for new messages again
-                        if self._check_new_messages(processor, original_count):
+                        if await self._check_new_messages(processor, original_count):
                             self.logger.warning("New messages buffered during tools")
                             continue
 
                     # 7. If we got this far, we can clear the buffer and return
                     self.logger.debug("LLM finished. Clearing buffer.")
-                    processor.clear_messages()
-                    self._cleanup_processor(user.id)
+                    if not await processor.finish(original_count):
+                        self.logger.warning("New messages buffered while finishing")
+                        continue
                     return new_messages
 
+                except MailboxLockLost:
+                    raise
                 except Exception as e:
                     self.logger.error(f"Error processing messages: {e}")
-                    processor.clear_messages()
-                    self._cleanup_processor(user.id)
                     return None
+        finally:
+            admission_controller.release()
+            await processor.release()
 
     @staticmethod
     def _format_messages(
         new_messages: List[Message],
         database_messages: Optional[List[Message]],
-        user: User,
+        user: CachedUser,
+        tool_responses: Optional[List[Message]] = None,
     ) -> List[dict]:
         """
         Format messages for the API, removing duplicates between new messages and database history.
+        The history is trimmed (oldest first) to fit the model's token budget.
         """
-        # Initialize with system prompt
-        formatted_messages = [
-            {
-                "role": MessageRole.system,
-                "content": prompt_manager.format_prompt(
-                    "twiga_system",
-                    user_name=user.name,
-                    class_info=user.formatted_class_info,
-                ),
-            }
-        ]
-
-        # Add history messages
+        system_message = {
+            "role": MessageRole.system,
+            "content": prompt_manager.format_prompt(
+                "twiga_system",
+                user_name=user.name,
+                class_info=user.formatted_class_info,
+            ),
+        }
+
+        old_messages: List[Message] = []
         if database_messages:
             # Exclude potential duplicates
             message_count = len(new_messages)
@@ -360,12 +391,13 @@ class LLMClient:
                 if message_count > 0
                 else database_messages
             )
-            formatted_messages.extend(msg.to_api_format() for msg in old_messages)
 
-        # Add new messages
-        formatted_messages.extend(msg.to_api_format() for msg in new_messages)
-
-        return formatted_messages
+        return pack_context(
+            system_message,
+            old_messages,
+            new_messages + (tool_responses or []),
+            get_context_budget(llm_settings.llm_model_name),
+        )
 
 
 llm_client = LLMClient()
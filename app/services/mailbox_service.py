@@ -0,0 +1,273 @@
+import asyncio
+import logging
+import uuid
+from abc import ABC, abstractmethod
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import orjson
+
+from app.config import settings
+from app.database.enums import MessageRole
+from app.database.models import Message
+from app.redis.engine import get_redis_client
+from app.redis.redis_keys import RedisKeys
+
+
+class MailboxLockLost(Exception):
+    """
+    Raised when a mailbox lock expired or was taken over while its holder was
+    processing. Another holder then answers the same messages.
+    """
+
+    pass
+
+
+class MailboxBackend(ABC):
+    """
+    Per-user message buffer plus an exclusive lock.
+
+    A message is always pushed to the user's mailbox first. Whoever acquires the
+    lock processes everything that is pending; everyone else returns right away
+    and lets the lock holder pick their message up. `complete` clears the
+    processed messages and releases the lock in one step, but only if nothing
+    new arrived in the meantime, so no message can be stranded in the buffer.
+    """
+
+    @abstractmethod
+    async def push(self, user_id: int, message: Message) -> None:
+        pass
+
+    @abstractmethod
+    async def acquire(self, user_id: int) -> Optional[str]:
+        """Try to take the user's lock. Returns an owner token, or None if held."""
+        pass
+
+    @abstractmethod
+    async def pending(self, user_id: int) -> List[Message]:
+        pass
+
+    @abstractmethod
+    async def pending_count(self, user_id: int) -> int:
+        pass
+
+    @abstractmethod
+    async def complete(self, user_id: int, token: str, processed: int) -> bool:
+        """
+        Clear the buffer and release the lock if it holds no more than the
+        `processed` messages. Returns False, keeping the buffer and the lock,
+        if more messages arrived, so the whole buffer is processed again.
+        Raises MailboxLockLost if the token no longer owns the lock.
+        """
+        pass
+
+    @abstractmethod
+    async def release(self, user_id: int, token: str) -> None:
+        """Clear the buffer and release the lock if the token still owns it."""
+        pass
+
+
+@dataclass
+class _LocalMailbox:
+    messages: List[Message] = field(default_factory=list)
+    owner: Optional[str] = None
+
+
+class InMemoryMailboxBackend(MailboxBackend):
+    """Process-local mailboxes. Only safe with a single app process."""
+
+    def __init__(self):
+        self._mailboxes: Dict[int, _LocalMailbox] = {}
+
+    def _get(self, user_id: int) -> _LocalMailbox:
+        if user_id not in self._mailboxes:
+            self._mailboxes[user_id] = _LocalMailbox()
+        return self._mailboxes[user_id]
+
+    def _cleanup(self, user_id: int) -> None:
+        """Remove the mailbox if it's empty and unlocked."""
+        mailbox = self._mailboxes.get(user_id)
+        if mailbox and not mailbox.messages and mailbox.owner is None:
+            del self._mailboxes[user_id]
+
+    async def push(self, user_id: int, message: Message) -> None:
+        self._get(user_id).messages.append(message)
+
+    async def acquire(self, user_id: int) -> Optional[str]:
+        mailbox = self._get(user_id)
+        if mailbox.owner is not None:
+            return None
+        mailbox.owner = uuid.uuid4().hex
+        return mailbox.owner
+
+    async def pending(self, user_id: int) -> List[Message]:
+        return self._get(user_id).messages.copy()
+
+    async def pending_count(self, user_id: int) -> int:
+        return len(self._get(user_id).messages)
+
+    async def complete(self, user_id: int, token: str, processed: int) -> bool:
+        mailbox = self._get(user_id)
+        if mailbox.owner != token:
+            raise MailboxLockLost(f"Lock for user {user_id} is no longer held")
+        if len(mailbox.messages) > processed:
+            return False
+        await self.release(user_id, token)
+        return True
+
+    async def release(self, user_id: int, token: str) -> None:
+        mailbox = self._mailboxes.get(user_id)
+        if mailbox and mailbox.owner == token:
+            mailbox.messages.clear()
+            mailbox.owner = None
+            self._cleanup(user_id)
+
+
+# KEYS[1] = lock, KEYS[2] = buffer, ARGV[1] = token, ARGV[2] = processed count
+_COMPLETE_SCRIPT = """
+if redis.call('GET', KEYS[1]) ~= ARGV[1] then
+    return -1
+end
+local remaining = redis.call('LLEN', KEYS[2]) - tonumber(ARGV[2])
+if remaining > 0 then
+    return remaining
+end
+redis.call('DEL', KEYS[1], KEYS[2])
+return 0
+"""
+
+# KEYS[1] = lock, KEYS[2] = buffer, ARGV[1] = token
+_RELEASE_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1], KEYS[2])
+end
+return 0
+"""
+
+# KEYS[1] = lock, KEYS[2] = buffer, ARGV[1] = token, ARGV[2] = lock ttl (ms),
+# ARGV[3] = buffer ttl (ms)
+_RENEW_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    redis.call('PEXPIRE', KEYS[2], ARGV[3])
+    return redis.call('PEXPIRE', KEYS[1], ARGV[2])
+end
+return 0
+"""
+
+
+def _dump_message(message: Message) -> bytes:
+    return orjson.dumps(message.model_dump(mode="json"))
+
+
+def _load_message(raw: bytes) -> Message:
+    # Table models skip validation, so the enum and datetime are restored here
+    data = orjson.loads(raw)
+    data["role"] = MessageRole(data["role"])
+    if data.get("created_at"):
+        data["created_at"] = datetime.fromisoformat(data["created_at"])
+    return Message(**data)
+
+
+class RedisMailboxBackend(MailboxBackend):
+    """
+    Mailboxes shared by every app process and replica.
+
+    The lock is a SET NX PX key holding the owner token. While it is held, a
+    background task renews the lease so long LLM calls don't lose it, and if
+    the owner dies the lease runs out and the next message takes over the
+    buffer. Buffered messages are kept in a Redis list.
+    """
+
+    def __init__(self, lock_ttl_ms: int, buffer_ttl_ms: int):
+        self.logger = logging.getLogger(__name__)
+        self.lock_ttl_ms = lock_ttl_ms
+        self.buffer_ttl_ms = buffer_ttl_ms
+        self._renewals: Dict[str, asyncio.Task] = {}
+
+    async def push(self, user_id: int, message: Message) -> None:
+        redis = get_redis_client()
+        buffer_key = RedisKeys.USER_MAILBOX(user_id)
+        async with redis.pipeline(transaction=False) as pipe:
+            pipe.rpush(buffer_key, _dump_message(message))
+            pipe.pexpire(buffer_key, self.buffer_ttl_ms)
+            await pipe.execute()
+
+    async def acquire(self, user_id: int) -> Optional[str]:
+        token = uuid.uuid4().hex
+        acquired = await get_redis_client().set(
+            RedisKeys.USER_LOCK(user_id), token, nx=True, px=self.lock_ttl_ms
+        )
+        if not acquired:
+            return None
+        self._renewals[token] = asyncio.create_task(self._renew(user_id, token))
+        return token
+
+    async def pending(self, user_id: int) -> List[Message]:
+        raw = await get_redis_client().lrange(RedisKeys.USER_MAILBOX(user_id), 0, -1)
+        return [_load_message(item) for item in raw]
+
+    async def pending_count(self, user_id: int) -> int:
+        return await get_redis_client().llen(RedisKeys.USER_MAILBOX(user_id))
+
+    async def complete(self, user_id: int, token: str, processed: int) -> bool:
+        remaining = await get_redis_client().eval(
+            _COMPLETE_SCRIPT,
+            2,
+            RedisKeys.USER_LOCK(user_id),
+            RedisKeys.USER_MAILBOX(user_id),
+            token,
+            processed,
+        )
+        if remaining == -1:
+            self._stop_renewal(token)
+            raise MailboxLockLost(f"Lock for user {user_id} expired while processing")
+        if remaining > 0:
+            return False
+        self._stop_renewal(token)
+        return True
+
+    async def release(self, user_id: int, token: str) -> None:
+        self._stop_renewal(token)
+        await get_redis_client().eval(
+            _RELEASE_SCRIPT,
+            2,
+            RedisKeys.USER_LOCK(user_id),
+            RedisKeys.USER_MAILBOX(user_id),
+            token,
+        )
+
+    async def _renew(self, user_id: int, token: str) -> None:
+        interval = self.lock_ttl_ms / 3000
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                renewed = await get_redis_client().eval(
+                    _RENEW_SCRIPT,
+                    2,
+                    RedisKeys.USER_LOCK(user_id),
+                    RedisKeys.USER_MAILBOX(user_id),
+                    token,
+                    self.lock_ttl_ms,
+                    self.buffer_ttl_ms,
+                )
+            except Exception as e:
+                self.logger.error(f"Failed to renew lock for user {user_id}: {str(e)}")
+                continue
+            if not renewed:
+                self.logger.warning(f"Lost the lock for user {user_id}")
+                return
+
+    def _stop_renewal(self, token: str) -> None:
+        task = self._renewals.pop(token, None)
+        if task:
+            task.cancel()
+
+
+def create_mailbox_backend() -> MailboxBackend:
+    if settings.user_mailbox_backend == "redis":
+        return RedisMailboxBackend(
+            lock_ttl_ms=settings.user_lock_ttl_ms,
+            buffer_ttl_ms=settings.user_mailbox_ttl_ms,
+        )
+    return InMemoryMailboxBackend()
@@ -0,0 +1,222 @@
+import asyncio
+import logging
+import time
+from collections import deque
+from typing import Deque, Dict, List, Optional
+
+from app.config import settings
+from app.database.engine import get_session
+from app.database.models import Message
+from app.utils.llm_utils import num_tokens_from_message
+
+
+class MessageJournal:
+    """
+    Write-behind buffer for the messages table. Messages are appended in
+    memory and written together, in one transaction and one multi-row INSERT,
+    once `flush_interval_ms` passed since the first pending one or
+    `max_batch_size` are pending.
+
+    If the batch fails, its messages are written one row at a time and only
+    the rows that fail are dropped. If no row can be written (the database is
+    unavailable), the messages stay pending for the next flush.
+
+    Appended messages get their IDs and token counts when they are flushed.
+    Use `flush_user` before reading a user's history from the database.
+    `stop` drains the buffer on shutdown.
+    """
+
+    # Messages are dropped after this many flushes in a row write none of them
+    MAX_FLUSH_ATTEMPTS = 3
+
+    def __init__(self, flush_interval_ms: float, max_batch_size: int):
+        self.logger = logging.getLogger(__name__)
+        self.flush_interval = flush_interval_ms / 1000
+        self.max_batch_size = max_batch_size
+        self._pending: List[Message] = []
+        self._in_flight: List[Message] = []
+        self._lock = asyncio.Lock()
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._tasks: set[asyncio.Task] = set()
+        self._failed_attempts = 0
+        # Milliseconds per flush, for the most recent flushes
+        self._latencies: Deque[float] = deque(maxlen=1000)
+        self.flushes = 0
+        self.rows_written = 0
+        self.rows_dropped = 0
+        self.errors = 0
+
+    def append(self, message: Message) -> None:
+        self._pending.append(message)
+        if len(self._pending) >= self.max_batch_size:
+            self._flush_soon()
+        elif self._timer is None:
+            loop = asyncio.get_running_loop()
+            self._timer = loop.call_later(self.flush_interval, self._flush_soon)
+
+    async def flush_user(self, user_id: int) -> None:
+        """Flush if any message of the user isn't written yet."""
+        if any(m.user_id == user_id for m in self._pending + self._in_flight):
+            await self.flush()
+
+    async def flush(self) -> None:
+        """
+        Write every pending message, after any flush already running. Raises
+        if none of them could be written (they stay pending for the next flush).
+        """
+        async with self._lock:
+            if self._timer:
+                self._timer.cancel()
+                self._timer = None
+            if not self._pending:
+                return
+
+            self._in_flight, self._pending = self._pending, []
+            count = len(self._in_flight)
+            failed: List[Message] = []
+            try:
+                await self._count_tokens(self._in_flight)
+                start = time.perf_counter()
+                try:
+                    await self._insert(self._in_flight)
+                except Exception as e:
+                    self.errors += 1
+                    failed = list(self._in_flight)
+                    if count > 1:
+                        self.logger.warning(
+                            f"Failed to write a batch of {count} messages, "
+                            f"writing them one by one: {str(e)}"
+                        )
+                        failed = await self._insert_each(self._in_flight)
+                    if len(failed) == count:
+                        self._retry_or_drop(failed)
+                        raise Exception(f"Failed to write messages: {str(e)}")
+                    if failed:
+                        self.logger.error(
+                            f"Dropping {len(failed)} of {count} messages "
+                            f"that failed to write"
+                        )
+                        self.rows_dropped += len(failed)
+            finally:
+                self._in_flight = []
+
+            self._failed_attempts = 0
+            self._latencies.append((time.perf_counter() - start) * 1000)
+            self.flushes += 1
+            self.rows_written += count - len(failed)
+
+    async def stop(self) -> None:
+        """Write everything that is pending, on shutdown."""
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        while self._pending:
+            try:
+                await self.flush()
+            except Exception as e:
+                self.logger.error(f"Failed to drain the message journal: {str(e)}")
+        self.logger.info(f"Message journal drained: {self.stats}")
+
+    @property
+    def stats(self) -> Dict[str, float]:
+        latencies = sorted(self._latencies)
+        return {
+            "pending": len(self._pending),
+            "flushes": self.flushes,
+            "rows_written": self.rows_written,
+            "rows_dropped": self.rows_dropped,
+            "errors": self.errors,
+            "avg_batch": self.rows_written / self.flushes if self.flushes else 0.0,
+            "p50_flush_ms": _percentile(latencies, 50),
+            "p99_flush_ms": _percentile(latencies, 99),
+            "max_flush_ms": latencies[-1] if latencies else 0.0,
+        }
+
+    async def _count_tokens(self, messages: List[Message]) -> None:
+        """
+        Store the token counts of the messages that don't have one, counted in
+        a thread so tokenizing (and loading the encoding) doesn't block the
+        event loop. The context packer counts any that are still missing.
+        """
+        missing = [m for m in messages if m.token_count is None]
+        if not missing:
+            return
+        try:
+            counts = await asyncio.to_thread(
+                lambda formatted: [num_tokens_from_message(m) for m in formatted],
+                [m.to_api_format() for m in missing],
+            )
+        except Exception as e:
+            self.logger.warning(f"Failed to count message tokens: {str(e)}")
+            return
+        for message, token_count in zip(missing, counts):
+            message.token_count = token_count
+
+    async def _insert(self, messages: List[Message]) -> None:
+        try:
+            async with get_session() as session:
+                # The ORM sends these as one multi-row INSERT ... RETURNING id
+                session.add_all(messages)
+                await session.flush()
+        except Exception:
+            # The IDs of a rolled back INSERT were never written
+            for message in messages:
+                message.id = None
+            raise
+
+    async def _insert_each(self, messages: List[Message]) -> List[Message]:
+        """Write the messages one per transaction. Returns the ones that failed."""
+        failed = []
+        for message in messages:
+            try:
+                await self._insert([message])
+            except Exception as e:
+                self.logger.error(
+                    f"Failed to write a message of user {message.user_id}: {str(e)}"
+                )
+                failed.append(message)
+        return failed
+
+    def _retry_or_drop(self, messages: List[Message]) -> None:
+        self._failed_attempts += 1
+        if self._failed_attempts >= self.MAX_FLUSH_ATTEMPTS:
+            self.logger.error(
+                f"Dropping {len(messages)} messages after "
+                f"{self._failed_attempts} failed flushes"
+            )
+            self.rows_dropped += len(messages)
+            self._failed_attempts = 0
+        else:
+            self._pending = messages + self._pending
+            self._schedule_retry()
+
+    def _flush_soon(self) -> None:
+        if self._timer:
+            self._timer.cancel()
+            self._timer = None
+        task = asyncio.create_task(self._background_flush())
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def _schedule_retry(self) -> None:
+        if self._timer is None:
+            loop = asyncio.get_running_loop()
+            self._timer = loop.call_later(self.flush_interval, self._flush_soon)
+
+    async def _background_flush(self) -> None:
+        try:
+            await self.flush()
+        except Exception as e:
+            self.logger.error(str(e))
+
+
+def _percentile(sorted_values: List[float], percent: float) -> float:
+    if not sorted_values:
+        return 0.0
+    index = round(percent / 100 * (len(sorted_values) - 1))
+    return sorted_values[index]
+
+
+message_journal = MessageJournal(
+    flush_interval_ms=settings.message_journal_flush_interval_ms,
+    max_batch_size=settings.message_journal_max_batch_size,
+)
@@ -8,6 +8,9 @@ from app.utils.string_manager import strings, StringCategory
 from app.services.whatsapp_service import whatsapp_client
 import app.database.db as db
 from app.services.llm_service import llm_client
+from app.services.admission_service import AdmissionRejected
+from app.services.mailbox_service import MailboxLockLost
+from app.services.user_cache_service import CachedUser
 
 
 class MessagingService:
@@ -15,9 +18,12 @@ class MessagingService:
         self.logger = logging.getLogger(__name__)
 
     async def handle_settings_selection(
-        self, user: models.User, message: models.Message
+        self, cached_user: CachedUser, message: models.Message
     ) -> JSONResponse:
         self.logger.debug(f"Handling interactive message with title: {message.content}")
+        # The flows are filled in from the full profile
+        user = await db.get_user_by_waid(cached_user.wa_id)
+        assert user is not None
         if message.content == "Personal Info":
             self.logger.debug("Sending update personal and school info flow")
             await flow_client.send_user_settings_flow(user)
@@ -32,7 +38,7 @@ class MessagingService:
         )
 
     async def handle_command_message(
-        self, user: models.User, message: models.Message
+        self, user: CachedUser, message: models.Message
     ) -> JSONResponse:
         self.logger.debug(f"Handling command message: {message.content}")
         assert message.content is not None
@@ -57,12 +63,28 @@ class MessagingService:
         )
 
     async def handle_chat_message(
-        self, user: models.User, user_message: models.Message
+        self, user: CachedUser, user_message: models.Message
     ) -> JSONResponse:
         # available_user_resources = await db.get_user_resources(user)
-        llm_responses = await llm_client.generate_response(
-            user=user, message=user_message
-        )
+        try:
+            llm_responses = await llm_client.generate_response(
+                user=user, message=user_message
+            )
+        except AdmissionRejected:
+            busy_message = strings.get_string(StringCategory.ERROR, "busy")
+            await whatsapp_client.send_message(user.wa_id, busy_message)
+            return JSONResponse(
+                content={"status": "ok"},
+                status_code=200,
+            )
+        except MailboxLockLost as e:
+            # Another holder is answering the same messages, so drop this reply
+            self.logger.warning(f"Dropping the response for {user.wa_id}: {str(e)}")
+            return JSONResponse(
+                content={"status": "ok"},
+                status_code=200,
+            )
+
         if llm_responses:
             self.logger.debug(
                 f"Sending message to {user.wa_id}: {llm_responses[-1].content}"
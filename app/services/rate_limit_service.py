@@ -1,7 +1,7 @@
 import logging
-from fastapi import Request, HTTPException
+from fastapi import HTTPException
 from fastapi.responses import JSONResponse
-from app.utils.whatsapp_utils import extract_message_info, get_request_type, RequestType
+from app.utils.whatsapp_utils import extract_message_info
 from app.redis.engine import get_redis_client
 from app.config import Environment, settings
 from app.database import db
@@ -48,25 +48,17 @@ async def check_rate_limit(key: str, limit: int) -> tuple[bool, int]:
     return False, count
 
 
-async def rate_limit(request: Request) -> JSONResponse | None:
+async def rate_limit(body: dict) -> JSONResponse | None:
     """
-    FastAPI dependency for rate limiting WhatsApp messages using rolling 24-hour windows.
-    Returns 200 status code even when rate limited to prevent WhatsApp retries.
+    Rate limit a single valid WhatsApp message using rolling 24-hour windows.
+    Expects a single-message webhook body (see iter_webhook_items), so every
+    message in a batched delivery is counted.
+    Returns a 200 response when rate limited to prevent WhatsApp retries.
     """
     # Skip in development
     if settings.environment not in (Environment.PRODUCTION, Environment.STAGING):
         return
 
-    try:
-        body = await request.json()
-    except Exception as e:
-        logger.error(f"Failed to parse request body: {str(e)}")
-        raise HTTPException(status_code=400, detail="Invalid request body")
-
-    # Only rate limit valid messages
-    if get_request_type(body) != RequestType.VALID_MESSAGE:
-        return None
-
     # Validate settings
     if not all(
         [
@@ -80,7 +72,7 @@ async def rate_limit(request: Request) -> JSONResponse | None:
     # Get phone number
     phone_number = extract_message_info(body).get("wa_id")
     if not phone_number:
-        raise HTTPException(status_code=400, detail="Phone number is required")
+        raise ValueError("Phone number is required")
 
     assert settings.user_message_limit and settings.global_message_limit
 
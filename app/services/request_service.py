@@ -1,6 +1,8 @@
-import json
+import asyncio
 import logging
-from fastapi import Request
+from contextlib import nullcontext
+from typing import Dict, List
+import orjson
 from fastapi.responses import JSONResponse
 
 import app.database.models as models
@@ -9,10 +11,17 @@ from app.utils.whatsapp_utils import (
     RequestType,
     extract_message,
     extract_message_info,
+    get_item_wa_id,
     get_request_type,
+    iter_webhook_items,
 )
+from app.utils.request_utils import RequestEnvelope
+from app.services.inbound_queue_service import inbound_queue
 from app.services.whatsapp_service import whatsapp_client
 from app.services.state_service import state_client
+from app.services.rate_limit_service import rate_limit
+from app.services.dedup_service import dedup_client
+from app.services.user_cache_service import user_cache
 import app.database.db as db
 from app.config import Environment, settings
 from app.utils.string_manager import strings, StringCategory
@@ -20,15 +29,91 @@ from app.utils.string_manager import strings, StringCategory
 logger = logging.getLogger(__name__)
 
 
-async def handle_request(request: Request) -> JSONResponse:
+async def handle_request(envelope: RequestEnvelope) -> JSONResponse:
     """
-    Handles HTTP requests to the 'webhooks' and 'flows' endpoints.
+    Handles a 'webhooks' request. This runs in the inbound workers, after the
+    webhook has already acknowledged the request to Meta.
+
+    Batched deliveries are split into one item per message/status. Items from
+    different users are handled concurrently while the items of a single user
+    are handled one after the other, in the order Meta sent them. Items that
+    fail are queued again on their own, so a retry doesn't repeat the items
+    that succeeded.
     """
     try:
+        items = list(iter_webhook_items(envelope.body))
+    except Exception as e:
+        logger.error(f"Failed to split the webhook body: {str(e)}")
+        return JSONResponse(
+            content={"status": "error", "message": "Internal server error"},
+            status_code=500,
+        )
+
+    # Most requests hold a single item, which can reuse the cached request type
+    if len(items) <= 1:
+        return await handle_request_item(envelope.body, envelope.request_type)
+
+    items_by_user: Dict[str, List[dict]] = {}
+    for i, item in enumerate(items):
+        key = get_item_wa_id(item) or f"item-{i}"
+        items_by_user.setdefault(key, []).append(item)
+
+    logger.info(
+        f"Dispatching {len(items)} webhook items for {len(items_by_user)} users"
+    )
+
+    async def handle_in_order(user_items: List[dict]) -> List[JSONResponse]:
+        responses = []
+        for item in user_items:
+            # A malformed item fails on its own, not the whole batch
+            try:
+                request_type = get_request_type(item, envelope.received_at)
+            except Exception as e:
+                logger.error(f"Failed to classify a webhook item: {str(e)}")
+                responses.append(
+                    JSONResponse(
+                        content={"status": "error", "message": "Internal server error"},
+                        status_code=500,
+                    )
+                )
+                continue
+            responses.append(await handle_request_item(item, request_type))
+        return responses
+
+    results = await asyncio.gather(
+        *(handle_in_order(user_items) for user_items in items_by_user.values())
+    )
+    failed = [
+        item
+        for user_items, responses in zip(items_by_user.values(), results)
+        for item, response in zip(user_items, responses)
+        if response.status_code >= 500
+    ]
+    if failed:
+        logger.error(
+            f"{len(failed)} of {len(items)} webhook items failed, queueing them again"
+        )
+        # A single-item entry that fails is redelivered by the queue itself,
+        # until it is dead-lettered
+        try:
+            for item in failed:
+                await inbound_queue.put(
+                    RequestEnvelope(orjson.dumps(item), envelope.received_at)
+                )
+        except Exception as e:
+            logger.error(f"Failed to queue the failed webhook items: {str(e)}")
+            return JSONResponse(
+                content={"status": "error", "message": "Internal server error"},
+                status_code=500,
+            )
+    return JSONResponse(content={"status": "ok"}, status_code=200)
 
-        body = await request.json()
 
-        request_type = get_request_type(body)
+async def handle_request_item(body: dict, request_type: RequestType) -> JSONResponse:
+    """
+    Routes a single-item webhook body depending on its type.
+    """
+    try:
         logger.info(f"Received a request of type: {request_type}")
 
         # Route the basic and stateless request types
@@ -44,15 +129,35 @@ async def handle_request(request: Request) -> JSONResponse:
             case RequestType.OUTDATED:
                 return whatsapp_client.handle_outdated_message(body)
             case RequestType.VALID_MESSAGE:
-                return await handle_valid_message(body)
+                # Drop redeliveries before doing any database or LLM work
+                message_id = extract_message_info(body)["message"].get("id")
+                if message_id and await dedup_client.is_duplicate(message_id):
+                    logger.debug(f"Deduplication stats: {dedup_client.stats}")
+                    return whatsapp_client.handle_duplicate_message(body)
+
+                try:
+                    # Keep the claim alive through long LLM turns
+                    claim = (
+                        dedup_client.keep_claimed(message_id)
+                        if message_id
+                        else nullcontext()
+                    )
+                    async with claim:
+                        response = await rate_limit(body)
+                        if response is None:
+                            response = await handle_valid_message(body)
+                except Exception:
+                    if message_id:
+                        await dedup_client.release(message_id)
+                    raise
+                if message_id:
+                    if response.status_code >= 500:
+                        await dedup_client.release(message_id)
+                    else:
+                        await dedup_client.complete(message_id)
+                return response
 
         raise Exception(f"Invalid request type. This is the request body: {body}")
-    except json.JSONDecodeError:
-        logger.error("Failed to decode JSON")
-        return JSONResponse(
-            content={"status": "error", "message": "Invalid JSON provided"},
-            status_code=400,
-        )
     except Exception as e:
         logger.error(f"Unexpected error in webhook handler: {str(e)}")
         return JSONResponse(
@@ -73,11 +178,10 @@ async def handle_valid_message(body: dict) -> JSONResponse:
             status_code=400,
         )
 
-    user = await db.get_or_create_user(
+    user = await user_cache.get_or_create(
         wa_id=message_info["wa_id"], name=message_info.get("name")
     )
 
-    assert user.id is not None
     # Create message record
     user_message = await db.create_new_message(
         models.Message(user_id=user.id, role=enums.MessageRole.user, content=message)
@@ -91,7 +195,9 @@ async def handle_valid_message(body: dict) -> JSONResponse:
         case enums.UserState.rate_limited:
             return await state_client.handle_rate_limited(user)
         case enums.UserState.onboarding:
-            return await state_client.handle_onboarding(user)
+            return await state_client.handle_onboarding(
+                await db.get_or_create_user(user.wa_id)
+            )
         case enums.UserState.new:
             # Dummy data for development environment if not using Flows
             if settings.environment not in (
@@ -102,8 +208,10 @@ async def handle_valid_message(body: dict) -> JSONResponse:
                 logger.debug(
                     "Business environment is False, adding dummy data for new user"
                 )
-                return await handle_new_dummy(user)
-            return await state_client.handle_onboarding(user)
+                return await handle_new_dummy(await db.get_or_create_user(user.wa_id))
+            return await state_client.handle_onboarding(
+                await db.get_or_create_user(user.wa_id)
+            )
         case enums.UserState.active:
             return await state_client.handle_active(user, message_info, user_message)
 
@@ -3,6 +3,7 @@ import logging
 from fastapi.responses import JSONResponse
 
 from app.database.models import Message, User
+from app.services.user_cache_service import CachedUser
 from app.services.onboarding_service import onboarding_client
 from app.database import db
 from app.services.whatsapp_service import whatsapp_client
@@ -16,8 +17,7 @@ class StateHandler:
     def __init__(self):
         self.logger = logging.getLogger(__name__)
 
-    async def handle_blocked(self, user: User) -> JSONResponse:
-        assert user.id is not None
+    async def handle_blocked(self, user: CachedUser) -> JSONResponse:
         response_text = strings.get_string(StringCategory.ERROR, "blocked")
         await whatsapp_client.send_message(user.wa_id, response_text)
         await db.create_new_message(
@@ -32,8 +32,7 @@ class StateHandler:
             status_code=200,
         )
 
-    async def handle_rate_limited(self, user: User) -> JSONResponse:
-        assert user.id is not None
+    async def handle_rate_limited(self, user: CachedUser) -> JSONResponse:
         response_text = strings.get_string(StringCategory.ERROR, "rate_limited")
         await whatsapp_client.send_message(user.wa_id, response_text)
         await db.create_new_message(
@@ -56,7 +55,7 @@ class StateHandler:
         )
 
     async def handle_active(
-        self, user: User, message_info: dict, user_message: Message
+        self, user: CachedUser, message_info: dict, user_message: Message
     ) -> JSONResponse:
         message_type = get_valid_message_type(message_info)
         match message_type:
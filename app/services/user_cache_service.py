@@ -0,0 +1,193 @@
+import asyncio
+import json
+import logging
+import time
+from collections import OrderedDict
+from dataclasses import asdict, dataclass
+from typing import Dict, Optional, Tuple
+
+import app.database.db as db
+import app.database.enums as enums
+from app.config import Environment, settings
+from app.database.models import User
+from app.redis.engine import get_redis_client
+from app.redis.redis_keys import RedisKeys
+
+
+@dataclass(frozen=True)
+class CachedUser:
+    """
+    The parts of a user that the message handlers read on every message. The
+    handlers that change a user (onboarding, settings flows) load the full
+    User from the database instead.
+    """
+
+    id: int
+    wa_id: str
+    state: enums.UserState
+    onboarding_state: Optional[enums.OnboardingState]
+    name: Optional[str]
+    formatted_class_info: str
+    class_name_to_id_map: Dict[str, int]
+
+    @classmethod
+    def from_user(cls, user: User) -> "CachedUser":
+        assert user.id is not None
+        return cls(
+            id=user.id,
+            wa_id=user.wa_id,
+            state=user.state,
+            onboarding_state=user.onboarding_state,
+            name=user.name,
+            formatted_class_info=user.formatted_class_info,
+            class_name_to_id_map=user.class_name_to_id_map,
+        )
+
+    def to_json(self) -> str:
+        return json.dumps(asdict(self))
+
+    @classmethod
+    def from_json(cls, data: str | bytes) -> "CachedUser":
+        fields = json.loads(data)
+        fields["state"] = enums.UserState(fields["state"])
+        if fields["onboarding_state"] is not None:
+            fields["onboarding_state"] = enums.OnboardingState(
+                fields["onboarding_state"]
+            )
+        return cls(**fields)
+
+
+class UserCache:
+    """
+    Read-through cache of user profiles, keyed by WhatsApp ID, so an inbound
+    message doesn't have to read the user and their classes from Postgres.
+
+    The first tier is a bounded in-process LRU. In production and staging the
+    second tier is a Redis key per user, shared by all workers. Updates must
+    go through `invalidate` after they are committed (db.update_user and
+    db.assign_teacher_to_classes do), which deletes the Redis entry and
+    publishes the WhatsApp ID so every worker drops its local copy and its
+    flow sessions for that user. Entries expire after `ttl` seconds, which
+    bounds how long a missed invalidation can serve a stale profile.
+    """
+
+    def __init__(self, ttl: int, max_size: int):
+        self.logger = logging.getLogger(__name__)
+        self.ttl = ttl
+        self.max_size = max_size
+        self._local: OrderedDict[str, Tuple[float, CachedUser]] = OrderedDict()
+        # Bumped by every invalidation, so a read that raced with an update
+        # doesn't cache the profile it read before the update
+        self._generation = 0
+        self._task: Optional[asyncio.Task] = None
+        self.local_hits = 0
+        self.redis_hits = 0
+        self.misses = 0
+
+    async def setup(self) -> None:
+        if self._use_redis():
+            self._task = asyncio.create_task(self._listen())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def get_or_create(self, wa_id: str, name: Optional[str] = None) -> CachedUser:
+        cached = self._local.get(wa_id)
+        if cached and cached[0] > time.monotonic():
+            self._local.move_to_end(wa_id)
+            self.local_hits += 1
+            return cached[1]
+
+        generation = self._generation
+        if self._use_redis():
+            try:
+                redis = get_redis_client()
+                data = await redis.get(RedisKeys.USER_PROFILE(wa_id))
+                if data is not None:
+                    user = CachedUser.from_json(data)
+                    if generation == self._generation:
+                        self._set_local(user)
+                    self.redis_hits += 1
+                    return user
+            except Exception as e:
+                self.logger.error(f"Redis error in user cache: {str(e)}")
+
+        self.misses += 1
+        user = CachedUser.from_user(await db.get_or_create_user(wa_id, name))
+        if generation != self._generation:
+            return user
+        self._set_local(user)
+
+        if self._use_redis():
+            try:
+                redis = get_redis_client()
+                await redis.set(
+                    RedisKeys.USER_PROFILE(wa_id), user.to_json(), ex=self.ttl
+                )
+            except Exception as e:
+                self.logger.error(f"Redis error in user cache: {str(e)}")
+        return user
+
+    async def invalidate(self, wa_id: str) -> None:
+        self._drop_local(wa_id)
+
+        if self._use_redis():
+            try:
+                redis = get_redis_client()
+                await redis.delete(RedisKeys.USER_PROFILE(wa_id))
+                await redis.publish(RedisKeys.USER_INVALIDATION, wa_id)
+            except Exception as e:
+                self.logger.error(f"Redis error in user cache: {str(e)}")
+
+    @property
+    def stats(self) -> Dict[str, float]:
+        lookups = self.local_hits + self.redis_hits + self.misses
+        return {
+            "local_hits": self.local_hits,
+            "redis_hits": self.redis_hits,
+            "misses": self.misses,
+            "hit_rate": (lookups - self.misses) / lookups if lookups else 0,
+            "local_size": len(self._local),
+        }
+
+    def _set_local(self, user: CachedUser) -> None:
+        self._local[user.wa_id] = (time.monotonic() + self.ttl, user)
+        self._local.move_to_end(user.wa_id)
+        while len(self._local) > self.max_size:
+            self._local.popitem(last=False)
+
+    def _drop_local(self, wa_id: str) -> None:
+        # Imported here: flow_session_service imports db, which imports this module
+        from app.services.flow_session_service import flow_sessions
+
+        self._generation += 1
+        self._local.pop(wa_id, None)
+        flow_sessions.invalidate_user(wa_id)
+
+    async def _listen(self) -> None:
+        """Drop the local entries of users invalidated by other workers."""
+        while True:
+            try:
+                pubsub = get_redis_client().pubsub(ignore_subscribe_messages=True)
+                async with pubsub:
+                    await pubsub.subscribe(RedisKeys.USER_INVALIDATION)
+                    async for message in pubsub.listen():
+                        if message["type"] == "message":
+                            self._drop_local(message["data"].decode())
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.logger.error(f"User cache invalidation listener failed: {str(e)}")
+                # The entries invalidated in the meantime are missed
+                self._local.clear()
+                await asyncio.sleep(1)
+
+    @staticmethod
+    def _use_redis() -> bool:
+        return settings.environment in (Environment.PRODUCTION, Environment.STAGING)
+
+
+user_cache = UserCache(ttl=settings.user_cache_ttl, max_size=settings.user_cache_size)
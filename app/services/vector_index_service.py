@@ -0,0 +1,315 @@
+import asyncio
+import json
+import logging
+import os
+from abc import ABC, abstractmethod
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+import app.database.db as db
+from app.config import settings
+from app.database.enums import ChunkType
+from app.database.models import ChunkHit
+
+# (where, n_results) pairs, see db.vector_search_multi
+Facets = List[Tuple[dict, int]]
+
+
+class VectorIndex(ABC):
+    """Nearest neighbour search over the chunk embeddings, used by db.vector_search."""
+
+    async def setup(self) -> None:
+        pass
+
+    async def stop(self) -> None:
+        pass
+
+    @abstractmethod
+    async def search(
+        self, query_vector: List[float], facets: Facets
+    ) -> List[List[ChunkHit]]:
+        """Get the hits of each facet, nearest (by cosine distance) first."""
+
+
+class PgVectorIndex(VectorIndex):
+    """Searches the HNSW index of the chunks table in Postgres."""
+
+    async def search(
+        self, query_vector: List[float], facets: Facets
+    ) -> List[List[ChunkHit]]:
+        return await db.search_chunks(query_vector, facets)
+
+
+@dataclass(frozen=True)
+class VectorSnapshot:
+    """
+    The chunks in the index. Rows of `embeddings` are normalized, so a dot
+    product is the cosine similarity. A refresh builds a new snapshot.
+    """
+
+    max_id: int
+    embeddings: np.ndarray  # float32 (n, dimensions), possibly memory-mapped
+    ids: np.ndarray  # int64 (n,)
+    resource_ids: np.ndarray  # int64 (n,)
+    # Per row: (chunk_type, top_level_section_index, top_level_section_title, content)
+    metadata: Tuple[Tuple, ...]
+    # (resource_id, chunk_type) -> row numbers
+    partitions: Dict[Tuple[int, Optional[str]], np.ndarray]
+
+    @property
+    def size(self) -> int:
+        return len(self.ids)
+
+    @classmethod
+    def build(
+        cls,
+        max_id: int,
+        embeddings: np.ndarray,
+        ids: np.ndarray,
+        resource_ids: np.ndarray,
+        metadata: Sequence[Tuple],
+    ) -> "VectorSnapshot":
+        rows: Dict[Tuple[int, Optional[str]], List[int]] = {}
+        for row, (resource_id, (chunk_type, *_)) in enumerate(
+            zip(resource_ids.tolist(), metadata)
+        ):
+            rows.setdefault((resource_id, chunk_type), []).append(row)
+        return cls(
+            max_id=max_id,
+            embeddings=embeddings,
+            ids=ids,
+            resource_ids=resource_ids,
+            metadata=tuple(metadata),
+            partitions={
+                key: np.array(partition_rows, dtype=np.int64)
+                for key, partition_rows in rows.items()
+            },
+        )
+
+    @classmethod
+    def from_rows(
+        cls, rows: List[Tuple], base: Optional["VectorSnapshot"] = None
+    ) -> "VectorSnapshot":
+        """Build a snapshot from db.read_chunk_vectors rows, appended to `base`."""
+        rows = [row for row in rows if row[-1] is not None]
+        metadata = [
+            (_chunk_type_value(chunk_type), section_index, section_title, content)
+            for _, _, chunk_type, section_index, section_title, content, _ in rows
+        ]
+        ids = np.array([row[0] for row in rows], dtype=np.int64)
+        resource_ids = np.array([row[1] for row in rows], dtype=np.int64)
+        embeddings = _normalize(np.array([row[-1] for row in rows], dtype=np.float32))
+        max_id = int(ids[-1]) if len(ids) else 0
+
+        if base is not None and base.size:
+            if not len(ids):
+                return base
+            embeddings = np.concatenate([base.embeddings, embeddings])
+            ids = np.concatenate([base.ids, ids])
+            resource_ids = np.concatenate([base.resource_ids, resource_ids])
+            metadata = list(base.metadata) + metadata
+            max_id = max(max_id, base.max_id)
+        return cls.build(max_id, embeddings, ids, resource_ids, metadata)
+
+    def search(self, query_vector: List[float], facets: Facets) -> List[List[ChunkHit]]:
+        query = _normalize(np.asarray(query_vector, dtype=np.float32))
+        return [self._search_facet(query, where, n) for where, n in facets]
+
+    def _search_facet(self, query: np.ndarray, where: dict, n: int) -> List[ChunkHit]:
+        if not self.size:
+            return []
+        rows = self._filter_rows(where)
+        if rows is None:
+            similarities = self.embeddings @ query
+            rows = np.arange(self.size)
+        else:
+            similarities = self.embeddings[rows] @ query
+        if not len(rows) or n <= 0:
+            return []
+
+        # Exact top-k: partial sort, then sort the k best
+        if n < len(rows):
+            best = np.argpartition(-similarities, n - 1)[:n]
+        else:
+            best = np.arange(len(rows))
+        best = best[np.argsort(-similarities[best], kind="stable")]
+
+        hits = []
+        for i in best.tolist():
+            row = int(rows[i])
+            chunk_type, section_index, section_title, content = self.metadata[row]
+            hits.append(
+                ChunkHit(
+                    int(self.ids[row]),
+                    int(self.resource_ids[row]),
+                    # Stored as its value, hits carry the enum like pgvector's
+                    ChunkType(chunk_type) if chunk_type is not None else None,
+                    section_index,
+                    section_title,
+                    content,
+                    1.0 - float(similarities[i]),
+                )
+            )
+        return hits
+
+    def _filter_rows(self, where: dict) -> Optional[np.ndarray]:
+        """The rows matching the filters, or None for all rows."""
+        unsupported = set(where) - {"resource_id", "chunk_type"}
+        if unsupported:
+            raise ValueError(f"Unsupported vector index filters: {unsupported}")
+        if not where:
+            return None
+
+        resource_ids = _as_set(where.get("resource_id"))
+        chunk_types = _as_set(where.get("chunk_type"))
+        partitions = [
+            rows
+            for (resource_id, chunk_type), rows in self.partitions.items()
+            if (resource_ids is None or resource_id in resource_ids)
+            and (chunk_types is None or chunk_type in chunk_types)
+        ]
+        if not partitions:
+            return np.empty(0, dtype=np.int64)
+        return np.concatenate(partitions)
+
+    def save(self, path: str) -> None:
+        # Written next to the old files and renamed over them, so a memory-mapped
+        # previous snapshot stays valid
+        os.makedirs(path, exist_ok=True)
+        with open(os.path.join(path, "embeddings.npy.tmp"), "wb") as f:
+            np.save(f, self.embeddings)
+        with open(os.path.join(path, "rows.npz.tmp"), "wb") as f:
+            np.savez(
+                f, max_id=self.max_id, ids=self.ids, resource_ids=self.resource_ids
+            )
+        with open(os.path.join(path, "metadata.json.tmp"), "w") as f:
+            json.dump(self.metadata, f)
+        for name in ("embeddings.npy", "rows.npz", "metadata.json"):
+            os.replace(os.path.join(path, f"{name}.tmp"), os.path.join(path, name))
+
+    @classmethod
+    def load(cls, path: str) -> "VectorSnapshot":
+        embeddings = np.load(os.path.join(path, "embeddings.npy"), mmap_mode="r")
+        with np.load(os.path.join(path, "rows.npz")) as rows:
+            max_id = int(rows["max_id"])
+            ids = rows["ids"]
+            resource_ids = rows["resource_ids"]
+        with open(os.path.join(path, "metadata.json")) as f:
+            metadata = [tuple(row) for row in json.load(f)]
+        return cls.build(max_id, embeddings, ids, resource_ids, metadata)
+
+
+class NumpyVectorIndex(VectorIndex):
+    """
+    Exact, in-process search over a float32 matrix of the chunk embeddings,
+    partitioned by (resource_id, chunk_type) so a search only scores the rows
+    that pass its filters.
+
+    It is built from the chunks table at startup, or loaded (memory-mapped)
+    from `snapshot_path` if a snapshot exists. Every `refresh_interval`
+    seconds new chunks are appended; if chunks were deleted the index is
+    rebuilt. Only resource_id and chunk_type filters are supported.
+    """
+
+    def __init__(self, snapshot_path: Optional[str], refresh_interval: float):
+        self.logger = logging.getLogger(__name__)
+        self.snapshot_path = snapshot_path
+        self.refresh_interval = refresh_interval
+        self._snapshot: Optional[VectorSnapshot] = None
+        self._lock = asyncio.Lock()
+        self._task: Optional[asyncio.Task] = None
+
+    async def setup(self) -> None:
+        if self.snapshot_path and os.path.exists(
+            os.path.join(self.snapshot_path, "embeddings.npy")
+        ):
+            self._snapshot = await asyncio.to_thread(
+                VectorSnapshot.load, self.snapshot_path
+            )
+            self.logger.info(
+                f"Vector index loaded {self._snapshot.size} chunks from {self.snapshot_path}"
+            )
+        await self.refresh()
+        self._task = asyncio.create_task(self._refresh_loop())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def search(
+        self, query_vector: List[float], facets: Facets
+    ) -> List[List[ChunkHit]]:
+        if self._snapshot is None:
+            await self.refresh()
+        snapshot = self._snapshot
+        assert snapshot is not None
+        # NumPy releases the GIL for the matrix products
+        return await asyncio.to_thread(snapshot.search, query_vector, facets)
+
+    async def refresh(self) -> None:
+        """Append new chunks, or rebuild the index if chunks were removed."""
+        async with self._lock:
+            count, max_id = await db.read_chunk_stats()
+            snapshot = self._snapshot
+            if snapshot is not None and snapshot.max_id == max_id:
+                if snapshot.size == count:
+                    return
+
+            rows = await db.read_chunk_vectors(
+                after_id=snapshot.max_id if snapshot else 0
+            )
+            base = snapshot
+            if snapshot is not None and snapshot.size + len(rows) != count:
+                # Chunks were deleted (or an older chunk got its embedding), rebuild
+                rows = await db.read_chunk_vectors()
+                base = None
+
+            self._snapshot = await asyncio.to_thread(
+                VectorSnapshot.from_rows, rows, base
+            )
+            self.logger.info(
+                f"Vector index refreshed: {self._snapshot.size} chunks, "
+                f"{len(self._snapshot.partitions)} partitions"
+            )
+            if self.snapshot_path:
+                await asyncio.to_thread(self._snapshot.save, self.snapshot_path)
+
+    async def _refresh_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.refresh_interval)
+            try:
+                await self.refresh()
+            except Exception as e:
+                self.logger.error(f"Failed to refresh the vector index: {str(e)}")
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+def _chunk_type_value(chunk_type) -> Optional[str]:
+    return getattr(chunk_type, "value", chunk_type)
+
+
+def _as_set(value) -> Optional[set]:
+    if value is None:
+        return None
+    values = value if isinstance(value, list) else [value]
+    return {_chunk_type_value(v) for v in values}
+
+
+def create_vector_index() -> VectorIndex:
+    if settings.vector_index_backend == "numpy":
+        return NumpyVectorIndex(
+            snapshot_path=settings.vector_index_snapshot_path,
+            refresh_interval=settings.vector_index_refresh_interval,
+        )
+    return PgVectorIndex()
+
+
+vector_index = create_vector_index()
@@ -69,6 +69,13 @@ class WhatsAppClient:
             status_code=400,
         )
 
+    def handle_duplicate_message(self, body: dict) -> JSONResponse:
+        self.logger.info("Received a message that was already handled. Ignoring.")
+        return JSONResponse(
+            content={"status": "ok", "message": "Duplicate message"},
+            status_code=200,
+        )
+
     def handle_status_update(self, body: dict) -> JSONResponse:
         """
         Handles WhatsApp status updates (sent, delivered, read).
@@ -1,11 +1,11 @@
 import logging
 from typing import List, Optional
 
-from app.database import db
+from app.services.catalog_service import catalog_client
 from app.utils.llm_utils import async_llm_request
 from app.utils.prompt_manager import prompt_manager
-from app.database.db import vector_search
-from app.database.models import Chunk, Resource
+from app.database.db import vector_search_multi
+from app.database.models import ChunkHit, Resource
 from app.config import llm_settings
 from app.database.enums import ChunkType
 
@@ -20,25 +20,23 @@ async def generate_exercise(
     try:
         class_id = int(class_id)
         # Retrieve the resources for the class
-        resource_ids = await db.get_class_resources(class_id)
+        catalog = await catalog_client.get()
+        resource_ids = catalog.get_class_resources(class_id)
         assert resource_ids
 
         # Retrieve the relevant content and exercises
-        retrieved_content = await vector_search(
+        retrieved_content, retrieved_exercises = await vector_search_multi(
             query=query,
-            n_results=7,
-            where={
-                "chunk_type": [ChunkType.text],
-                "resource_id": resource_ids,
-            },
-        )
-        retrieved_exercises = await vector_search(
-            query=query,
-            n_results=3,
-            where={
-                "chunk_type": [ChunkType.exercise],
-                "resource_id": resource_ids,
-            },
+            facets=[
+                (
+                    {"chunk_type": [ChunkType.text], "resource_id": resource_ids},
+                    7,
+                ),
+                (
+                    {"chunk_type": [ChunkType.exercise], "resource_id": resource_ids},
+                    3,
+                ),
+            ],
         )
 
         logger.debug(
@@ -81,8 +79,8 @@ async def generate_exercise(
 
 
 def _format_context(
-    retrieved_content: List[Chunk],
-    retrieved_exercise: List[Chunk],
+    retrieved_content: List[ChunkHit],
+    retrieved_exercise: List[ChunkHit],
     resources: Optional[List[Resource]] = None,
 ):
     # Formatting the context
@@ -1,9 +1,9 @@
 import logging
 from typing import List, Optional
 from app.database.db import vector_search
-from app.database.models import Chunk, Resource
+from app.database.models import ChunkHit, Resource
 from app.database.enums import ChunkType
-import app.database.db as db
+from app.services.catalog_service import catalog_client
 
 logger = logging.getLogger(__name__)
 
@@ -15,7 +15,8 @@ async def search_knowledge(
     try:
         class_id = int(class_id)
         # Retrieve the resources for the class
-        resource_ids = await db.get_class_resources(class_id)
+        catalog = await catalog_client.get()
+        resource_ids = catalog.get_class_resources(class_id)
         assert resource_ids
 
         # Retrieve the relevant content
@@ -39,7 +40,7 @@ async def search_knowledge(
 
 
 def _format_context(
-    retrieved_content: List[Chunk],
+    retrieved_content: List[ChunkHit],
     resources: Optional[List[Resource]] = None,
 ) -> str:
     # Formatting the context
@@ -0,0 +1,77 @@
+import logging
+from typing import List
+
+from app.config import llm_settings
+from app.database.enums import MessageRole
+from app.database.models import Message
+from app.utils.llm_utils import num_tokens_from_message
+
+logger = logging.getLogger(__name__)
+
+
+def get_message_token_count(message: Message) -> int:
+    """The token count stored with the message, counted (and kept) if missing."""
+    if message.token_count is None:
+        message.token_count = num_tokens_from_message(message.to_api_format())
+    return message.token_count
+
+
+def get_context_budget(model: str) -> int:
+    """Tokens available for the prompt, leaving room for the model's reply."""
+    budget = llm_settings.llm_context_budgets.get(
+        model, llm_settings.llm_default_context_budget
+    )
+    return budget - llm_settings.llm_response_token_reserve
+
+
+def group_tool_calls(messages: List[Message]) -> List[List[Message]]:
+    """
+    Split chronological messages into groups that must be kept or dropped
+    together: a message plus the tool responses that follow it. Tool responses
+    whose tool call was cut off are dropped, since the API rejects them.
+    """
+    groups: List[List[Message]] = []
+    for message in messages:
+        if message.role == MessageRole.tool:
+            if groups:
+                groups[-1].append(message)
+            continue
+        groups.append([message])
+    return groups
+
+
+def pack_context(
+    system_message: dict,
+    history: List[Message],
+    current: List[Message],
+    budget: int,
+) -> List[dict]:
+    """
+    Build the API messages from the system prompt, as much of the newest history
+    as fits in the token budget, and the current messages (which always go in).
+    """
+    used = num_tokens_from_message(system_message)
+    used += sum(get_message_token_count(message) for message in current)
+    if used > budget:
+        logger.warning(
+            f"System prompt and current messages use {used} tokens, "
+            f"more than the {budget} token budget"
+        )
+
+    packed_groups: List[List[Message]] = []
+    for group in reversed(group_tool_calls(history)):
+        group_tokens = sum(get_message_token_count(message) for message in group)
+        if used + group_tokens > budget:
+            break
+        used += group_tokens
+        packed_groups.append(group)
+
+    packed_history = [message for group in reversed(packed_groups) for message in group]
+    logger.debug(
+        f"Packed {len(packed_history)}/{len(history)} history messages, {used} tokens"
+    )
+    return [
+        system_message,
+        *(message.to_api_format() for message in packed_history),
+        *(message.to_api_format() for message in current),
+    ]
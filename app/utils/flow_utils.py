@@ -8,30 +8,39 @@ from cryptography.hazmat.primitives.asymmetric import padding as asym_padding
 from cryptography.hazmat.primitives.asymmetric import rsa
 
 import logging
+from functools import lru_cache
 
 import httpx
 from app.config import settings
-from cryptography.fernet import Fernet
+from cryptography.fernet import Fernet, MultiFernet
 
 from app.database.models import User
 
 logger = logging.getLogger(__name__)
 
 
-def decrypt_aes_key(encrypted_aes_key: str) -> bytes:
-    assert (
-        settings.whatsapp_business_private_key
-        and settings.whatsapp_business_private_key_password
-    )
-    assert (
-        settings.whatsapp_business_private_key.get_secret_value().strip()
-        and settings.whatsapp_business_private_key_password.get_secret_value().strip()
-    )
-    private_key_pem = settings.whatsapp_business_private_key.get_secret_value()
+def load_business_private_key() -> rsa.RSAPrivateKey:
+    """
+    Deserialize the WhatsApp business private key, from the key file if one is
+    configured and from the environment otherwise. This is slow (the key is
+    password protected), so FlowCrypto calls it once and caches the result.
+    """
+    assert settings.whatsapp_business_private_key_password
     password = settings.whatsapp_business_private_key_password.get_secret_value()
+    assert password.strip()
+
+    if settings.whatsapp_business_private_key_path:
+        with open(settings.whatsapp_business_private_key_path, "rb") as f:
+            private_key_pem = f.read()
+    else:
+        assert settings.whatsapp_business_private_key
+        assert settings.whatsapp_business_private_key.get_secret_value().strip()
+        private_key_pem = (
+            settings.whatsapp_business_private_key.get_secret_value().encode()
+        )
 
     private_key = serialization.load_pem_private_key(
-        private_key_pem.encode(),
+        private_key_pem,
         password=password.encode(),
         backend=default_backend(),
     )
@@ -40,16 +49,27 @@ def decrypt_aes_key(encrypted_aes_key: str) -> bytes:
     if not isinstance(private_key, rsa.RSAPrivateKey):
         raise ValueError("Private key must be an RSA key")
 
-    decrypted_key = private_key.decrypt(
-        base64.b64decode(encrypted_aes_key),
-        asym_padding.OAEP(
-            mgf=asym_padding.MGF1(algorithm=hashes.SHA256()),
-            algorithm=hashes.SHA256(),
-            label=None,
-        ),
-    )
-
-    return decrypted_key
+    return private_key
+
+
+def decrypt_aes_key(
+    encrypted_aes_key: str, private_keys: List[rsa.RSAPrivateKey]
+) -> bytes:
+    """Decrypt the AES key with the first private key that works."""
+    error: Optional[Exception] = None
+    for private_key in private_keys:
+        try:
+            return private_key.decrypt(
+                base64.b64decode(encrypted_aes_key),
+                asym_padding.OAEP(
+                    mgf=asym_padding.MGF1(algorithm=hashes.SHA256()),
+                    algorithm=hashes.SHA256(),
+                    label=None,
+                ),
+            )
+        except ValueError as e:
+            error = e
+    raise error or ValueError("No private key available")
 
 
 def decrypt_payload(encrypted_data: str, aes_key: bytes, iv: str) -> dict:
@@ -81,7 +101,13 @@ def encrypt_response(response: dict, aes_key: bytes, iv: str) -> str:
     return base64.b64encode(encrypted_data_bytes).decode("utf-8")
 
 
-async def decrypt_flow_request(body: dict) -> Tuple[dict, bytes, str]:
+def decrypt_flow_request(
+    body: dict, private_keys: List[rsa.RSAPrivateKey]
+) -> Tuple[dict, bytes, str]:
+    """
+    Decrypt a flow request. This is CPU heavy, use flow_crypto.decrypt_request
+    to run it off the event loop.
+    """
     try:
         # Validate required fields exist
         required_fields = {"encrypted_flow_data", "encrypted_aes_key", "initial_vector"}
@@ -101,7 +127,7 @@ async def decrypt_flow_request(body: dict) -> Tuple[dict, bytes, str]:
         if not isinstance(initial_vector, str):
             raise ValueError("initial_vector must be a string")
 
-        aes_key = decrypt_aes_key(encrypted_aes_key)
+        aes_key = decrypt_aes_key(encrypted_aes_key, private_keys)
         decrypted_payload = decrypt_payload(
             encrypted_flow_data, aes_key, initial_vector
         )
@@ -124,6 +150,20 @@ def get_fernet_key() -> bytes:
     return key
 
 
+@lru_cache(maxsize=1)
+def get_fernet() -> MultiFernet:
+    """
+    Tokens are encrypted with the current key and can be decrypted with the
+    current or any previous key, so rotating the key doesn't break flows that
+    are already open on a teacher's phone.
+    """
+    keys = [get_fernet_key()]
+    if settings.flow_token_previous_keys:
+        previous = settings.flow_token_previous_keys.get_secret_value().split(",")
+        keys.extend(key.strip().encode("utf-8") for key in previous if key.strip())
+    return MultiFernet([Fernet(key) for key in keys])
+
+
 class FlowTokenError(Exception):
     """Base exception for flow token related errors."""
 
@@ -141,9 +181,11 @@ def decrypt_flow_token(encrypted_flow_token: str) -> Tuple[str, str]:
     """
 
     try:
-        fernet = Fernet(get_fernet_key())
-        decrypted_str = fernet.decrypt(encrypted_flow_token.encode("utf-8")).decode(
-            "utf-8"
+        # Expired tokens raise InvalidToken, like tampered ones
+        decrypted_str = (
+            get_fernet()
+            .decrypt(encrypted_flow_token.encode("utf-8"), ttl=settings.flow_token_ttl)
+            .decode("utf-8")
         )
 
         parts = decrypted_str.split("_")
@@ -160,14 +202,22 @@ def decrypt_flow_token(encrypted_flow_token: str) -> Tuple[str, str]:
         raise FlowTokenError("Token decryption failed")
 
 
-def encrypt_flow_token(wa_id: str, flow_id: str) -> str:
-    key = get_fernet_key()
-    fernet = Fernet(key)
+def get_flow_token_expiry(encrypted_flow_token: str) -> Optional[float]:
+    """
+    Returns the Unix time at which a flow token expires, or None if tokens
+    never expire. The token must have been decrypted successfully before.
+    """
+    if settings.flow_token_ttl is None:
+        return None
+    issued_at = get_fernet().extract_timestamp(encrypted_flow_token.encode("utf-8"))
+    return issued_at + settings.flow_token_ttl
 
+
+def encrypt_flow_token(wa_id: str, flow_id: str) -> str:
     logger.debug(f"Encrypting wa_id: {wa_id} and flow_id: {flow_id}")
 
     data = f"{wa_id}_{flow_id}".encode("utf-8")
-    encrypted_data = fernet.encrypt(data)
+    encrypted_data = get_fernet().encrypt(data)
     return encrypted_data.decode("utf-8")
 
 
@@ -1,3 +1,4 @@
+from functools import lru_cache
 from typing import List
 import json
 import logging
@@ -21,27 +22,43 @@ elif llm_settings.ai_provider == "openai" and llm_settings.llm_api_key:
     llm_client = openai.AsyncOpenAI(api_key=llm_settings.llm_api_key.get_secret_value())
 
 
+@lru_cache(maxsize=None)
+def get_encoding(encoding_name: str = "cl100k_base") -> tiktoken.Encoding:
+    """Loading an encoding is slow, so each one is only loaded once."""
+    return tiktoken.get_encoding(encoding_name)
+
+
 def num_tokens_from_string(string: str, encoding_name: str = "cl100k_base") -> int:
     """This returns the number of OpenAI-equivalent tokens in a text string."""
-    encoding = tiktoken.get_encoding(encoding_name)
+    encoding = get_encoding(encoding_name)
     num_tokens = len(encoding.encode(string))
     return num_tokens
 
 
+def num_tokens_from_message(message: dict, encoding_name: str = "cl100k_base") -> int:
+    """Return the number of tokens used by a single message in the API format."""
+    tokens_per_message = 3
+    tokens_per_name = 1
+
+    num_tokens = tokens_per_message
+    for key, value in message.items():
+        if value is None:
+            continue
+        if not isinstance(value, str):
+            value = json.dumps(value)  # e.g. tool calls
+        num_tokens += num_tokens_from_string(value, encoding_name)
+        if key == "name":
+            num_tokens += tokens_per_name
+    return num_tokens
+
+
 def num_tokens_from_messages(
     messages: List[dict], encoding_name: str = "cl100k_base"
 ) -> int:
     """Return the number of tokens used by a list of messages in the format sent to the OpenAI or Groq API."""
-    tokens_per_message = 3
-    tokens_per_name = 1
-
-    num_tokens = 0
-    for message in messages:
-        num_tokens += tokens_per_message
-        for key, value in message.items():
-            num_tokens += num_tokens_from_string(value, encoding_name)
-            if key == "name":
-                num_tokens += tokens_per_name
+    num_tokens = sum(
+        num_tokens_from_message(message, encoding_name) for message in messages
+    )
     num_tokens += 3  # every reply is primed with <|start|>assistant<|message|>
     return num_tokens
 
@@ -0,0 +1,48 @@
+import time
+from typing import Optional
+
+import orjson
+from fastapi import Request
+
+from app.utils.whatsapp_utils import RequestType, get_request_type
+
+
+class RequestEnvelope:
+    """
+    Request-scoped view of an incoming webhook body.
+
+    The raw bytes are read once and shared by the signature checks, the rate
+    limiter, the request classification and the handlers. Parsing and
+    classification happen lazily and are cached on the envelope.
+    """
+
+    __slots__ = ("raw", "received_at", "_body", "_request_type")
+
+    def __init__(self, raw: bytes, received_at: Optional[float] = None):
+        self.raw = raw
+        # Messages are checked for staleness against the time the webhook got them
+        self.received_at = received_at or time.time()
+        self._body: Optional[dict] = None
+        self._request_type: Optional[RequestType] = None
+
+    @property
+    def body(self) -> dict:
+        """The parsed JSON body. Raises orjson.JSONDecodeError (a ValueError)."""
+        if self._body is None:
+            self._body = orjson.loads(self.raw)
+        return self._body
+
+    @property
+    def request_type(self) -> RequestType:
+        if self._request_type is None:
+            self._request_type = get_request_type(self.body, self.received_at)
+        return self._request_type
+
+
+async def get_request_envelope(request: Request) -> RequestEnvelope:
+    """Get the envelope for this request, creating it on first use."""
+    envelope = getattr(request.state, "envelope", None)
+    if envelope is None:
+        envelope = RequestEnvelope(await request.body())
+        request.state.envelope = envelope
+    return envelope
@@ -1,7 +1,7 @@
 from datetime import datetime
 from enum import Enum, auto
 import re
-from typing import Any, List, Optional
+from typing import Any, Iterator, List, Optional
 import logging
 
 from app.models.message_models import (
@@ -185,8 +185,14 @@ def extract_message_info(body: dict) -> dict:
     }
 
 
-def is_message_outdated(message_timestamp: int) -> bool:
-    current_timestamp = int(datetime.now().timestamp())
+def is_message_outdated(
+    message_timestamp: int, received_at: Optional[float] = None
+) -> bool:
+    """
+    Check if the message was already old when we received it. Pass the time the
+    webhook received the request so that queueing delays don't count.
+    """
+    current_timestamp = int(received_at or datetime.now().timestamp())
     return current_timestamp - message_timestamp >= 10
 
 
@@ -278,7 +284,7 @@ def get_valid_message_type(message_info: dict) -> ValidMessageType:
     return ValidMessageType.CHAT
 
 
-def get_request_type(body: dict) -> RequestType:
+def get_request_type(body: dict, received_at: Optional[float] = None) -> RequestType:
     try:
         if is_flow_event(body):  # Various standard Flow events
             return RequestType.FLOW_EVENT
@@ -292,7 +298,7 @@ def get_request_type(body: dict) -> RequestType:
         # For valid WhatsApp messages, extract the message info
         message_info = extract_message_info(body)
 
-        if is_message_outdated(message_info["timestamp"]):
+        if is_message_outdated(message_info["timestamp"], received_at):
             return RequestType.OUTDATED
 
     except Exception as e:
@@ -300,3 +306,70 @@ def get_request_type(body: dict) -> RequestType:
         raise
 
     return RequestType.VALID_MESSAGE
+
+
+def iter_webhook_items(body: dict) -> Iterator[dict]:
+    """
+    Split a webhook body into single-item webhook bodies.
+
+    Meta may batch several entries, changes, messages and statuses in one POST.
+    Every message and status is yielded as its own body (with the matching
+    contact), shaped like a regular single-message webhook so the rest of the
+    request handling can keep looking at entry[0].changes[0].
+    Anything that can't be split (flow events, malformed bodies) is yielded as is.
+    """
+    entries = body.get("entry") if isinstance(body, dict) else None
+    if not isinstance(entries, list) or not entries:
+        yield body
+        return
+
+    for entry in entries:
+        for change in entry.get("changes") or [{}]:
+            value = change.get("value") or {}
+            messages = value.get("messages")
+            statuses = value.get("statuses")
+
+            if messages:
+                contacts = value.get("contacts") or []
+                for message in messages:
+                    contact = next(
+                        (c for c in contacts if c.get("wa_id") == message.get("from")),
+                        contacts[0] if contacts else None,
+                    )
+                    yield _single_item_body(
+                        body,
+                        entry,
+                        change,
+                        {
+                            **value,
+                            "messages": [message],
+                            "contacts": [contact] if contact else [],
+                        },
+                    )
+            elif statuses:
+                for status in statuses:
+                    yield _single_item_body(
+                        body, entry, change, {**value, "statuses": [status]}
+                    )
+            else:
+                yield _single_item_body(body, entry, change, value)
+
+
+def _single_item_body(body: dict, entry: dict, change: dict, value: dict) -> dict:
+    return {
+        **body,
+        "entry": [{**entry, "changes": [{**change, "value": value}]}],
+    }
+
+
+def get_item_wa_id(item: dict) -> Optional[str]:
+    """Get the WhatsApp ID of the user a single-item webhook body is about."""
+    try:
+        value = item["entry"][0]["changes"][0]["value"]
+        if value.get("messages"):
+            return value["messages"][0].get("from")
+        if value.get("statuses"):
+            return value["statuses"][0].get("recipient_id")
+    except (IndexError, KeyError, TypeError, AttributeError):
+        pass
+    return None
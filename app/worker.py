@@ -0,0 +1,77 @@
+"""
+Standalone entry point for the inbound workers.
+
+Run it next to the API (with RUN_INBOUND_WORKERS_IN_APP=False) to process the
+webhook queue in separate processes:
+
+    uv run python -m app.worker --concurrency 10
+
+Only the Redis stream queue (production/staging) can be shared between
+processes. Locally the API process runs the workers itself.
+"""
+
+import argparse
+import asyncio
+import logging
+import signal
+
+from app.config import Environment, settings
+from app.database.engine import db_engine, init_db
+from app.redis.engine import disconnect_redis, init_redis
+from app.services.inbound_queue_service import InboundWorkerPool, inbound_queue
+from app.services.request_service import handle_request
+from app.services.catalog_service import catalog_client
+from app.services.message_journal_service import message_journal
+from app.services.user_cache_service import user_cache
+from app.services.vector_index_service import vector_index
+
+logger = logging.getLogger(__name__)
+
+
+async def run_workers(concurrency: int) -> None:
+    if settings.environment not in (Environment.PRODUCTION, Environment.STAGING):
+        raise RuntimeError(
+            "Standalone workers need the Redis stream queue (production/staging)"
+        )
+
+    await init_db()
+    await init_redis()
+    await catalog_client.setup()
+    await vector_index.setup()
+    await user_cache.setup()
+
+    pool = InboundWorkerPool(inbound_queue, handle_request, concurrency)
+
+    stop_event = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop_event.set)
+
+    try:
+        await pool.start()
+        logger.info("Inbound workers running 🦒")
+        await stop_event.wait()
+    finally:
+        await pool.stop()
+        await catalog_client.stop()
+        await vector_index.stop()
+        await user_cache.stop()
+        await message_journal.stop()
+        await db_engine.dispose()
+        await disconnect_redis()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Run the Twiga inbound workers.")
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        default=settings.inbound_worker_concurrency,
+        help="Number of webhook requests processed concurrently",
+    )
+    args = parser.parse_args()
+    asyncio.run(run_workers(args.concurrency))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""add partial chunk embedding indexes
+
+Revision ID: 8c4d1e2f7a90
+Revises: 3f2a9c7e4b1d
+Create Date: 2026-10-17 11:03:52.640117
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = "8c4d1e2f7a90"
+down_revision: Union[str, None] = "3f2a9c7e4b1d"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # Built concurrently so the chunks table stays usable while they are built
+    with op.get_context().autocommit_block():
+        op.create_index(
+            "chunk_embedding_text_idx",
+            "chunks",
+            ["embedding"],
+            unique=False,
+            postgresql_using="hnsw",
+            postgresql_with={"m": 16, "ef_construction": 64},
+            postgresql_ops={"embedding": "vector_cosine_ops"},
+            postgresql_where=sa.text("chunk_type = 'text'"),
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+        op.create_index(
+            "chunk_embedding_exercise_idx",
+            "chunks",
+            ["embedding"],
+            unique=False,
+            postgresql_using="hnsw",
+            postgresql_with={"m": 16, "ef_construction": 64},
+            postgresql_ops={"embedding": "vector_cosine_ops"},
+            postgresql_where=sa.text("chunk_type = 'exercise'"),
+            postgresql_concurrently=True,
+            if_not_exists=True,
+        )
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        op.drop_index(
+            "chunk_embedding_exercise_idx",
+            table_name="chunks",
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
+        op.drop_index(
+            "chunk_embedding_text_idx",
+            table_name="chunks",
+            postgresql_concurrently=True,
+            if_exists=True,
+        )
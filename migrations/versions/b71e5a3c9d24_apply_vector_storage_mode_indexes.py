@@ -0,0 +1,102 @@
+"""apply vector storage mode indexes
+
+Revision ID: b71e5a3c9d24
+Revises: 8c4d1e2f7a90
+Create Date: 2026-10-17 13:27:08.954311
+
+"""
+
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+from app.config import settings
+
+
+# revision identifiers, used by Alembic.
+revision: str = "b71e5a3c9d24"
+down_revision: Union[str, None] = "8c4d1e2f7a90"
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+INDEXES = {
+    "full": [
+        "chunk_embedding_idx",
+        "chunk_embedding_text_idx",
+        "chunk_embedding_exercise_idx",
+    ],
+    "halfvec": ["chunk_embedding_halfvec_idx"],
+    "binary": ["chunk_embedding_binary_idx"],
+}
+
+
+def create_indexes(mode: str) -> None:
+    hnsw = {
+        "unique": False,
+        "postgresql_using": "hnsw",
+        "postgresql_with": {"m": 16, "ef_construction": 64},
+        "postgresql_concurrently": True,
+        "if_not_exists": True,
+    }
+    if mode == "halfvec":
+        op.create_index(
+            "chunk_embedding_halfvec_idx",
+            "chunks",
+            [sa.text("(embedding::halfvec(1024)) halfvec_cosine_ops")],
+            **hnsw,
+        )
+    elif mode == "binary":
+        op.create_index(
+            "chunk_embedding_binary_idx",
+            "chunks",
+            [sa.text("(binary_quantize(embedding)::bit(1024)) bit_hamming_ops")],
+            **hnsw,
+        )
+    else:
+        op.create_index(
+            "chunk_embedding_idx",
+            "chunks",
+            ["embedding"],
+            postgresql_ops={"embedding": "vector_cosine_ops"},
+            **hnsw,
+        )
+        for chunk_type in ("text", "exercise"):
+            op.create_index(
+                f"chunk_embedding_{chunk_type}_idx",
+                "chunks",
+                ["embedding"],
+                postgresql_ops={"embedding": "vector_cosine_ops"},
+                postgresql_where=sa.text(f"chunk_type = '{chunk_type}'"),
+                **hnsw,
+            )
+
+
+def drop_indexes_except(mode: str) -> None:
+    for other_mode, names in INDEXES.items():
+        if other_mode == mode:
+            continue
+        for name in names:
+            op.drop_index(
+                name,
+                table_name="chunks",
+                postgresql_concurrently=True,
+                if_exists=True,
+            )
+
+
+def upgrade() -> None:
+    # Chunk declares the HNSW indexes of VECTOR_STORAGE_MODE only (see
+    # models._chunk_embedding_indexes), so build those and drop the others.
+    # Building a quantized index quantizes every existing chunk (needs pgvector
+    # 0.7+), new chunks are quantized on insert. The new indexes are built
+    # before the old ones are dropped, concurrently so the table stays usable.
+    with op.get_context().autocommit_block():
+        create_indexes(settings.vector_storage_mode)
+        drop_indexes_except(settings.vector_storage_mode)
+
+
+def downgrade() -> None:
+    with op.get_context().autocommit_block():
+        create_indexes("full")
+        drop_indexes_except("full")
@@ -0,0 +1,128 @@
+"""
+Benchmark of the /flows endpoint before and after the FlowCrypto engine.
+
+"legacy" reproduces the previous behaviour: the password protected private key
+is deserialized on every request and RSA/AES work runs on the event loop.
+"engine" is the current FlowCrypto path (key cached, crypto in a thread pool).
+Both serve encrypted flow health checks through the app in-process, and a
+ticker measures how long the event loop is blocked while they run.
+
+Run with:
+    PYTHONPATH=. uv run python scripts/bench/flow_crypto.py
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import time
+from typing import List, Tuple
+
+import httpx
+
+import app.utils.flow_utils as futil
+from app.main import app
+from app.services.flow_crypto_service import flow_crypto
+from scripts.bench.load_test import FlowEncryptor, sign, use_ephemeral_flow_key
+from scripts.bench.stats import format_table, summarize_latencies
+
+
+class LegacyFlowCrypto:
+    """The previous per-request, on-loop crypto."""
+
+    async def decrypt_request(self, body: dict) -> Tuple[dict, bytes, str]:
+        return futil.decrypt_flow_request(body, [futil.load_business_private_key()])
+
+    async def encrypt_response(self, response: dict, aes_key: bytes, iv: str) -> str:
+        return futil.encrypt_response(response, aes_key, iv)
+
+
+async def measure_loop_lag(lags: List[float], stop: asyncio.Event) -> None:
+    interval = 0.005
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(interval)
+        lags.append((time.perf_counter() - start - interval) * 1000)
+
+
+async def run(
+    encryptor: FlowEncryptor, requests: int, concurrency: int
+) -> Tuple[float, List[float], List[float], int]:
+    bodies = [
+        json.dumps(encryptor.encrypt({"version": "3.0", "action": "ping"})).encode()
+        for _ in range(requests)
+    ]
+    latencies: List[float] = []
+    errors = 0
+    lags: List[float] = []
+    stop = asyncio.Event()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def send(client: httpx.AsyncClient, raw: bytes) -> None:
+        nonlocal errors
+        async with semaphore:
+            start = time.perf_counter()
+            response = await client.post(
+                "/flows", content=raw, headers={"X-Hub-Signature-256": sign(raw)}
+            )
+            latencies.append((time.perf_counter() - start) * 1000)
+            errors += response.status_code != 200
+
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(
+        transport=transport, base_url="http://bench"
+    ) as client:
+        ticker = asyncio.create_task(measure_loop_lag(lags, stop))
+        start = time.perf_counter()
+        await asyncio.gather(*(send(client, raw) for raw in bodies))
+        elapsed = time.perf_counter() - start
+        stop.set()
+        await ticker
+    return requests / elapsed, latencies, lags, errors
+
+
+async def main_async(args: argparse.Namespace) -> None:
+    encryptor = use_ephemeral_flow_key()
+    await flow_crypto.setup()
+
+    import app.services.flow_service as flow_service
+
+    engines = {"legacy": LegacyFlowCrypto(), "engine": flow_crypto}
+    rows = []
+    for name, engine in engines.items():
+        flow_service.flow_crypto = engine  # type: ignore
+        await run(encryptor, 20, args.concurrency)  # warm up
+        rps, latencies, lags, errors = await run(
+            encryptor, args.requests, args.concurrency
+        )
+        latency = summarize_latencies(latencies)
+        lag = summarize_latencies(lags)
+        rows.append(
+            [
+                name,
+                f"{rps:.1f}",
+                f"{latency['p50']:.1f}",
+                f"{latency['p99']:.1f}",
+                f"{lag['p99']:.1f}",
+                f"{lag['max']:.1f}",
+                str(errors),
+            ]
+        )
+    flow_service.flow_crypto = flow_crypto
+    flow_crypto.shutdown()
+
+    headers = ["crypto", "req/s", "p50 ms", "p99 ms", "loop lag p99", "max", "errors"]
+    print(format_table(headers, rows))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=20)
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""
+Benchmark of recall and latency of filtered HNSW searches per search configuration.
+
+Each configuration sets hnsw.ef_search and the pgvector iterative scan mode,
+then runs the same filtered searches through db.search_chunks (the path
+used by the tools). Results are compared with an exact search (index scans
+disabled). The filters are a resource with few chunks and one with many
+chunks, each for the text and exercise chunk types, which is where
+post-filtering an HNSW scan loses results. The query vectors are embeddings
+of random chunks, so no embedding API is needed, but the database must hold
+some chunks (see scripts/database/seed.py). Iterative scans need pgvector 0.8+.
+
+Run with:
+    PYTHONPATH=. uv run python scripts/bench/hnsw_search.py
+"""
+
+import argparse
+import asyncio
+import logging
+import time
+from typing import Any, Dict, List, Tuple
+
+from sqlalchemy import func, text
+from sqlmodel import select
+
+import app.database.db as db
+from app.config import settings
+from app.database.engine import db_engine, get_session
+from app.database.enums import ChunkType
+from app.database.models import Chunk
+from scripts.bench.stats import format_table, summarize_latencies
+
+# (name, ef_search, iterative_scan)
+CONFIGURATIONS: List[Tuple[str, int, str]] = [
+    ("ef=40", 40, "off"),
+    ("ef=100", 100, "off"),
+    ("ef=200", 200, "off"),
+    ("ef=40 relaxed", 40, "relaxed_order"),
+    ("ef=100 relaxed", 100, "relaxed_order"),
+    ("ef=100 strict", 100, "strict_order"),
+]
+
+
+async def exact_search(query_vector: Any, where: dict, k: int) -> List[int]:
+    distance = Chunk.embedding.cosine_distance(query_vector)
+    async with get_session() as session:
+        await session.execute(text("SET LOCAL enable_indexscan = off"))
+        result = await session.execute(
+            select(Chunk.id)
+            .where(*db._build_chunk_filters(where))
+            .order_by(distance)
+            .limit(k)
+        )
+        return [row[0] for row in result.all()]
+
+
+async def pick_filters() -> Dict[str, dict]:
+    """The smallest and largest resources (by chunk count), per chunk type."""
+    async with get_session() as session:
+        result = await session.execute(
+            select(Chunk.resource_id, func.count(Chunk.id))  # type: ignore
+            .group_by(Chunk.resource_id)
+            .order_by(func.count(Chunk.id))  # type: ignore
+        )
+        resources = result.all()
+    if not resources:
+        raise SystemExit("The chunks table is empty, seed the database first")
+
+    small, large = resources[0][0], resources[-1][0]
+    filters = {}
+    for chunk_type in (ChunkType.text, ChunkType.exercise):
+        filters[f"small {chunk_type.value}"] = {
+            "chunk_type": [chunk_type],
+            "resource_id": [small],
+        }
+        filters[f"large {chunk_type.value}"] = {
+            "chunk_type": [chunk_type],
+            "resource_id": [large],
+        }
+    return filters
+
+
+async def load_query_vectors(count: int) -> List[Any]:
+    async with get_session() as session:
+        result = await session.execute(
+            select(Chunk.embedding).order_by(func.random()).limit(count)
+        )
+        return [row[0] for row in result.all()]
+
+
+async def main_async(args: argparse.Namespace) -> None:
+    filters = await pick_filters()
+    query_vectors = await load_query_vectors(args.queries)
+
+    truth: Dict[str, List[List[int]]] = {name: [] for name in filters}
+    for name, where in filters.items():
+        for query_vector in query_vectors:
+            truth[name].append(await exact_search(query_vector, where, args.k))
+
+    rows = []
+    for config, ef_search, iterative_scan in CONFIGURATIONS:
+        settings.hnsw_ef_search = ef_search
+        settings.hnsw_iterative_scan = iterative_scan  # type: ignore
+        for name, where in filters.items():
+            latencies: List[float] = []
+            recalls: List[float] = []
+            short = 0
+            for query_vector, expected in zip(query_vectors, truth[name]):
+                start = time.perf_counter()
+                hits = (await db.search_chunks(query_vector, [(where, args.k)]))[0]
+                latencies.append((time.perf_counter() - start) * 1000)
+                found = {hit.id for hit in hits}
+                if expected:
+                    recalls.append(len(found & set(expected)) / len(expected))
+                short += len(hits) < len(expected)
+            latency = summarize_latencies(latencies)
+            rows.append(
+                [
+                    config,
+                    name,
+                    f"{sum(recalls) / len(recalls):.3f}" if recalls else "-",
+                    str(short),
+                    f"{latency['p50']:.2f}",
+                    f"{latency['p99']:.2f}",
+                ]
+            )
+    await db_engine.dispose()
+
+    print(f"{len(query_vectors)} queries per filter, k={args.k}")
+    headers = ["config", "filter", "recall", "short", "p50 ms", "p99 ms"]
+    print(format_table(headers, rows))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("-k", type=int, default=10)
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,419 @@
+"""
+End-to-end load test of the /webhooks and /flows endpoints.
+
+Sends signed WhatsApp webhook bodies (text messages, interactive replies,
+status updates and flow events) and encrypted flow health checks, at a fixed
+rate or as fast as the concurrency allows. Reports latency percentiles,
+throughput and error rates for each kind of request.
+
+By default the app runs in-process with the Graph API and the LLM replaced by
+local stubs, so no network is needed (only the local database). The bench
+users are created as active teachers before the run and removed afterwards,
+and the inbound processing latency (webhook received -> handled) is reported
+as well. Pass --base-url to load an already running server instead; its
+META_APP_SECRET must match, and /flows is only loaded with --flows-public-key.
+
+With --rate, latencies are measured from the time each request was scheduled,
+so a saturated server shows up as latency instead of a lower send rate.
+
+Run with:
+    PYTHONPATH=. uv run python scripts/bench/load_test.py --requests 2000 --rate 100
+"""
+
+import argparse
+import asyncio
+import base64
+import hashlib
+import hmac
+import json
+import logging
+import os
+import random
+import time
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+import httpx
+from cryptography.hazmat.primitives import hashes, serialization
+from cryptography.hazmat.primitives.asymmetric import padding, rsa
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+from pydantic import SecretStr
+
+from app.config import settings
+from scripts.bench.payloads import (
+    flow_event_webhook,
+    interactive_webhook,
+    status_webhook,
+    text_webhook,
+)
+from scripts.bench.stats import format_table, summarize_latencies
+
+KINDS = ("text", "interactive", "status", "flow_event", "flow_ping")
+DEFAULT_MIX = "text=60,interactive=10,status=20,flow_event=5,flow_ping=5"
+
+QUESTIONS = [
+    "What is weathering?",
+    "Can you give me 3 questions about map reading for form 2?",
+    "Explain the water cycle in simple words",
+    "How do I teach contour lines?",
+    "What are the types of rainfall?",
+]
+
+
+@dataclass
+class Result:
+    kind: str
+    latency_ms: float
+    status: Optional[int] = None
+    error: Optional[str] = None
+
+    @property
+    def failed(self) -> bool:
+        return self.status is None or self.status >= 400
+
+
+def parse_mix(spec: str) -> Dict[str, int]:
+    mix = {}
+    for part in spec.split(","):
+        kind, weight = part.split("=")
+        if kind not in KINDS:
+            raise ValueError(f"Unknown request kind {kind}, pick from {KINDS}")
+        mix[kind] = int(weight)
+    return mix
+
+
+def sign(raw: bytes) -> str:
+    """The X-Hub-Signature-256 header Meta sends, as checked by validate_signature."""
+    digest = hmac.new(
+        settings.meta_app_secret.get_secret_value().encode("utf-8"),
+        msg=raw,
+        digestmod=hashlib.sha256,
+    ).hexdigest()
+    return f"sha256={digest}"
+
+
+class FlowEncryptor:
+    """
+    Encrypts flow requests the way WhatsApp does: an AES-128-GCM payload with
+    the AES key wrapped by the business RSA public key (OAEP with SHA-256).
+    """
+
+    def __init__(self, public_key: rsa.RSAPublicKey):
+        self.public_key = public_key
+
+    def encrypt(self, payload: dict) -> dict:
+        aes_key = os.urandom(16)
+        iv = os.urandom(16)
+        encryptor = Cipher(algorithms.AES(aes_key), modes.GCM(iv)).encryptor()
+        data = encryptor.update(json.dumps(payload).encode("utf-8"))
+        data += encryptor.finalize() + encryptor.tag
+        encrypted_key = self.public_key.encrypt(
+            aes_key,
+            padding.OAEP(
+                mgf=padding.MGF1(algorithm=hashes.SHA256()),
+                algorithm=hashes.SHA256(),
+                label=None,
+            ),
+        )
+        return {
+            "encrypted_flow_data": base64.b64encode(data).decode("utf-8"),
+            "encrypted_aes_key": base64.b64encode(encrypted_key).decode("utf-8"),
+            "initial_vector": base64.b64encode(iv).decode("utf-8"),
+        }
+
+
+def build_request(
+    kind: str, wa_id: str, flows: Optional[FlowEncryptor]
+) -> Tuple[str, bytes]:
+    if kind == "text":
+        body = text_webhook(wa_id, random.choice(QUESTIONS))
+    elif kind == "interactive":
+        body = interactive_webhook(wa_id, "Personal Info")
+    elif kind == "status":
+        body = status_webhook(wa_id, random.choice(["sent", "delivered", "read"]))
+    elif kind == "flow_event":
+        body = flow_event_webhook()
+    else:
+        assert flows is not None
+        return "/flows", json.dumps(
+            flows.encrypt({"version": "3.0", "action": "ping"})
+        ).encode("utf-8")
+    return "/webhooks", json.dumps(body).encode("utf-8")
+
+
+async def run_load(
+    client: httpx.AsyncClient,
+    mix: Dict[str, int],
+    wa_ids: List[str],
+    flows: Optional[FlowEncryptor],
+    requests: int,
+    rate: float,
+    concurrency: int,
+) -> Tuple[List[Result], float]:
+    kinds, weights = list(mix), list(mix.values())
+    semaphore = asyncio.Semaphore(concurrency)
+    results: List[Result] = []
+
+    async def send(kind: str, scheduled: float) -> None:
+        path, raw = build_request(kind, random.choice(wa_ids), flows)
+        headers = {"Content-Type": "application/json", "X-Hub-Signature-256": sign(raw)}
+        try:
+            response = await client.post(path, content=raw, headers=headers)
+            latency = (time.perf_counter() - scheduled) * 1000
+            results.append(Result(kind, latency, status=response.status_code))
+        except Exception as e:
+            latency = (time.perf_counter() - scheduled) * 1000
+            results.append(Result(kind, latency, error=type(e).__name__))
+        finally:
+            semaphore.release()
+
+    tasks = []
+    start = time.perf_counter()
+    for i in range(requests):
+        scheduled = time.perf_counter()
+        if rate:
+            scheduled = start + i / rate
+            delay = scheduled - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+        await semaphore.acquire()
+        kind = random.choices(kinds, weights)[0]
+        tasks.append(asyncio.create_task(send(kind, scheduled)))
+    await asyncio.gather(*tasks)
+    return results, time.perf_counter() - start
+
+
+def report(results: List[Result], elapsed: float) -> str:
+    rows = []
+    groups = {kind: [r for r in results if r.kind == kind] for kind in KINDS}
+    groups["all"] = results
+    for kind, group in groups.items():
+        if not group:
+            continue
+        errors = sum(r.failed for r in group)
+        latency = summarize_latencies([r.latency_ms for r in group])
+        rows.append(
+            [
+                kind,
+                str(len(group)),
+                str(errors),
+                f"{errors / len(group):.1%}",
+                *(f"{latency[p]:.1f}" for p in ("p50", "p95", "p99", "max")),
+            ]
+        )
+    headers = ["kind", "requests", "errors", "err %", "p50 ms", "p95", "p99", "max"]
+    lines = [
+        format_table(headers, rows),
+        f"\n{len(results)} requests in {elapsed:.2f}s "
+        f"({len(results) / elapsed:.1f} req/s)",
+    ]
+    failures: Dict[str, int] = {}
+    for r in results:
+        if r.failed:
+            key = r.error or str(r.status)
+            failures[key] = failures.get(key, 0) + 1
+    if failures:
+        lines.append(f"Failures: {failures}")
+    return "\n".join(lines)
+
+
+def chat_completion(model: str) -> dict:
+    return {
+        "id": "chatcmpl-stub",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": model,
+        "choices": [
+            {
+                "index": 0,
+                "finish_reason": "stop",
+                "message": {
+                    "role": "assistant",
+                    "content": "This is a stubbed answer from the load test.",
+                    "tool_calls": [],
+                },
+            }
+        ],
+        "usage": {"prompt_tokens": 500, "completion_tokens": 50, "total_tokens": 550},
+    }
+
+
+def install_stubs(llm_latency: float, graph_latency: float) -> None:
+    """Point the Graph API and LLM clients at local stubs with simulated latency."""
+    import openai
+
+    import app.utils.llm_utils as llm_utils
+    from app.services.whatsapp_service import whatsapp_client
+
+    async def graph_api(request: httpx.Request) -> httpx.Response:
+        await asyncio.sleep(graph_latency)
+        return httpx.Response(
+            200,
+            json={"messaging_product": "whatsapp", "messages": [{"id": "wamid.STUB"}]},
+        )
+
+    async def llm_api(request: httpx.Request) -> httpx.Response:
+        await asyncio.sleep(llm_latency)
+        model = json.loads(request.content).get("model", "stub")
+        return httpx.Response(200, json=chat_completion(model))
+
+    graph_transport = httpx.MockTransport(graph_api)
+
+    class StubbedAsyncClient(httpx.AsyncClient):
+        def __init__(self, *args, **kwargs):
+            kwargs.setdefault("transport", graph_transport)
+            super().__init__(*args, **kwargs)
+
+    # Clients created on the fly (e.g. when sending flows) go to the stub too
+    httpx.AsyncClient = StubbedAsyncClient  # type: ignore
+    whatsapp_client.client = StubbedAsyncClient(base_url=whatsapp_client.url)
+    llm_utils.llm_client = openai.AsyncOpenAI(
+        api_key="stub",
+        base_url="http://llm.stub/v1",
+        http_client=httpx.AsyncClient(transport=httpx.MockTransport(llm_api)),
+    )
+
+
+def use_ephemeral_flow_key() -> FlowEncryptor:
+    """Give the app a throwaway business key pair so /flows can be decrypted."""
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    password = "load-test"
+    pem = private_key.private_bytes(
+        encoding=serialization.Encoding.PEM,
+        format=serialization.PrivateFormat.PKCS8,
+        encryption_algorithm=serialization.BestAvailableEncryption(password.encode()),
+    )
+    settings.whatsapp_business_private_key = SecretStr(pem.decode("utf-8"))
+    settings.whatsapp_business_private_key_password = SecretStr(password)
+    return FlowEncryptor(private_key.public_key())
+
+
+async def seed_users(wa_ids: List[str]) -> None:
+    import app.database.db as db
+    from app.database.enums import OnboardingState, UserState
+
+    for i, wa_id in enumerate(wa_ids):
+        user = await db.get_or_create_user(wa_id, f"Load Test {i}")
+        user.state = UserState.active
+        user.onboarding_state = OnboardingState.completed
+        await db.update_user(user)
+
+
+async def remove_users(wa_ids: List[str]) -> None:
+    from sqlmodel import delete
+
+    from app.database.engine import get_session
+    from app.database.models import User
+
+    async with get_session() as session:
+        await session.execute(delete(User).where(User.wa_id.in_(wa_ids)))  # type: ignore
+        await session.commit()
+
+
+async def run_in_process(
+    args: argparse.Namespace, mix: Dict[str, int], wa_ids: List[str]
+) -> None:
+    from app.main import app, inbound_workers
+
+    install_stubs(args.llm_latency, args.graph_latency)
+    flows = use_ephemeral_flow_key() if "flow_ping" in mix else None
+
+    # Time every webhook from the moment it was received until it was handled
+    processing: List[float] = []
+    handler = inbound_workers.handler
+
+    async def timed_handler(envelope):
+        try:
+            return await handler(envelope)
+        finally:
+            processing.append((time.time() - envelope.received_at) * 1000)
+
+    inbound_workers.handler = timed_handler
+
+    async with app.router.lifespan_context(app):
+        await seed_users(wa_ids)
+        try:
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(
+                transport=transport, base_url="http://load-test", timeout=60
+            ) as client:
+                results, elapsed = await run_load(
+                    client,
+                    mix,
+                    wa_ids,
+                    flows,
+                    args.requests,
+                    args.rate,
+                    args.concurrency,
+                )
+
+            accepted = sum(
+                1 for r in results if r.kind != "flow_ping" and r.status == 200
+            )
+            deadline = time.monotonic() + args.drain_timeout
+            while len(processing) < accepted and time.monotonic() < deadline:
+                await asyncio.sleep(0.1)
+        finally:
+            if not args.keep_users:
+                await remove_users(wa_ids)
+
+    print(report(results, elapsed))
+    latency = summarize_latencies(processing)
+    print(
+        f"Inbound processing: {len(processing)}/{accepted} handled, "
+        + ", ".join(f"{p} {v:.1f} ms" for p, v in latency.items())
+    )
+
+
+async def run_remote(
+    args: argparse.Namespace, mix: Dict[str, int], wa_ids: List[str]
+) -> None:
+    flows = None
+    if args.flows_public_key:
+        with open(args.flows_public_key, "rb") as f:
+            public_key = serialization.load_pem_public_key(f.read())
+        assert isinstance(public_key, rsa.RSAPublicKey)
+        flows = FlowEncryptor(public_key)
+    elif mix.pop("flow_ping", None):
+        print("No --flows-public-key given, not loading /flows")
+
+    async with httpx.AsyncClient(base_url=args.base_url, timeout=60) as client:
+        results, elapsed = await run_load(
+            client, mix, wa_ids, flows, args.requests, args.rate, args.concurrency
+        )
+    print(report(results, elapsed))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--requests", type=int, default=1000)
+    parser.add_argument(
+        "--rate", type=float, default=0, help="Requests per second (0 = unbounded)"
+    )
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--users", type=int, default=100)
+    parser.add_argument("--mix", default=DEFAULT_MIX, help="Weights per request kind")
+    parser.add_argument("--base-url", help="Load a running server instead")
+    parser.add_argument("--flows-public-key", help="PEM public key for --base-url")
+    parser.add_argument("--llm-latency", type=float, default=1.0, help="Seconds")
+    parser.add_argument("--graph-latency", type=float, default=0.1, help="Seconds")
+    parser.add_argument("--drain-timeout", type=float, default=60, help="Seconds")
+    parser.add_argument("--keep-users", action="store_true")
+    parser.add_argument("--verbose", action="store_true", help="Show app logs")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    if not args.verbose:
+        logging.disable(logging.INFO)
+
+    mix = parse_mix(args.mix)
+    wa_ids = [f"25599{i:07d}" for i in range(args.users)]
+    if args.base_url:
+        asyncio.run(run_remote(args, mix, wa_ids))
+    else:
+        asyncio.run(run_in_process(args, mix, wa_ids))
+
+
+if __name__ == "__main__":
+    main()
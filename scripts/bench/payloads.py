@@ -0,0 +1,156 @@
+"""
+Builders for realistic WhatsApp Cloud API webhook bodies, used by the benchmarks.
+"""
+
+import time
+import uuid
+from typing import Any, Dict, List, Optional
+
+WHATSAPP_BUSINESS_ACCOUNT = "whatsapp_business_account"
+
+
+def _message_id() -> str:
+    return f"wamid.{uuid.uuid4().hex.upper()}"
+
+
+def text_message(wa_id: str, text: str, timestamp: Optional[int] = None) -> dict:
+    return {
+        "from": wa_id,
+        "id": _message_id(),
+        "timestamp": str(timestamp or int(time.time())),
+        "text": {"body": text},
+        "type": "text",
+    }
+
+
+def contact(wa_id: str, name: str) -> dict:
+    return {"profile": {"name": name}, "wa_id": wa_id}
+
+
+def messages_change(
+    messages: List[dict], contacts: List[dict], phone_number_id: str = "1234567890"
+) -> dict:
+    return {
+        "field": "messages",
+        "value": {
+            "messaging_product": "whatsapp",
+            "metadata": {
+                "display_phone_number": "15550000000",
+                "phone_number_id": phone_number_id,
+            },
+            "contacts": contacts,
+            "messages": messages,
+        },
+    }
+
+
+def webhook_body(changes_per_entry: List[List[dict]]) -> Dict[str, Any]:
+    return {
+        "object": WHATSAPP_BUSINESS_ACCOUNT,
+        "entry": [
+            {"id": f"{100000 + i}", "changes": changes}
+            for i, changes in enumerate(changes_per_entry)
+        ],
+    }
+
+
+def text_webhook(wa_id: str, text: str, name: str = "Teacher") -> Dict[str, Any]:
+    """A single text message from a single user, the most common request."""
+    return webhook_body(
+        [[messages_change([text_message(wa_id, text)], [contact(wa_id, name)])]]
+    )
+
+
+def multi_entry_webhook(
+    entries: int, messages_per_entry: int, text: str = "What is weathering?"
+) -> Dict[str, Any]:
+    """A batched delivery with several entries, each holding several messages."""
+    changes_per_entry = []
+    for e in range(entries):
+        messages, contacts = [], []
+        for m in range(messages_per_entry):
+            wa_id = f"2557{e:04d}{m:04d}"
+            messages.append(text_message(wa_id, f"{text} ({e}-{m})"))
+            contacts.append(contact(wa_id, f"Teacher {e}-{m}"))
+        changes_per_entry.append([messages_change(messages, contacts)])
+    return webhook_body(changes_per_entry)
+
+
+def button_reply_message(
+    wa_id: str, title: str, timestamp: Optional[int] = None
+) -> dict:
+    return {
+        "from": wa_id,
+        "id": _message_id(),
+        "timestamp": str(timestamp or int(time.time())),
+        "interactive": {
+            "type": "button_reply",
+            "button_reply": {"id": title.lower().replace(" ", "_"), "title": title},
+        },
+        "type": "interactive",
+    }
+
+
+def interactive_webhook(
+    wa_id: str, title: str, name: str = "Teacher"
+) -> Dict[str, Any]:
+    """A reply to one of our button or list messages."""
+    return webhook_body(
+        [
+            [
+                messages_change(
+                    [button_reply_message(wa_id, title)], [contact(wa_id, name)]
+                )
+            ]
+        ]
+    )
+
+
+def status_webhook(
+    wa_id: str, status: str = "delivered", phone_number_id: str = "1234567890"
+) -> Dict[str, Any]:
+    """A sent/delivered/read receipt for one of our outgoing messages."""
+    return webhook_body(
+        [
+            [
+                {
+                    "field": "messages",
+                    "value": {
+                        "messaging_product": "whatsapp",
+                        "metadata": {
+                            "display_phone_number": "15550000000",
+                            "phone_number_id": phone_number_id,
+                        },
+                        "statuses": [
+                            {
+                                "id": _message_id(),
+                                "status": status,
+                                "timestamp": str(int(time.time())),
+                                "recipient_id": wa_id,
+                            }
+                        ],
+                    },
+                }
+            ]
+        ]
+    )
+
+
+def flow_event_webhook(flow_id: str = "1234567890") -> Dict[str, Any]:
+    """A flow status or health event sent to the WhatsApp webhook."""
+    return webhook_body(
+        [
+            [
+                {
+                    "field": "flows",
+                    "value": {
+                        "event": "FLOW_STATUS_CHANGE",
+                        "message": f"Flow {flow_id} changed status",
+                        "flow_id": flow_id,
+                        "old_status": "DRAFT",
+                        "new_status": "PUBLISHED",
+                    },
+                }
+            ]
+        ]
+    )
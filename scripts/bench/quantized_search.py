@@ -0,0 +1,115 @@
+"""
+Benchmark of the vector storage modes: full vectors, halfvec and binary quantization.
+
+For each mode it reports the size of the HNSW index the mode searches, its
+build time (with --reindex, which locks the chunks table while it runs),
+and the QPS and recall@k of searches through db.search_chunks, compared
+with an exact search on the full vectors. The quantized modes re-rank
+VECTOR_RERANK_CANDIDATES candidates on the full vectors. The query vectors
+are embeddings of random chunks, so no embedding API is needed, but the
+database must hold some chunks (see scripts/database/seed.py).
+
+Only the modes whose index exists are measured, which is the configured
+VECTOR_STORAGE_MODE unless the indexes of other modes were built next to it
+for the comparison (see migration b71e5a3c9d24 for their definitions).
+
+Run with:
+    PYTHONPATH=. uv run python scripts/bench/quantized_search.py
+"""
+
+import argparse
+import asyncio
+import logging
+import time
+from typing import List
+
+from sqlalchemy import text
+
+import app.database.db as db
+from app.config import settings
+from app.database.engine import db_engine, get_session
+from scripts.bench.hnsw_search import exact_search, load_query_vectors
+from scripts.bench.stats import format_table
+
+INDEXES = {
+    "full": "chunk_embedding_idx",
+    "halfvec": "chunk_embedding_halfvec_idx",
+    "binary": "chunk_embedding_binary_idx",
+}
+
+
+async def index_size(name: str) -> int:
+    async with get_session() as session:
+        result = await session.execute(
+            text("SELECT pg_relation_size(to_regclass(:name))"), {"name": name}
+        )
+        return result.scalar() or 0
+
+
+async def build_time(name: str) -> float:
+    start = time.perf_counter()
+    async with db_engine.connect() as conn:
+        conn = await conn.execution_options(isolation_level="AUTOCOMMIT")
+        await conn.execute(text(f"REINDEX INDEX {name}"))
+    return time.perf_counter() - start
+
+
+async def main_async(args: argparse.Namespace) -> None:
+    query_vectors = await load_query_vectors(args.queries)
+    if not query_vectors:
+        raise SystemExit("The chunks table is empty, seed the database first")
+    where: dict = {}
+    truth = [await exact_search(vector, where, args.k) for vector in query_vectors]
+
+    rows = []
+    for mode, index in INDEXES.items():
+        if not await index_size(index):
+            print(f"Skipping {mode}, there is no {index}")
+            continue
+        settings.vector_storage_mode = mode  # type: ignore
+        seconds = f"{await build_time(index):.1f}" if args.reindex else "-"
+
+        for vector in query_vectors[:5]:  # warm up
+            await db.search_chunks(vector, [(where, args.k)])
+        recalls: List[float] = []
+        start = time.perf_counter()
+        for vector, expected in zip(query_vectors, truth):
+            hits = (await db.search_chunks(vector, [(where, args.k)]))[0]
+            recalls.append(
+                len({hit.id for hit in hits} & set(expected)) / len(expected)
+            )
+        elapsed = time.perf_counter() - start
+
+        rows.append(
+            [
+                mode,
+                f"{await index_size(index) / 1024 / 1024:.1f}",
+                seconds,
+                f"{len(query_vectors) / elapsed:.1f}",
+                f"{sum(recalls) / len(recalls):.3f}",
+            ]
+        )
+    await db_engine.dispose()
+
+    print(
+        f"{len(query_vectors)} queries, k={args.k}, "
+        f"{settings.vector_rerank_candidates} re-ranked candidates"
+    )
+    headers = ["mode", "index MiB", "build s", "QPS", f"recall@{args.k}"]
+    print(format_table(headers, rows))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("-k", type=int, default=10)
+    parser.add_argument(
+        "--reindex", action="store_true", help="Rebuild each index to time it"
+    )
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,124 @@
+"""
+The data of the retrieval benchmark: the chunks of a sample data file
+(chunks_BAAI.json or chunks_OPENAI.json), a fixed query set with precomputed
+query vectors, and the exact top-k of every query as ground truth.
+"""
+
+import json
+from dataclasses import dataclass
+from pathlib import Path
+from typing import List, Optional
+
+import numpy as np
+
+SAMPLE_DATA = Path(__file__).parents[2] / "assets" / "sample_data"
+CHUNK_TYPES = ("text", "exercise")
+
+
+@dataclass
+class Chunks:
+    contents: List[str]
+    chunk_types: List[str]
+    section_indexes: List[Optional[str]]
+    section_titles: List[Optional[str]]
+    embeddings: np.ndarray  # float32 (n, dimensions), normalized
+
+    def __len__(self) -> int:
+        return len(self.contents)
+
+
+@dataclass
+class Queries:
+    vectors: np.ndarray  # float32 (n, dimensions), normalized
+    chunk_types: List[str]  # The chunk type each query is filtered on
+    texts: List[str]  # The question, or "" for perturbed chunk embeddings
+
+    def __len__(self) -> int:
+        return len(self.chunk_types)
+
+
+def normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+def load_chunks(file: str) -> Chunks:
+    path = Path(file) if Path(file).exists() else SAMPLE_DATA / file
+    with open(path) as f:
+        items = json.load(f)
+    return Chunks(
+        contents=[item["chunk"] for item in items],
+        chunk_types=[item["metadata"]["chunk_type"] for item in items],
+        section_indexes=[item["metadata"]["chapter_number"] for item in items],
+        section_titles=[item["metadata"]["chapter"] for item in items],
+        embeddings=normalize(
+            np.array([item["embedding"] for item in items], dtype=np.float32)
+        ),
+    )
+
+
+def queries_path(chunks_file: str) -> Path:
+    return SAMPLE_DATA / f"queries_{Path(chunks_file).stem}.npz"
+
+
+def make_perturbed_queries(
+    chunks: Chunks, count: int, noise: float, seed: int = 0
+) -> Queries:
+    """
+    Queries near random chunks: the chunk embedding plus gaussian noise.
+    They need no embedding API, but real questions (see embed_questions) are
+    spread more like the traffic.
+    """
+    rng = np.random.default_rng(seed)
+    rows = rng.choice(len(chunks), size=min(count, len(chunks)), replace=False)
+    vectors = chunks.embeddings[rows] + rng.normal(
+        scale=noise / np.sqrt(chunks.embeddings.shape[1]),
+        size=(len(rows), chunks.embeddings.shape[1]),
+    ).astype(np.float32)
+    return Queries(
+        vectors=normalize(vectors.astype(np.float32)),
+        chunk_types=[CHUNK_TYPES[i % len(CHUNK_TYPES)] for i in range(len(rows))],
+        texts=[""] * len(rows),
+    )
+
+
+async def embed_questions(questions: List[str]) -> Queries:
+    """Embed real questions once (this calls the embedding API)."""
+    from app.services.embedding_service import embedding_client
+
+    vectors = await embedding_client.get_embeddings(questions)
+    return Queries(
+        vectors=normalize(np.array(vectors, dtype=np.float32)),
+        chunk_types=[CHUNK_TYPES[i % len(CHUNK_TYPES)] for i in range(len(questions))],
+        texts=questions,
+    )
+
+
+def save_queries(queries: Queries, path: Path) -> None:
+    np.savez(
+        path,
+        vectors=queries.vectors,
+        chunk_types=np.array(queries.chunk_types),
+        texts=np.array(queries.texts),
+    )
+
+
+def load_queries(path: Path) -> Queries:
+    with np.load(path) as data:
+        return Queries(
+            vectors=data["vectors"],
+            chunk_types=data["chunk_types"].tolist(),
+            texts=data["texts"].tolist(),
+        )
+
+
+def ground_truth(chunks: Chunks, queries: Queries, k: int) -> List[List[int]]:
+    """The exact top-k chunk rows of each query, among chunks of its chunk type."""
+    chunk_types = np.array(chunks.chunk_types)
+    truth = []
+    for vector, chunk_type in zip(queries.vectors, queries.chunk_types):
+        rows = np.flatnonzero(chunk_types == chunk_type)
+        similarities = chunks.embeddings[rows] @ vector
+        best = np.argsort(-similarities, kind="stable")[:k]
+        truth.append(rows[best].tolist())
+    return truth
@@ -0,0 +1,201 @@
+"""
+Retrieval benchmark: recall@k, latency and throughput of each vector search backend.
+
+Replays a fixed query set with precomputed query vectors (no API calls)
+through each backend. Recall is measured against the exact top-k computed
+with NumPy from the chunks file. Each query is filtered on a chunk type, as
+the tools do.
+
+Backends:
+    numpy    NumpyVectorIndex's search, built from the chunks file
+    full     db.search_chunks with VECTOR_STORAGE_MODE=full (HNSW in Postgres)
+    halfvec  db.search_chunks with the halfvec index and re-rank
+    binary   db.search_chunks with the binary index and re-rank
+
+The Postgres backends need the same chunks file seeded into the database
+(scripts/database/seed.py), and nothing else in the chunks table.
+
+Create the query set once (perturbed chunk embeddings, or real questions
+embedded with the configured embedding API, one per line in a text file):
+    PYTHONPATH=. uv run python -m scripts.bench.retrieval.run make-queries --chunks chunks_BAAI.json
+    PYTHONPATH=. uv run python -m scripts.bench.retrieval.run make-queries --chunks chunks_BAAI.json --questions questions.txt
+
+Run with:
+    PYTHONPATH=. uv run python -m scripts.bench.retrieval.run run --chunks chunks_BAAI.json --backends numpy,full
+"""
+
+import argparse
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, Dict, List, Set
+
+import numpy as np
+
+from scripts.bench.retrieval.dataset import (
+    Chunks,
+    Queries,
+    embed_questions,
+    ground_truth,
+    load_chunks,
+    load_queries,
+    make_perturbed_queries,
+    queries_path,
+    save_queries,
+)
+from scripts.bench.stats import format_table, summarize_latencies
+
+# Searches one query: (query vector, chunk type, k) -> the contents of the hits
+Search = Callable[[np.ndarray, str, int], Awaitable[List[str]]]
+
+
+def numpy_backend(chunks: Chunks) -> Search:
+    from app.services.vector_index_service import VectorSnapshot
+
+    snapshot = VectorSnapshot.build(
+        max_id=len(chunks),
+        embeddings=chunks.embeddings,
+        ids=np.arange(len(chunks), dtype=np.int64),
+        resource_ids=np.zeros(len(chunks), dtype=np.int64),
+        metadata=list(
+            zip(
+                chunks.chunk_types,
+                chunks.section_indexes,
+                chunks.section_titles,
+                chunks.contents,
+            )
+        ),
+    )
+
+    async def search(vector: np.ndarray, chunk_type: str, k: int) -> List[str]:
+        facets = [({"chunk_type": [chunk_type]}, k)]
+        hits = (await asyncio.to_thread(snapshot.search, vector, facets))[0]
+        return [hit.content for hit in hits]
+
+    return search
+
+
+def postgres_backend(mode: str) -> Search:
+    import app.database.db as db
+    from app.config import settings
+
+    async def search(vector: np.ndarray, chunk_type: str, k: int) -> List[str]:
+        settings.vector_storage_mode = mode  # type: ignore
+        facets = [({"chunk_type": [chunk_type]}, k)]
+        hits = (await db.search_chunks(vector.tolist(), facets))[0]
+        return [hit.content for hit in hits]
+
+    return search
+
+
+def create_backend(name: str, chunks: Chunks) -> Search:
+    if name == "numpy":
+        return numpy_backend(chunks)
+    if name in ("full", "halfvec", "binary"):
+        return postgres_backend(name)
+    raise ValueError(f"Unknown backend {name}")
+
+
+async def replay(
+    search: Search, queries: Queries, k: int, concurrency: int
+) -> Dict[str, object]:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+    results: List[List[str]] = [[] for _ in range(len(queries))]
+
+    async def run_query(i: int) -> None:
+        async with semaphore:
+            start = time.perf_counter()
+            results[i] = await search(queries.vectors[i], queries.chunk_types[i], k)
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(run_query(i) for i in range(len(queries))))
+    elapsed = time.perf_counter() - start
+    return {"latencies": latencies, "results": results, "qps": len(queries) / elapsed}
+
+
+def recall(results: List[List[str]], truth: List[Set[str]]) -> float:
+    recalls = [
+        len(set(found) & expected) / len(expected)
+        for found, expected in zip(results, truth)
+        if expected
+    ]
+    return sum(recalls) / len(recalls) if recalls else float("nan")
+
+
+async def run(args: argparse.Namespace) -> None:
+    chunks = load_chunks(args.chunks)
+    path = queries_path(args.chunks)
+    if not path.exists():
+        raise SystemExit(f"No query set at {path}, run make-queries first")
+    queries = load_queries(path)
+    truth = [
+        {chunks.contents[row] for row in rows}
+        for rows in ground_truth(chunks, queries, args.k)
+    ]
+
+    rows = []
+    for name in args.backends.split(","):
+        search = create_backend(name, chunks)
+        await replay(search, queries, args.k, 1)  # warm up
+        for concurrency in (int(c) for c in args.concurrency.split(",")):
+            result = await replay(search, queries, args.k, concurrency)
+            latency = summarize_latencies(result["latencies"])  # type: ignore
+            rows.append(
+                [
+                    name,
+                    str(concurrency),
+                    f"{recall(result['results'], truth):.3f}",  # type: ignore
+                    f"{latency['p50']:.2f}",
+                    f"{latency['p99']:.2f}",
+                    f"{result['qps']:.1f}",
+                ]
+            )
+
+    if any(name != "numpy" for name in args.backends.split(",")):
+        from app.database.engine import db_engine
+
+        await db_engine.dispose()
+
+    print(f"{len(queries)} queries over {len(chunks)} chunks, k={args.k}")
+    headers = ["backend", "concurrency", f"recall@{args.k}", "p50 ms", "p99 ms", "QPS"]
+    print(format_table(headers, rows))
+
+
+async def make_queries(args: argparse.Namespace) -> None:
+    chunks = load_chunks(args.chunks)
+    if args.questions:
+        with open(args.questions) as f:
+            questions = [line.strip() for line in f if line.strip()]
+        queries = await embed_questions(questions)
+    else:
+        queries = make_perturbed_queries(chunks, args.count, args.noise)
+    path = queries_path(args.chunks)
+    save_queries(queries, path)
+    print(f"Saved {len(queries)} queries to {path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="Run the benchmark")
+    run_parser.add_argument("--chunks", default="chunks_BAAI.json")
+    run_parser.add_argument("--backends", default="numpy")
+    run_parser.add_argument("--concurrency", default="1,4,16")
+    run_parser.add_argument("-k", type=int, default=10)
+
+    queries_parser = commands.add_parser("make-queries", help="Create the query set")
+    queries_parser.add_argument("--chunks", default="chunks_BAAI.json")
+    queries_parser.add_argument("--questions", help="Text file, one question a line")
+    queries_parser.add_argument("--count", type=int, default=200)
+    queries_parser.add_argument("--noise", type=float, default=0.5)
+
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+    asyncio.run(run(args) if args.command == "run" else make_queries(args))
+
+
+if __name__ == "__main__":
+    main()
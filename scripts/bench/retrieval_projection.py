@@ -0,0 +1,126 @@
+"""
+Benchmark of vector search result sizes and latency, full Chunk rows vs ChunkHit.
+
+"orm" reproduces the previous query: select(Chunk), which also sends the
+embedding of every hit and builds a full Chunk object for it. "projection" is
+the current query, which only selects the ChunkHit columns. The query vectors
+are embeddings of random chunks, so no embedding API is needed, but the
+database must hold some chunks (see scripts/database/seed.py).
+
+The bytes are measured on the server as the size of the text form of the
+result rows, which is close to what is sent for the vector column.
+
+Run with:
+    PYTHONPATH=. uv run python scripts/bench/retrieval_projection.py
+"""
+
+import argparse
+import asyncio
+import logging
+import time
+from typing import Any, Callable, Dict, List
+
+from sqlalchemy import func, literal_column, text
+from sqlmodel import select
+
+from app.database.db import CHUNK_HIT_COLUMNS
+from app.database.engine import db_engine, get_session
+from app.database.models import Chunk, ChunkHit
+from scripts.bench.stats import format_table, summarize_latencies
+
+
+def orm_search(query_vector: Any, n_results: int):
+    return (
+        select(Chunk)
+        .order_by(Chunk.embedding.cosine_distance(query_vector))
+        .limit(n_results)
+    )
+
+
+def projection_search(query_vector: Any, n_results: int):
+    distance = Chunk.embedding.cosine_distance(query_vector)
+    return (
+        select(*CHUNK_HIT_COLUMNS, distance.label("distance"))
+        .order_by(distance)
+        .limit(n_results)
+    )
+
+
+SEARCHES: Dict[str, Callable] = {"orm": orm_search, "projection": projection_search}
+
+
+async def load_query_vectors(count: int) -> List[Any]:
+    async with get_session() as session:
+        result = await session.execute(
+            select(Chunk.embedding).order_by(func.random()).limit(count)
+        )
+        return [row[0] for row in result.all()]
+
+
+async def result_bytes(statement) -> int:
+    rows = statement.subquery("t")
+    async with get_session() as session:
+        result = await session.execute(
+            select(func.sum(func.octet_length(literal_column("t::text")))).select_from(
+                rows
+            )
+        )
+        return int(result.scalar_one() or 0)
+
+
+async def run(name: str, query_vectors: List[Any], n_results: int) -> List[str]:
+    search = SEARCHES[name]
+    latencies: List[float] = []
+    for query_vector in query_vectors:
+        start = time.perf_counter()
+        async with get_session() as session:
+            result = await session.execute(search(query_vector, n_results))
+            if name == "orm":
+                hits = list(result.scalars().all())
+            else:
+                hits = [ChunkHit(*row) for row in result.all()]
+        latencies.append((time.perf_counter() - start) * 1000)
+        assert len(hits) <= n_results
+
+    total_bytes = 0
+    for query_vector in query_vectors:
+        total_bytes += await result_bytes(search(query_vector, n_results))
+
+    latency = summarize_latencies(latencies)
+    return [
+        name,
+        f"{total_bytes / len(query_vectors) / 1024:.1f}",
+        f"{latency['p50']:.2f}",
+        f"{latency['p95']:.2f}",
+        f"{latency['p99']:.2f}",
+    ]
+
+
+async def main_async(args: argparse.Namespace) -> None:
+    async with get_session() as session:
+        count = (await session.execute(text("SELECT count(*) FROM chunks"))).scalar()
+    if not count:
+        raise SystemExit("The chunks table is empty, seed the database first")
+
+    query_vectors = await load_query_vectors(args.queries)
+    rows = []
+    for name in SEARCHES:
+        await run(name, query_vectors[:5], args.k)  # warm up
+        rows.append(await run(name, query_vectors, args.k))
+    await db_engine.dispose()
+
+    print(f"{len(query_vectors)} searches over {count} chunks, k={args.k}")
+    print(format_table(["select", "KiB/search", "p50 ms", "p95 ms", "p99 ms"], rows))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("-k", type=int, default=10)
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
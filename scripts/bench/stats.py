@@ -0,0 +1,33 @@
+"""
+Small helpers shared by the benchmarks for summarizing and printing results.
+"""
+
+import math
+from typing import Dict, List, Sequence
+
+
+def percentile(values: Sequence[float], pct: float) -> float:
+    """Nearest-rank percentile of the values (pct between 0 and 100)."""
+    if not values:
+        return float("nan")
+    ordered = sorted(values)
+    rank = max(1, math.ceil(pct / 100 * len(ordered)))
+    return ordered[rank - 1]
+
+
+def summarize_latencies(latencies_ms: Sequence[float]) -> Dict[str, float]:
+    return {
+        "p50": percentile(latencies_ms, 50),
+        "p95": percentile(latencies_ms, 95),
+        "p99": percentile(latencies_ms, 99),
+        "max": max(latencies_ms) if latencies_ms else float("nan"),
+    }
+
+
+def format_table(headers: List[str], rows: List[List[str]]) -> str:
+    widths = [max(len(str(cell)) for cell in column) for column in zip(headers, *rows)]
+    lines = [
+        "  ".join(str(cell).rjust(width) for cell, width in zip(row, widths))
+        for row in [headers, ["-" * w for w in widths], *rows]
+    ]
+    return "\n".join(lines)
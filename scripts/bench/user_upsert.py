@@ -0,0 +1,188 @@
+"""
+Benchmark of db.get_or_create_user, which runs on every inbound message.
+
+"legacy" reproduces the previous implementation: SELECT ... FOR UPDATE with
+three chained selectinloads, then a session.refresh of the user, all holding
+the row lock until commit. "upsert" is the current implementation: one
+INSERT ... ON CONFLICT DO UPDATE, which only writes to fill in a missing
+name, and one joined fetch of the user and their classes. The queries sent per call are counted with a SQLAlchemy
+before_cursor_execute listener.
+
+Each round sends --messages messages from --users existing users (each is
+assigned a class, so the class loading is measured), --concurrency at a
+time. Concurrent messages of the same user wait on each other's row lock
+with "legacy". The benchmark users are deleted at the end. Needs a database
+with at least one class (see scripts/database/seed.py --sample-data).
+
+Run with:
+    PYTHONPATH=. uv run python scripts/bench/user_upsert.py
+"""
+
+import argparse
+import asyncio
+import logging
+import time
+from typing import Awaitable, Callable, List, Optional
+
+from sqlalchemy import event
+from sqlalchemy.orm import selectinload
+from sqlmodel import delete, select
+
+import app.database.db as db
+import app.database.enums as enums
+from app.database.engine import db_engine, get_session
+from app.database.models import Class, TeacherClass, User
+from scripts.bench.stats import format_table, summarize_latencies
+
+WA_ID_PREFIX = "bench-"
+
+
+async def legacy_get_or_create_user(wa_id: str, name: Optional[str] = None) -> User:
+    async with get_session() as session:
+        statement = (
+            select(User)
+            .where(User.wa_id == wa_id)
+            .options(
+                selectinload(User.taught_classes)  # type: ignore
+                .selectinload(TeacherClass.class_)  # type: ignore
+                .selectinload(Class.subject_)  # type: ignore
+            )
+            .with_for_update()
+        )
+        result = await session.execute(statement)
+        user = result.scalar_one_or_none()
+        if user:
+            await session.refresh(user)
+            return user
+        new_user = User(
+            name=name,
+            wa_id=wa_id,
+            state=enums.UserState.new,
+            role=enums.Role.teacher,
+        )
+        session.add(new_user)
+        await session.flush()
+        await session.commit()
+        await session.refresh(new_user)
+        return new_user
+
+
+IMPLEMENTATIONS = {
+    "legacy": legacy_get_or_create_user,
+    "upsert": db.get_or_create_user,
+}
+
+
+class QueryCounter:
+    def __init__(self):
+        self.count = 0
+        event.listen(db_engine.sync_engine, "before_cursor_execute", self._count)
+
+    def _count(self, *args) -> None:
+        self.count += 1
+
+
+async def setup_users(count: int) -> List[str]:
+    wa_ids = [f"{WA_ID_PREFIX}{i}" for i in range(count)]
+    async with get_session() as session:
+        class_id = (await session.execute(select(Class.id).limit(1))).scalar()
+    if class_id is None:
+        raise SystemExit("The classes table is empty, seed the sample data first")
+    for wa_id in wa_ids:
+        user = await db.get_or_create_user(wa_id, name="Bench")
+        await db.assign_teacher_to_classes(user, [class_id])
+    return wa_ids
+
+
+async def cleanup_users() -> None:
+    async with get_session() as session:
+        await session.execute(
+            delete(User).where(User.wa_id.startswith(WA_ID_PREFIX))  # type: ignore
+        )
+
+
+async def replay(
+    get_or_create_user: Callable[..., Awaitable[User]],
+    wa_ids: List[str],
+    messages: int,
+    concurrency: int,
+) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies: List[float] = []
+
+    async def message(i: int) -> None:
+        async with semaphore:
+            start = time.perf_counter()
+            await get_or_create_user(wa_ids[i % len(wa_ids)], name="Bench")
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(message(i) for i in range(messages)))
+    return {
+        "latencies": latencies,
+        "throughput": messages / (time.perf_counter() - start),
+    }
+
+
+async def main_async(args: argparse.Namespace) -> None:
+    counter = QueryCounter()
+    await cleanup_users()
+    try:
+        wa_ids = await setup_users(args.users)
+
+        rows = []
+        for name, get_or_create_user in IMPLEMENTATIONS.items():
+            # New user, then existing user with a class
+            before = counter.count
+            await get_or_create_user(f"{WA_ID_PREFIX}new-{name}", name="Bench")
+            new_queries = counter.count - before
+            before = counter.count
+            await get_or_create_user(wa_ids[0], name="Bench")
+            existing_queries = counter.count - before
+
+            await replay(get_or_create_user, wa_ids, len(wa_ids), 1)  # warm up
+            for concurrency in (int(c) for c in args.concurrency.split(",")):
+                result = await replay(
+                    get_or_create_user, wa_ids, args.messages, concurrency
+                )
+                latency = summarize_latencies(result["latencies"])
+                rows.append(
+                    [
+                        name,
+                        str(new_queries),
+                        str(existing_queries),
+                        str(concurrency),
+                        f"{latency['p50']:.2f}",
+                        f"{latency['p99']:.2f}",
+                        f"{result['throughput']:.0f}",
+                    ]
+                )
+    finally:
+        await cleanup_users()
+        await db_engine.dispose()
+
+    print(f"{args.messages} messages from {args.users} users")
+    headers = [
+        "version",
+        "queries (new)",
+        "queries (existing)",
+        "concurrency",
+        "p50 ms",
+        "p99 ms",
+        "msg/s",
+    ]
+    print(format_table(headers, rows))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--users", type=int, default=50)
+    parser.add_argument("--messages", type=int, default=1000)
+    parser.add_argument("--concurrency", default="1,16")
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
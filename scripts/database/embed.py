@@ -0,0 +1,230 @@
+"""
+Embed raw textbook chunks offline, producing a chunks file for seed.py.
+
+Streams the raw chunk records of a JSON array file ({"chunk": ..., "metadata":
+{...}}, as in chunks_BAAI.json but without "embedding") and embeds them in
+provider-sized batches, with bounded concurrency and retries. Embeddings are
+kept in a cache per embedding model: a memory-mapped float32 .npy matrix plus
+an append-only list of the content hashes of its rows. Chunks that are
+already in the cache are never embedded again, so a rerun after a crash or
+after switching back to a model only pays for the new chunks.
+
+The stub backend gives deterministic fake vectors, for testing offline.
+
+Run with:
+    uv run python -m scripts.database.embed raw_chunks.json chunks_BAAI.json
+    uv run python -m scripts.database.embed raw_chunks.json chunks_TEST.json --backend stub
+"""
+
+import argparse
+import asyncio
+import json
+import logging
+import os
+import re
+import time
+from itertools import islice
+from pathlib import Path
+from typing import Any, Dict, Iterator, List
+
+import numpy as np
+
+from app.config import llm_settings
+from app.database.utils import compute_content_hash
+from app.services.embedding_service import (
+    EmbeddingBackend,
+    StubEmbeddingBackend,
+    create_embedding_backend,
+)
+from scripts.database.seed import iter_json_array
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+DEFAULT_CACHE_DIR = Path(__file__).parent.parent / "assets" / "embedding_cache"
+
+
+class EmbeddingCache:
+    """
+    Embeddings of one model, by content hash. Row i of vectors.npy holds the
+    embedding of the i-th hash in hashes.txt. A hash is only appended after
+    its row is flushed, so the cache stays consistent if the process dies.
+    """
+
+    def __init__(self, path: Path, dimensions: int, initial_capacity: int = 1024):
+        self.path = path
+        self.dimensions = dimensions
+        path.mkdir(parents=True, exist_ok=True)
+        self._vectors_path = path / "vectors.npy"
+        self._hashes_path = path / "hashes.txt"
+
+        self.rows: Dict[str, int] = {}
+        if self._hashes_path.exists():
+            with open(self._hashes_path) as f:
+                for line in f:
+                    if line.strip():
+                        self.rows[line.strip()] = len(self.rows)
+
+        if self._vectors_path.exists():
+            self._vectors = np.load(self._vectors_path, mmap_mode="r+")
+            if self._vectors.shape[1] != dimensions:
+                raise ValueError(
+                    f"The cache in {path} holds {self._vectors.shape[1]} dimensional "
+                    f"vectors, not {dimensions}"
+                )
+        else:
+            self._vectors = np.lib.format.open_memmap(
+                self._vectors_path,
+                mode="w+",
+                dtype=np.float32,
+                shape=(initial_capacity, dimensions),
+            )
+
+    def __contains__(self, content_hash: str) -> bool:
+        return content_hash in self.rows
+
+    def __len__(self) -> int:
+        return len(self.rows)
+
+    def get(self, content_hash: str) -> np.ndarray:
+        return self._vectors[self.rows[content_hash]]
+
+    def add(self, content_hashes: List[str], vectors: np.ndarray) -> None:
+        start = len(self.rows)
+        self._reserve(start + len(content_hashes))
+        self._vectors[start : start + len(content_hashes)] = vectors
+        self._vectors.flush()
+        with open(self._hashes_path, "a") as f:
+            f.writelines(f"{content_hash}\n" for content_hash in content_hashes)
+            f.flush()
+            os.fsync(f.fileno())
+        for i, content_hash in enumerate(content_hashes):
+            self.rows[content_hash] = start + i
+
+    def _reserve(self, size: int) -> None:
+        capacity = self._vectors.shape[0]
+        if size <= capacity:
+            return
+        capacity = max(size, capacity * 2)
+        tmp_path = self.path / "vectors.npy.tmp"
+        grown = np.lib.format.open_memmap(
+            tmp_path, mode="w+", dtype=np.float32, shape=(capacity, self.dimensions)
+        )
+        grown[: len(self.rows)] = self._vectors[: len(self.rows)]
+        grown.flush()
+        del grown
+        self._vectors = None  # type: ignore  # Close the old map before replacing
+        os.replace(tmp_path, self._vectors_path)
+        self._vectors = np.load(self._vectors_path, mmap_mode="r+")
+
+
+def batched(iterator: Iterator, size: int) -> Iterator[list]:
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+async def embed_with_retry(
+    backend: EmbeddingBackend, texts: List[str], max_tries: int
+) -> np.ndarray:
+    for attempt in range(1, max_tries + 1):
+        try:
+            return np.asarray(await backend.embed(texts), dtype=np.float32)
+        except Exception as e:
+            if attempt == max_tries:
+                raise
+            delay = min(2**attempt, 30)
+            logger.warning(
+                f"Embedding a batch of {len(texts)} failed ({str(e)}), "
+                f"retrying in {delay}s"
+            )
+            await asyncio.sleep(delay)
+    raise AssertionError("unreachable")
+
+
+async def embed_missing(
+    backend: EmbeddingBackend,
+    cache: EmbeddingCache,
+    items: List[Dict[str, Any]],
+    batch_size: int,
+    semaphore: asyncio.Semaphore,
+    max_tries: int,
+) -> int:
+    """Embed the chunks of items that aren't cached yet. Returns how many."""
+    missing: Dict[str, str] = {}
+    for item in items:
+        content_hash = compute_content_hash(item["chunk"])
+        if content_hash not in cache:
+            missing.setdefault(content_hash, item["chunk"])
+
+    async def embed_batch(batch: List[str]) -> None:
+        async with semaphore:
+            vectors = await embed_with_retry(
+                backend, [missing[h] for h in batch], max_tries
+            )
+        cache.add(batch, vectors)
+
+    await asyncio.gather(
+        *(embed_batch(batch) for batch in batched(iter(missing), batch_size))
+    )
+    return len(missing)
+
+
+async def run(args: argparse.Namespace) -> None:
+    if args.backend == "stub":
+        backend: EmbeddingBackend = StubEmbeddingBackend(dimensions=args.dimensions)
+        model = f"stub-{args.dimensions}"
+    else:
+        backend = create_embedding_backend()
+        model = llm_settings.embedding_model
+    cache_path = Path(args.cache_dir) / re.sub(r"[^A-Za-z0-9._-]", "_", model)
+    cache = EmbeddingCache(cache_path, args.dimensions)
+    logger.info(f"Embedding with {model}, {len(cache)} embeddings cached")
+
+    semaphore = asyncio.Semaphore(args.concurrency)
+    total = embedded = 0
+    start = time.perf_counter()
+    # Each window is embedded (in parallel batches) and written out in order
+    window_size = args.batch_size * args.concurrency
+    with open(args.output, "w") as out:
+        out.write("[")
+        for window in batched(iter_json_array(Path(args.input)), window_size):
+            embedded += await embed_missing(
+                backend, cache, window, args.batch_size, semaphore, args.max_tries
+            )
+            for item in window:
+                item = {k: v for k, v in item.items() if k != "embedding"}
+                item["embedding"] = cache.get(
+                    compute_content_hash(item["chunk"])
+                ).tolist()
+                out.write(",\n" if total else "\n")
+                out.write(json.dumps(item))
+                total += 1
+            logger.info(f"{total} chunks written, {embedded} embedded")
+        out.write("\n]\n")
+
+    logger.info(
+        f"Done in {time.perf_counter() - start:.1f}s: {total} chunks, "
+        f"{embedded} embedded, {total - embedded} from the cache"
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("input", help="JSON array of raw chunks")
+    parser.add_argument("output", help="Chunks file with embeddings, for seed.py")
+    parser.add_argument("--backend", choices=["api", "stub"], default="api")
+    parser.add_argument(
+        "--dimensions",
+        type=int,
+        default=llm_settings.embedding_stub_dimensions,
+        help="Embedding dimensions (1024 for bge-large, 1536 for text-embedding-3-small)",
+    )
+    parser.add_argument("--batch-size", type=int, default=64, help="Texts per request")
+    parser.add_argument("--concurrency", type=int, default=4, help="Requests in flight")
+    parser.add_argument("--max-tries", type=int, default=5)
+    parser.add_argument("--cache-dir", default=str(DEFAULT_CACHE_DIR))
+    asyncio.run(run(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
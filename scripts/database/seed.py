@@ -1,11 +1,15 @@
 from sqlalchemy.ext.asyncio import create_async_engine, AsyncSession
 import json
+import time
+from itertools import islice
 from pathlib import Path
 from sqlmodel import text
 from sqlmodel import SQLModel, select
 import logging
-from typing import List, Dict, Any
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set
+import numpy as np
 import yaml
+from pgvector.asyncpg import register_vector
 import argparse
 import asyncio
 import sys
@@ -13,7 +17,7 @@ import sys
 # Import all your models
 import app.database.models as models
 from app.database.enums import ChunkType
-from app.database.utils import get_database_url
+from app.database.utils import compute_content_hash, get_database_url
 
 
 # Set up logging
@@ -130,43 +134,214 @@ async def inject_sample_data():
         await engine.dispose()
 
 
-async def process_chunks(
-    session: AsyncSession,
-    json_data: List[Dict[str, Any]],
+CHUNK_COLUMNS = (
+    "resource_id",
+    "content",
+    "content_hash",
+    "chunk_type",
+    "top_level_section_index",
+    "top_level_section_title",
+    "embedding",
+)
+
+
+def iter_json_array(path: Path, read_size: int = 1 << 20) -> Iterator[Any]:
+    """
+    Parse the items of a JSON array file one at a time, so only one read
+    buffer and one item are in memory (the chunks files are hundreds of MB).
+    """
+    decoder = json.JSONDecoder()
+    with open(path, "r") as f:
+        buffer, pos, eof, started = "", 0, False, False
+
+        def read_more():
+            nonlocal buffer, pos, eof
+            data = f.read(read_size)
+            buffer, pos, eof = buffer[pos:] + data, 0, not data
+
+        while True:
+            # Skip whitespace and the commas between items
+            while pos < len(buffer) and buffer[pos] in " \t\r\n,":
+                pos += 1
+            if pos == len(buffer):
+                if eof:
+                    raise ValueError(f"Unexpected end of the JSON array in {path}")
+                read_more()
+                continue
+
+            if not started:
+                if buffer[pos] != "[":
+                    raise ValueError(f"{path} does not contain a JSON array")
+                started = True
+                pos += 1
+            elif buffer[pos] == "]":
+                return
+            else:
+                try:
+                    item, pos = decoder.raw_decode(buffer, pos)
+                except json.JSONDecodeError:
+                    if eof:
+                        raise
+                    read_more()  # The item continues past the buffer
+                    continue
+                yield item
+
+
+def chunk_records(
+    items: Iterable[Dict[str, Any]],
     resource_id: int,
-    batch_size: int = 30,
-):
-    """Process pre-enhanced chunks to create Chunk models"""
-    try:
-        total_chunks = len(json_data)
-        for start_idx in range(0, total_chunks, batch_size):
-            end_idx = min(start_idx + batch_size, total_chunks)
-            batch_items = json_data[start_idx:end_idx]
-
-            for item in batch_items:
-                metadata = item["metadata"]
-                chunk = models.Chunk(
-                    resource_id=resource_id,
-                    content=item["chunk"],
-                    chunk_type=ChunkType(metadata["chunk_type"]),
-                    top_level_section_index=metadata["chapter_number"],
-                    top_level_section_title=metadata["chapter"],
-                    embedding=item["embedding"],
-                )
-                session.add(chunk)
+    skip_hashes: Set[str],
+    skip_items: Set[int],
+) -> Iterator[tuple]:
+    """
+    Rows for CHUNK_COLUMNS, with the embeddings as float32 arrays (sent in
+    binary). Chunks whose content hash is in skip_hashes (already loaded) and
+    items whose position is in skip_items (near-duplicates) are left out.
+    """
+    for i, item in enumerate(items):
+        content_hash = compute_content_hash(item["chunk"])
+        if content_hash in skip_hashes or i in skip_items:
+            continue
+        skip_hashes.add(content_hash)  # Exact duplicates within the file
+        metadata = item["metadata"]
+        yield (
+            resource_id,
+            item["chunk"],
+            content_hash,
+            ChunkType(metadata["chunk_type"]).value,
+            metadata["chapter_number"],
+            metadata["chapter"],
+            np.asarray(item["embedding"], dtype=np.float32),
+        )
 
-            await session.commit()
-            logger.info(
-                f"Processed and saved chunks {start_idx + 1} to {end_idx} of {total_chunks}"
-            )
 
-    except Exception as e:
-        logger.error(f"Error processing chunks: {str(e)}")
-        raise
+def batched(iterable: Iterable, size: int) -> Iterator[list]:
+    iterator = iter(iterable)
+    while batch := list(islice(iterator, size)):
+        yield batch
 
 
-async def inject_vector_data(file: str):
-    """Inject vector data into the database with existence checking and continuation."""
+async def drop_hnsw_indexes(conn) -> List[str]:
+    """Drop the HNSW indexes on chunks and return their definitions."""
+    rows = await conn.fetch(
+        """
+        SELECT indexname, indexdef FROM pg_indexes
+        WHERE tablename = 'chunks' AND indexdef ILIKE '%USING hnsw%'
+        """
+    )
+    for row in rows:
+        logger.info(f"Dropping index {row['indexname']}: {row['indexdef']}")
+        await conn.execute(f'DROP INDEX IF EXISTS "{row["indexname"]}"')
+    return [row["indexdef"] for row in rows]
+
+
+async def rebuild_indexes(conn, definitions: List[str], workers: int, memory: str):
+    """Build indexes with parallel maintenance workers (a single pass per index)."""
+    await conn.execute(f"SET maintenance_work_mem = '{memory}'")
+    await conn.execute(f"SET max_parallel_maintenance_workers = {int(workers)}")
+    for definition in definitions:
+        start = time.perf_counter()
+        await conn.execute(definition)
+        logger.info(f"Built index in {time.perf_counter() - start:.1f}s: {definition}")
+
+
+def near_duplicate_items(
+    path: Path, threshold: float, block_size: int = 1024
+) -> Set[int]:
+    """
+    Find the items of a chunks file that are near-duplicates (cosine similarity
+    >= threshold) of an earlier kept item of the same chunk type, e.g. the
+    same boilerplate repeated in every chapter. Reads the file once more to
+    collect the embeddings; the similarities are computed in blocks.
+    """
+    embeddings, chunk_types = [], []
+    for item in iter_json_array(path):
+        embeddings.append(np.asarray(item["embedding"], dtype=np.float32))
+        chunk_types.append(item["metadata"]["chunk_type"])
+    if not embeddings:
+        return set()
+    matrix = np.stack(embeddings)
+    matrix /= np.maximum(np.linalg.norm(matrix, axis=1, keepdims=True), 1e-12)
+    del embeddings
+
+    duplicates: Set[int] = set()
+    types = np.array(chunk_types)
+    for chunk_type in np.unique(types):
+        rows = np.flatnonzero(types == chunk_type)
+        vectors = matrix[rows]
+        kept = np.zeros(len(rows), dtype=bool)
+        for start in range(0, len(rows), block_size):
+            block = vectors[start : start + block_size]
+            # Best similarity to the rows kept before this block, column block by block
+            best = np.full(len(block), -1.0, dtype=np.float32)
+            kept_before = np.flatnonzero(kept[:start])
+            for column_start in range(0, len(kept_before), block_size):
+                columns = kept_before[column_start : column_start + block_size]
+                best = np.maximum(best, (block @ vectors[columns].T).max(axis=1))
+            # Within the block the order matters, so resolve it row by row
+            inner = block @ block.T
+            for i in range(len(block)):
+                kept_in_block = np.flatnonzero(kept[start : start + i])
+                if best[i] >= threshold or (
+                    len(kept_in_block) and inner[i, kept_in_block].max() >= threshold
+                ):
+                    duplicates.add(int(rows[start + i]))
+                else:
+                    kept[start + i] = True
+
+    logger.info(
+        f"Found {len(duplicates)} near-duplicate chunks of {len(matrix)} "
+        f"(cosine similarity >= {threshold})"
+    )
+    return duplicates
+
+
+async def copy_chunks(conn, records: Iterable[tuple], batch_size: int) -> int:
+    """
+    Bulk-load chunk rows: each batch is COPYed (binary) into a temporary
+    staging table and moved into chunks with a single INSERT ... SELECT,
+    one transaction per batch. Rows whose content is already loaded for the
+    resource are skipped, so a crashed load can simply be run again.
+    """
+    columns = ", ".join(CHUNK_COLUMNS)
+    await conn.execute(
+        "CREATE TEMP TABLE IF NOT EXISTS chunks_staging "
+        f"AS SELECT {columns} FROM chunks WITH NO DATA"
+    )
+    total = 0
+    for batch in batched(records, batch_size):
+        async with conn.transaction():
+            await conn.copy_records_to_table(
+                "chunks_staging", records=batch, columns=CHUNK_COLUMNS
+            )
+            status = await conn.execute(
+                f"INSERT INTO chunks ({columns}) SELECT {columns} FROM chunks_staging "
+                "ON CONFLICT (resource_id, content_hash) DO NOTHING"
+            )
+            await conn.execute("TRUNCATE chunks_staging")
+        total += int(status.split()[-1])  # "INSERT 0 <rows>"
+        logger.info(f"Loaded {total} chunks")
+    return total
+
+
+async def inject_vector_data(
+    file: str,
+    batch_size: int = 1000,
+    rebuild_index: bool = False,
+    maintenance_workers: int = 4,
+    maintenance_work_mem: str = "1GB",
+    dedup_threshold: Optional[float] = None,
+):
+    """
+    Stream the chunks of a file into the database with COPY. Chunks already
+    in the database (same resource and content hash) are skipped, so reruns
+    only load what is new and an interrupted load can be resumed.
+
+    With rebuild_index, the HNSW indexes are dropped before the load and built
+    again afterwards, which is much faster than updating them for every row.
+    With dedup_threshold, near-duplicate chunks are left out (see
+    near_duplicate_items).
+    """
     try:
         engine = create_async_engine(get_database_url())
 
@@ -192,26 +367,55 @@ async def inject_vector_data(file: str):
             resource_id = resource.id
             assert resource_id
 
-        # Load enhanced chunks data
         chunks_path = (
             Path(__file__).parent.parent / "assets" / "sample_data" / f"{file}"
         )
-        with open(chunks_path, "r") as f:
-            chunks_data = json.load(f)
 
-        # Process remaining chunks
-        async with AsyncSession(engine) as session:
-            await process_chunks(
-                session=session,
-                json_data=chunks_data,
-                resource_id=resource_id,
-            )
+        async with engine.connect() as sa_conn:
+            raw_conn = await sa_conn.get_raw_connection()
+            conn = raw_conn.driver_connection
+            await register_vector(conn)
 
-            # Get final count
-            logger.info(
-                f"Vector data injection complete. Total chunks in database: {len(chunks_data)}"
+            loaded_hashes = {
+                row["content_hash"]
+                for row in await conn.fetch(
+                    "SELECT content_hash FROM chunks WHERE resource_id = $1",
+                    resource_id,
+                )
+            }
+            logger.info(f"{len(loaded_hashes)} chunks already loaded for the resource")
+            near_duplicates = (
+                near_duplicate_items(chunks_path, dedup_threshold)
+                if dedup_threshold
+                else set()
             )
 
+            index_definitions = await drop_hnsw_indexes(conn) if rebuild_index else []
+            try:
+                start = time.perf_counter()
+                total = await copy_chunks(
+                    conn,
+                    chunk_records(
+                        iter_json_array(chunks_path),
+                        resource_id,
+                        loaded_hashes,
+                        near_duplicates,
+                    ),
+                    batch_size,
+                )
+                logger.info(
+                    f"Vector data injection complete. Loaded {total} chunks "
+                    f"in {time.perf_counter() - start:.1f}s"
+                )
+            finally:
+                if index_definitions:
+                    await rebuild_indexes(
+                        conn,
+                        index_definitions,
+                        maintenance_workers,
+                        maintenance_work_mem,
+                    )
+
     except Exception as e:
         logger.error(f"Error injecting vector data: {str(e)}")
         raise
@@ -234,6 +438,25 @@ async def main():
         type=str,
         help="Vector database chunks file (chunks_OPENAI.json or chunks_BAAI.json)",
     )
+    parser.add_argument(
+        "--batch-size", type=int, default=1000, help="Chunks per COPY batch"
+    )
+    parser.add_argument(
+        "--rebuild-index",
+        action="store_true",
+        help="Drop the HNSW indexes before loading the chunks and rebuild them after",
+    )
+    parser.add_argument(
+        "--maintenance-workers",
+        type=int,
+        default=4,
+        help="Parallel maintenance workers for the index rebuild",
+    )
+    parser.add_argument(
+        "--dedup-threshold",
+        type=float,
+        help="Leave out chunks with a cosine similarity of at least this to an earlier chunk (e.g. 0.98)",
+    )
 
     # Parse arguments
     args = parser.parse_args()
@@ -251,7 +474,13 @@ async def main():
 
         if args.vector_data:
             logger.info("Starting vector data injection...")
-            await inject_vector_data(args.vector_data)
+            await inject_vector_data(
+                args.vector_data,
+                batch_size=args.batch_size,
+                rebuild_index=args.rebuild_index,
+                maintenance_workers=args.maintenance_workers,
+                dedup_threshold=args.dedup_threshold,
+            )
 
         logger.info("Database setup complete")
     except Exception as e: